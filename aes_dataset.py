@@ -3,13 +3,15 @@ import sys
 import time
 import os
 import argparse
+import hashlib
+import threading
 import psutil
 import GPUtil
 import pandas as pd
 import numpy as np
 from sklearn.metrics import cohen_kappa_score, confusion_matrix, classification_report
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from aes_system import DocumentProcessor, BM25Retriever, LlamaModelCpp, AnswerEvaluator, HybridRetriever, DenseRetriever
+from aes_system import DocumentProcessor, LlamaModelCpp, AnswerEvaluator, RetrieverRegistry, BatchingScheduler, CachedLLMBackend, KeyAnswerIndex, create_llm_backend, answer_dedup_key, dedup_summary, group_answer_tasks, STAGE_TIMING_KEYS, REFERENCE_PREFETCH_CHUNK
 import logging
 
 # ===========================
@@ -18,6 +20,22 @@ import logging
 PDF_PATH = "BUKU_IPA.pdf"
 MODEL_PATH = "models/Llama-3.2-8B-Instruct-Q8_0.gguf"
 LLAMA_RUN_PATH = "llama.cpp/build/bin/Release/llama-run.exe"
+LLAMA_SERVER_PATH = "llama.cpp/build/bin/Release/llama-server.exe"
+LLM_BACKEND = "llama-run"  # "llama-run", "llama-server", atau "llama-cpp-python"
+LLAMA_SERVER_PORT = 8089
+LLM_POOL_SIZE = 1  # >1 menjalankan beberapa proses llama-server (port LLAMA_SERVER_PORT + i)
+LLM_CORES_PER_WORKER = None  # None = core dibagi rata antar worker pool
+LLM_N_THREADS = None  # None = otomatis (khusus llama-cpp-python)
+LLM_N_BATCH = 512
+LLM_MAX_BATCH_SIZE = 1  # >1 mengaktifkan BatchingScheduler (jumlah slot paralel llama-server)
+LLM_MAX_BATCH_WAIT_MS = 20.0
+SMALL_MODEL_PATH = None  # Model GGUF kecil untuk cascade soal singkat (None = tanpa cascade)
+SMALL_MODEL_PORT = 8189
+CASCADE_MIN_CONFIDENCE = 0.8
+MULTI_ANSWER_SIZE = 1  # >1 menilai hingga N jawaban unik untuk pertanyaan yang sama dalam satu prompt
+DETERMINISTIC_SEED = 42  # Seed untuk --deterministic (greedy + seed tetap)
+REFERENCE_MODE = "question"  # "question" = referensi diambil sekali per pertanyaan; "answer" = per jawaban
+RESPONSE_CACHE_MAX_ENTRIES = 50000  # Batas entri cache respons LLM (eviction LRU)
 DATASET_PATH = "aes_dateset2.csv"
 
 MAX_TOKENS = 256
@@ -34,25 +52,142 @@ RESULTS_JSON_TEMPLATE = "results_{mode}_rag.json"
 RESULTS_CSV_TEMPLATE = "results_{mode}_rag.csv"
 SUMMARY_JSON_PATH = "results_retrieval_summary.json"
 DENSE_CACHE_DIR = os.path.join("cache", "dense_retriever")
+PREFIX_CACHE_DIR = os.path.abspath(os.path.join("cache", "prompt_prefix"))
+RESPONSE_CACHE_PATH = os.path.join("cache", "llm_responses.sqlite")
+CHECKPOINT_PATH = os.path.join("cache", "aes_dataset_checkpoint.jsonl")
 
-# 🔹 Evaluator dengan cache BM25
+# 🔹 Evaluator dengan referensi per pertanyaan
 class CachedEvaluator(AnswerEvaluator):
-    def __init__(self, llm, retriever):
-        super().__init__(llm, retriever)
-        self.cache = {}
+    def __init__(self, llm, retriever, reference_mode=REFERENCE_MODE, **evaluator_kwargs):
+        super().__init__(llm, retriever, reference_mode=reference_mode, **evaluator_kwargs)
 
     def evaluate_answer_cached(self, question, answer, question_type=None, top_k=3):
-        """Gunakan cache BM25 agar tidak menghitung ulang untuk soal yang sama."""
-        cache_key = (question, question_type)
-        if cache_key in self.cache:
-            top_docs = self.cache[cache_key]
-        else:
-            top_docs = self.retriever.retrieve(question, top_k)
-            self.cache[cache_key] = top_docs
+        """
+        Dengan reference_mode="question", retrieval hanya dijalankan sekali per soal; jawaban
+        berikutnya memakai kandidat referensi yang sama (diurutkan ulang per jawaban di memori).
+        """
         return self.evaluate_answer(question, answer, top_k=top_k, question_type=question_type)
 
-def get_safe_worker_count():
-    """Hitung jumlah thread aman berdasarkan VRAM dan RAM."""
+    def evaluate_answers_cached(self, question, answers, question_type=None, top_k=3, max_slots=1):
+        """Nilai beberapa jawaban untuk pertanyaan yang sama; satu jawaban tetap lewat evaluate_answer_cached."""
+        if len(answers) == 1:
+            return [self.evaluate_answer_cached(question, answers[0], question_type=question_type, top_k=top_k)]
+        return self.evaluate_answers(question, answers, top_k=top_k, question_type=question_type, max_slots=max_slots)
+
+class EvaluationCheckpoint:
+    """
+    Log checkpoint append-only (JSONL) untuk evaluasi dataset yang panjang.
+    Setiap baris yang selesai dinilai langsung ditulis dengan kunci
+    (mode, filter tipe soal, id baris, hash konfigurasi), sehingga run yang terputus
+    bisa dilanjutkan tanpa menilai ulang baris yang sudah selesai.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+
+        checkpoint_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line_number, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Baris terakhir bisa terpotong jika proses mati saat menulis
+                        logger.warning(f"Checkpoint {path}: baris {line_number} rusak, dilewati")
+                        continue
+                    key = self._key(entry["mode"], entry["question_type_filter"], entry["row_id"], entry["config_hash"])
+                    self.entries[key] = entry["result"]
+            logger.warning(f"Checkpoint dimuat dari {path}: {len(self.entries)} baris selesai")
+        self._file = open(path, "a", encoding="utf-8")
+        if self._file.tell() > 0:
+            # Mulai di baris baru agar entri berikutnya tidak menyambung ke baris yang terpotong
+            self._file.write("\n")
+
+    @staticmethod
+    def _key(mode_name, question_type_filter, row_id, config_hash):
+        return (mode_name, question_type_filter, str(row_id), config_hash)
+
+    def get(self, mode_name, question_type_filter, row_id, config_hash):
+        """Hasil tersimpan untuk baris ini, atau None jika belum selesai."""
+        return self.entries.get(self._key(mode_name, question_type_filter, row_id, config_hash))
+
+    def get_unchanged(self, mode_name, question_type_filter, row_id, config_hash, question, answer):
+        """
+        Seperti get(), tetapi None jika pertanyaan/jawaban tersimpan berbeda dengan isi baris sekarang
+        (id sama tetapi dataset berubah), sehingga baris tersebut dinilai ulang.
+        """
+        saved = self.get(mode_name, question_type_filter, row_id, config_hash)
+        if saved is None or saved.get("pertanyaan") != question or saved.get("jawaban") != answer:
+            return None
+        return saved
+
+    def record(self, mode_name, question_type_filter, row_id, config_hash, result):
+        """Tambahkan hasil satu baris ke log dan langsung flush ke disk."""
+        line = json.dumps({
+            "mode": mode_name,
+            "question_type_filter": question_type_filter,
+            "row_id": str(row_id),
+            "config_hash": config_hash,
+            "result": result
+        }, ensure_ascii=False)
+        with self._lock:
+            self.entries[self._key(mode_name, question_type_filter, row_id, config_hash)] = result
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def file_content_hash(path):
+    """Hash SHA-256 isi file, atau None jika path kosong/file tidak ada."""
+    if not path or not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def checkpoint_config_hash(args):
+    """
+    Hash konfigurasi yang memengaruhi skor; checkpoint dari konfigurasi lain tidak dipakai ulang.
+    Opsi yang hanya memengaruhi kecepatan (paralel, pool, batch) tidak ikut dihitung.
+    Isi file --key-answers ikut di-hash: kunci jawaban yang diedit di path yang sama mengubah skor.
+    """
+    payload = {
+        "model": MODEL_PATH,
+        "pdf": PDF_PATH,
+        "dataset": DATASET_PATH,
+        "ctx_size": CTX_SIZE,
+        "llm_backend": args.llm_backend,
+        "small_model": args.small_model,
+        "cascade_min_confidence": args.cascade_min_confidence if args.small_model else None,
+        "key_answers": args.key_answers,
+        "key_answers_content": file_content_hash(args.key_answers),
+        "multi_answer": args.multi_answer,
+        "reference_mode": args.reference_mode,
+        "deterministic": args.deterministic,
+        "seed": args.seed if args.deterministic else None,
+        "grammar": args.grammar
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def get_safe_worker_count(llm_slots=1):
+    """
+    Hitung jumlah thread aman berdasarkan VRAM dan RAM.
+    Dengan BatchingScheduler atau pool llama-server, thread evaluasi hanya menunggu hasil
+    sehingga batas sebenarnya adalah total slot paralel LLM (llm_slots = worker x slot).
+    """
     try:
         gpus = GPUtil.getGPUs()
         if gpus:
@@ -65,13 +200,11 @@ def get_safe_worker_count():
 
     total_ram = psutil.virtual_memory().available / (1024 ** 3)
 
-    # Estimasi jumlah worker aman
-    if free_vram >= SAFE_VRAM_THRESHOLD and total_ram >= SAFE_RAM_THRESHOLD:
-        return 1
-    elif free_vram >= 8:
-        return 1
-    else:
-        return 1
+    # Estimasi jumlah worker aman: slot LLM berbagi satu salinan model (di VRAM atau RAM),
+    # jadi cukup satu thread per slot selama salah satunya mencukupi
+    if free_vram >= 8 or total_ram >= SAFE_RAM_THRESHOLD:
+        return max(1, llm_slots)
+    return 1
 
 def _normalize_answer_field(value):
     if pd.isna(value):
@@ -79,78 +212,165 @@ def _normalize_answer_field(value):
     text = str(value).strip()
     return text if text else "null"
 
-def evaluate_dataset_with_retriever(mode_name, evaluator, df, max_workers, question_type_filter="all"):
-    """Jalankan evaluasi dataset untuk mode retrieval tertentu."""
+def build_key_answer_index(csv_path):
+    """
+    Bangun indeks kunci jawaban dari CSV jawaban singkat yang sudah dinilai guru
+    (format sama dengan DATASET_PATH). Skor 2 menjadi kunci, skor 0 dicatat sebagai jawaban salah.
+    """
+    df_keys = pd.read_csv(csv_path, encoding="latin1", sep=";")
+    df_keys["skor"] = pd.to_numeric(df_keys["skor"], errors="coerce")
+    df_keys = df_keys[df_keys["tipe_soal"].fillna("").astype(str).str.strip().str.lower() == "singkat"]
+    rows = [
+        {
+            "question": _normalize_answer_field(row["pertanyaan"]),
+            "answer": _normalize_answer_field(row["jawaban"]),
+            "score": None if pd.isna(row["skor"]) else int(row["skor"]),
+            "max_score": 2
+        }
+        for _, row in df_keys.iterrows()
+    ]
+    index = KeyAnswerIndex.from_rows(rows)
+    logger.warning(f"Indeks kunci jawaban dimuat dari {csv_path}: {len(index)} kunci")
+    return index
+
+def evaluate_dataset_with_retriever(mode_name, evaluator, df, max_workers, question_type_filter="all", multi_answer=1,
+                                    checkpoint=None, config_hash=None):
+    """
+    Jalankan evaluasi dataset untuk mode retrieval tertentu.
+    Baris dengan triple (pertanyaan, tipe soal, jawaban) yang sama hanya dievaluasi sekali,
+    lalu hasilnya dipakai untuk semua baris tersebut. Dengan multi_answer > 1, jawaban unik
+    untuk pertanyaan yang sama dinilai berkelompok dalam satu prompt.
+    Jika checkpoint diberikan, baris yang sudah selesai pada run sebelumnya (konfigurasi sama)
+    langsung diambil dari checkpoint dan setiap baris baru dicatat begitu selesai.
+    """
     results = []
     futures = {}
     start_time = time.time()
 
+    # Kelompokkan baris berdasarkan triple ternormalisasi
+    groups = {}
+    resumed = 0
+    for idx, row in df.iterrows():
+        question = _normalize_answer_field(row["pertanyaan"])
+        answer = _normalize_answer_field(row["jawaban"])
+        question_type = _normalize_answer_field(row.get("tipe_soal", "")).lower()
+        key = answer_dedup_key(question, question_type, answer)
+        members = groups.setdefault(key, [])
+        if checkpoint is not None:
+            saved = checkpoint.get_unchanged(mode_name, question_type_filter, _dataset_row_id(idx, row),
+                                             config_hash, question, answer)
+            if saved is not None:
+                results.append(saved)
+                resumed += 1
+                continue
+        members.append((idx, row, question_type, question, answer))
+    dedup = dedup_summary(len(df), len(groups))
+    logger.warning(
+        f"[{mode_name.upper()}] {dedup['total']} baris, {dedup['unique']} jawaban unik "
+        f"(rasio dedup {dedup['dedup_ratio'] * 100:.1f}%)"
+    )
+    if resumed:
+        logger.warning(f"[{mode_name.upper()}] {resumed} baris dilanjutkan dari checkpoint {checkpoint.path}")
+    pending_groups = {key: members for key, members in groups.items() if members}
+    task_groups = group_answer_tasks(pending_groups, multi_answer)
+
+    # Referensi semua kelompok diambil lewat retrieval batch sebelum pemanggilan LLM pertama
+    for start in range(0, len(task_groups), REFERENCE_PREFETCH_CHUNK):
+        evaluator.prefetch_references(
+            [(groups[keys[0]][0][3], [groups[key][0][4] for key in keys], groups[keys[0]][0][2])
+             for keys in task_groups[start:start + REFERENCE_PREFETCH_CHUNK]],
+            top_k=3,
+            max_slots=multi_answer
+        )
+
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        for idx, row in df.iterrows():
-            question = _normalize_answer_field(row["pertanyaan"])
-            answer = _normalize_answer_field(row["jawaban"])
-            question_type = _normalize_answer_field(row.get("tipe_soal", "")).lower()
+        for keys in task_groups:
+            _, _, question_type, question, _ = groups[keys[0]][0]
             future = executor.submit(
-                evaluator.evaluate_answer_cached,
+                evaluator.evaluate_answers_cached,
                 question,
-                answer,
+                [groups[key][0][4] for key in keys],
                 question_type=question_type,
-                top_k=3
+                top_k=3,
+                max_slots=multi_answer
             )
-            futures[future] = (idx, row, question_type, question, answer)
+            futures[future] = keys
 
-        total = len(futures)
-        for progress, future in enumerate(as_completed(futures), start=1):
-            idx, row, question_type, question_text, answer_text = futures[future]
+        total = len(df)
+        progress = resumed
+        for future in as_completed(futures):
+            keys = futures[future]
             try:
-                eval_result = future.result()
+                eval_results = future.result()
             except Exception as exc:
-                logger.error(f"Error saat mengevaluasi baris {idx}: {exc}")
+                logger.error(f"Error saat mengevaluasi baris {[idx for key in keys for idx, *_ in groups[key]]}: {exc}")
                 continue
 
-            raw_id = row.get("id")
-            if raw_id is None or (isinstance(raw_id, float) and pd.isna(raw_id)) or str(raw_id).strip() == "":
-                row_id = idx
-            else:
-                try:
-                    row_id = int(str(raw_id).strip())
-                except (TypeError, ValueError):
-                    row_id = idx
-            # Ambil nilai skor dari dataframe yang sudah dikonversi ke numerik
-            true_score = int(row["skor"])
-            # Log jika skor adalah 0 untuk debugging
-            if true_score == 0:
-                logger.info(f"Skor 0 terdeteksi untuk ID {row_id}, nama: {row['nama']}, pertanyaan: {question_text[:30]}...")
-
-            results.append({
-                "id": row_id,
-                "nama": _normalize_answer_field(row["nama"]),
-                "tipe_soal": _normalize_answer_field(row.get("tipe_soal", "")),
-                "pertanyaan": question_text,
-                "jawaban": answer_text,
-                "true_score": true_score,
-                "aes_score": eval_result["score"],
-                "max_score": eval_result.get("max_score"),
-                "question_type_model": eval_result.get("question_type"),
-                "evaluation": eval_result["evaluation"],
-                "retrieval_mode": mode_name,
-                "question_type_filter": question_type_filter
-            })
-
-            max_score = eval_result.get("max_score")
-            if max_score:
-                logger.warning(
-                    f"[{mode_name.upper()}][{question_type_filter.upper() if question_type_filter else 'ALL'}][{progress}/{total}] Skor AES: {eval_result['score']}/{max_score} | "
-                    f"Guru: {row['skor']} | True Score: {true_score}"
-                )
-            else:
-                logger.warning(
-                    f"[{mode_name.upper()}][{question_type_filter.upper() if question_type_filter else 'ALL'}][{progress}/{total}] Skor AES: {eval_result['score']} | "
-                    f"Guru: {row['skor']} | True Score: {true_score}"
-                )
+            for key, eval_result in zip(keys, eval_results):
+                for idx, row, question_type, question_text, answer_text in groups[key]:
+                    progress += 1
+                    record = _append_dataset_result(
+                        results, idx, row, question_text, answer_text, eval_result,
+                        mode_name, question_type_filter, progress, total
+                    )
+                    if checkpoint is not None:
+                        checkpoint.record(mode_name, question_type_filter, record["id"], config_hash, record)
 
     elapsed = time.time() - start_time
-    return results, elapsed
+    return results, elapsed, dedup
+
+def _dataset_row_id(idx, row):
+    """Id baris dataset dari kolom id, atau indeks dataframe jika kosong/tidak valid."""
+    raw_id = row.get("id")
+    if raw_id is None or (isinstance(raw_id, float) and pd.isna(raw_id)) or str(raw_id).strip() == "":
+        return idx
+    try:
+        return int(str(raw_id).strip())
+    except (TypeError, ValueError):
+        return idx
+
+def _append_dataset_result(results, idx, row, question_text, answer_text, eval_result,
+                           mode_name, question_type_filter, progress, total):
+    """Tambahkan hasil evaluasi satu baris dataset ke list hasil dan kembalikan entri tersebut."""
+    row_id = _dataset_row_id(idx, row)
+    # Ambil nilai skor dari dataframe yang sudah dikonversi ke numerik
+    true_score = int(row["skor"])
+    # Log jika skor adalah 0 untuk debugging
+    if true_score == 0:
+        logger.info(f"Skor 0 terdeteksi untuk ID {row_id}, nama: {row['nama']}, pertanyaan: {question_text[:30]}...")
+
+    record = {
+        "id": row_id,
+        "nama": _normalize_answer_field(row["nama"]),
+        "tipe_soal": _normalize_answer_field(row.get("tipe_soal", "")),
+        "pertanyaan": question_text,
+        "jawaban": answer_text,
+        "true_score": true_score,
+        "aes_score": eval_result["score"],
+        "max_score": eval_result.get("max_score"),
+        "question_type_model": eval_result.get("question_type"),
+        "evaluation": eval_result["evaluation"],
+        "retrieval_mode": mode_name,
+        "question_type_filter": question_type_filter,
+        "scoring_path": eval_result.get("scoring_path"),
+        "retrieval_tier": eval_result.get("retrieval_tier"),
+        "generation_config": eval_result.get("generation_config"),
+        "timings": eval_result.get("timings")
+    }
+    results.append(record)
+
+    max_score = eval_result.get("max_score")
+    if max_score:
+        logger.warning(
+            f"[{mode_name.upper()}][{question_type_filter.upper() if question_type_filter else 'ALL'}][{progress}/{total}] Skor AES: {eval_result['score']}/{max_score} | "
+            f"Guru: {row['skor']} | True Score: {true_score}"
+        )
+    else:
+        logger.warning(
+            f"[{mode_name.upper()}][{question_type_filter.upper() if question_type_filter else 'ALL'}][{progress}/{total}] Skor AES: {eval_result['score']} | "
+            f"Guru: {row['skor']} | True Score: {true_score}"
+        )
+    return record
 
 def compute_metrics(df_result):
     """Hitung metrik evaluasi utama dari dataframe hasil."""
@@ -177,6 +397,27 @@ def compute_metrics(df_result):
 
     return metrics
 
+def summarize_timings(results):
+    """
+    Ringkas blok timings hasil evaluasi menjadi p50/p95 per tahap.
+    Baris duplikat (hasil dedup) berbagi objek timings yang sama dan hanya dihitung sekali.
+    """
+    unique_timings = {id(item["timings"]): item["timings"] for item in results if item.get("timings")}
+    if not unique_timings:
+        return {}
+    df_timings = pd.DataFrame(list(unique_timings.values()))
+    summary = {"evaluations": int(len(df_timings))}
+    for key in STAGE_TIMING_KEYS:
+        if key not in df_timings:
+            continue
+        values = df_timings[key].astype(float).to_numpy()
+        summary[key] = {
+            "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)),
+            "total": float(values.sum())
+        }
+    return summary
+
 def save_mode_outputs(mode_name, results, df_result, metrics, type_suffix=""):
     """Simpan hasil evaluasi dan metrik untuk suatu mode ke file."""
     suffix = type_suffix or ""
@@ -200,8 +441,12 @@ def save_mode_outputs(mode_name, results, df_result, metrics, type_suffix=""):
     with open(json_path, "w", encoding="utf-8") as f:
         json.dump(payload, f, ensure_ascii=False, indent=2)
 
-    # Simpan CSV
+    # Simpan CSV; blok timings diratakan menjadi kolom timing_<tahap>
     df_to_save = df_result.copy()
+    if "timings" in df_to_save.columns:
+        df_timings = pd.json_normalize([t or {} for t in df_to_save["timings"]]).add_prefix("timing_")
+        df_timings.index = df_to_save.index
+        df_to_save = pd.concat([df_to_save.drop(columns=["timings"]), df_timings], axis=1)
     df_to_save.to_csv(csv_path, index=False, encoding="utf-8-sig")
 
     return json_path, csv_path
@@ -231,6 +476,115 @@ def main():
         default=0,
         help="Batasi jumlah data yang diproses (0 = semua data)"
     )
+    parser.add_argument(
+        "--llm-backend",
+        choices=["llama-run", "llama-server", "llama-cpp-python"],
+        default=LLM_BACKEND,
+        help="Backend LLM: llama-run (satu proses per jawaban), llama-server atau llama-cpp-python (model dimuat sekali)"
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=LLM_POOL_SIZE,
+        help="Jumlah proses llama-server dalam pool, masing-masing dipatok ke partisi core sendiri"
+    )
+    parser.add_argument(
+        "--cores-per-worker",
+        type=int,
+        default=LLM_CORES_PER_WORKER,
+        help="Jumlah core CPU per proses llama-server dalam pool (default: dibagi rata)"
+    )
+    parser.add_argument(
+        "--n-threads",
+        type=int,
+        default=LLM_N_THREADS,
+        help="Jumlah thread CPU untuk backend llama-cpp-python (default: otomatis)"
+    )
+    parser.add_argument(
+        "--n-batch",
+        type=int,
+        default=LLM_N_BATCH,
+        help="Ukuran batch prefill untuk backend llama-cpp-python"
+    )
+    parser.add_argument(
+        "--llm-batch-size",
+        type=int,
+        default=LLM_MAX_BATCH_SIZE,
+        help="Jumlah prompt maksimum per batch decoding (>1 mengaktifkan batching scheduler)"
+    )
+    parser.add_argument(
+        "--llm-batch-wait-ms",
+        type=float,
+        default=LLM_MAX_BATCH_WAIT_MS,
+        help="Waktu tunggu maksimum (ms) untuk mengumpulkan prompt ke satu batch"
+    )
+    parser.add_argument(
+        "--key-answers",
+        default=None,
+        help="CSV jawaban singkat yang sudah dinilai guru (format sama dengan dataset) untuk jalur cepat kunci jawaban; "
+             "gunakan data yang terpisah dari data evaluasi"
+    )
+    parser.add_argument(
+        "--small-model",
+        default=SMALL_MODEL_PATH,
+        help="Path model GGUF kecil untuk cascade: soal singkat dinilai model kecil dulu "
+             "(butuh --llm-backend llama-server atau llama-cpp-python)"
+    )
+    parser.add_argument(
+        "--cascade-min-confidence",
+        type=float,
+        default=CASCADE_MIN_CONFIDENCE,
+        help="Probabilitas minimum token skor model kecil agar hasilnya tidak dieskalasi ke model besar"
+    )
+    parser.add_argument(
+        "--multi-answer",
+        type=int,
+        default=MULTI_ANSWER_SIZE,
+        help="Nilai hingga N jawaban untuk pertanyaan yang sama dalam satu prompt (dibatasi jendela konteks)"
+    )
+    parser.add_argument(
+        "--deterministic",
+        action="store_true",
+        help="Mode penilaian deterministik: decoding greedy dan seed tetap sehingga hasil bisa dipakai ulang"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=DETERMINISTIC_SEED,
+        help="Seed untuk mode deterministik"
+    )
+    parser.add_argument(
+        "--no-response-cache",
+        action="store_true",
+        help="Nonaktifkan cache respons LLM (prompt identik antar mode/filter tidak diinferensi ulang)"
+    )
+    parser.add_argument(
+        "--grammar",
+        action="store_true",
+        help="Batasi output LLM dengan grammar GBNF (skor dari opsi yang diizinkan + kata kunci)"
+    )
+    parser.add_argument(
+        "--reference-mode",
+        choices=["answer", "question"],
+        default=REFERENCE_MODE,
+        help="question: referensi diambil sekali per soal lalu diurutkan ulang per jawaban; "
+             "answer: retrieval per jawaban (pertanyaan + jawaban siswa)"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=CHECKPOINT_PATH,
+        help="Log checkpoint JSONL; baris yang sudah selesai (mode, tipe, id, konfigurasi sama) dilewati saat run diulang"
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Nilai ulang semua baris walaupun sudah ada di checkpoint (hasil baru tetap dicatat)"
+    )
+    parser.add_argument(
+        "--no-checkpoint",
+        action="store_true",
+        help="Nonaktifkan checkpoint sepenuhnya"
+    )
     args = parser.parse_args()
 
     start_total = time.time()
@@ -276,35 +630,126 @@ def main():
     chunks = doc_processor.chunk_text(chunk_size=500, overlap=50)
     logger.warning(f"Dokumen dibagi menjadi {len(chunks)} chunk untuk retrieval")
 
-    # 2️⃣ Siapkan berbagai retriever
-    sparse_retriever = BM25Retriever(chunks)
+    # 2️⃣ Siapkan berbagai retriever; setiap jenis dibangun sekali saat pertama dipakai
+    retrievers = RetrieverRegistry(chunks, dense_cache_dir=DENSE_CACHE_DIR, hybrid_alpha=0.5)
     selected_modes = set(args.modes) if args.modes else None
 
     retriever_configs = [
-        ("sparse", "Sparse BM25", sparse_retriever),
-        ("dense", "Dense DPR", True),
-        ("hybrid", "Hybrid Sparse+Dense", True)
+        ("sparse", "Sparse BM25"),
+        ("dense", "Dense DPR"),
+        ("hybrid", "Hybrid Sparse+Dense")
     ]
 
     if selected_modes:
         retriever_configs = [cfg for cfg in retriever_configs if cfg[0] in selected_modes]
 
     # 3️⃣ Inisialisasi LLM
-    llm = LlamaModelCpp(
-    model_path=MODEL_PATH,
-        llama_path=LLAMA_RUN_PATH,
-    n_gpu_layers=999,
-        ctx_size=CTX_SIZE
-    )
+    seed = args.seed if args.deterministic else None
+    pool_size = max(1, args.pool_size) if args.llm_backend == "llama-server" else 1
+    if pool_size > 1:
+        llm = create_llm_backend(
+            "llama-server-pool",
+            model_path=MODEL_PATH,
+            n_workers=pool_size,
+            cores_per_worker=args.cores_per_worker,
+            base_port=LLAMA_SERVER_PORT,
+            server_path=LLAMA_SERVER_PATH,
+            n_gpu_layers=999,
+            ctx_size=CTX_SIZE,
+            n_parallel=max(1, args.llm_batch_size),
+            slot_save_path=PREFIX_CACHE_DIR,
+            seed=seed
+        )
+    elif args.llm_backend == "llama-server":
+        llm = create_llm_backend(
+            "llama-server",
+            model_path=MODEL_PATH,
+            server_path=LLAMA_SERVER_PATH,
+            n_gpu_layers=999,
+            ctx_size=CTX_SIZE,
+            port=LLAMA_SERVER_PORT,
+            n_parallel=max(1, args.llm_batch_size),
+            slot_save_path=PREFIX_CACHE_DIR,
+            seed=seed
+        )
+    elif args.llm_backend == "llama-cpp-python":
+        llm = create_llm_backend(
+            "llama-cpp-python",
+            model_path=MODEL_PATH,
+            n_gpu_layers=999,
+            ctx_size=CTX_SIZE,
+            n_threads=args.n_threads,
+            n_batch=args.n_batch,
+            prefix_cache_dir=PREFIX_CACHE_DIR,
+            seed=seed
+        )
+    else:
+        llm = LlamaModelCpp(
+            model_path=MODEL_PATH,
+            llama_path=LLAMA_RUN_PATH,
+            n_gpu_layers=999,
+            ctx_size=CTX_SIZE,
+            seed=seed
+        )
+
+    llm_slots = pool_size
+    if args.llm_batch_size > 1 and not llm.supports_concurrent_batch:
+        logger.warning(f"Backend {args.llm_backend} tidak menjalankan batch paralel; --llm-batch-size diabaikan")
+    elif args.llm_batch_size > 1:
+        llm_slots = pool_size * args.llm_batch_size
+        llm = BatchingScheduler(llm, max_batch_size=llm_slots, max_wait_ms=args.llm_batch_wait_ms)
+
+    if not args.no_response_cache:
+        llm = CachedLLMBackend(llm, RESPONSE_CACHE_PATH, max_entries=RESPONSE_CACHE_MAX_ENTRIES)
+
+    key_index = build_key_answer_index(args.key_answers) if args.key_answers else None
+
+    small_llm = None
+    if args.small_model:
+        if args.llm_backend == "llama-server":
+            small_llm = create_llm_backend(
+                "llama-server",
+                model_path=args.small_model,
+                server_path=LLAMA_SERVER_PATH,
+                n_gpu_layers=999,
+                ctx_size=CTX_SIZE,
+                port=SMALL_MODEL_PORT,
+                seed=seed
+            )
+        elif args.llm_backend == "llama-cpp-python":
+            small_llm = create_llm_backend(
+                "llama-cpp-python",
+                model_path=args.small_model,
+                n_gpu_layers=999,
+                ctx_size=CTX_SIZE,
+                n_threads=args.n_threads,
+                n_batch=args.n_batch,
+                seed=seed,
+                logits_all=True
+            )
+        else:
+            # llama-run tidak menyediakan probabilitas token sehingga keyakinan skor tidak bisa diukur
+            logger.warning("Cascade membutuhkan backend llama-server atau llama-cpp-python, --small-model diabaikan")
+        if small_llm is not None and not args.no_response_cache:
+            small_llm = CachedLLMBackend(small_llm, RESPONSE_CACHE_PATH, max_entries=RESPONSE_CACHE_MAX_ENTRIES)
+
+    checkpoint = None
+    config_hash = checkpoint_config_hash(args)
+    if not args.no_checkpoint:
+        checkpoint = EvaluationCheckpoint(args.checkpoint)
+        if args.no_resume:
+            checkpoint.entries.clear()
+        logger.warning(f"Checkpoint aktif: {args.checkpoint} (konfigurasi {config_hash})")
 
     # 4️⃣ Hitung jumlah thread aman
-    max_workers = get_safe_worker_count()
+    max_workers = get_safe_worker_count(llm_slots)
     if not args.parallel:
         max_workers = 1
     logger.warning(f"Menjalankan evaluasi dengan {max_workers} thread paralel")
 
     comparison_summary = []
     combined_results_df = []
+    all_results = []
 
     for type_name, df_subset in type_groups:
         display_type = "semua tipe" if type_name == "all" else type_name
@@ -312,25 +757,31 @@ def main():
             f"\n===== Memulai evaluasi untuk tipe soal: {display_type.upper()} (total {len(df_subset)} jawaban) ====="
         )
 
-        for mode_name, mode_desc, info in retriever_configs:
-            retriever = info if not isinstance(info, bool) else None
-            if info:
-                dense_retriever = DenseRetriever(chunks=chunks, cache_dir=DENSE_CACHE_DIR)
-                if mode_name == "dense":
-                    retriever = dense_retriever
-                elif mode_name == "hybrid":
-                    retriever = HybridRetriever(sparse_retriever, dense_retriever, alpha=0.5)
+        for mode_name, mode_desc in retriever_configs:
+            retriever = retrievers.get(mode_name)
             logger.warning(
                 f"\n===== Memulai evaluasi dengan mode retrieval: {mode_name.upper()} ({mode_desc}) "
                 f"untuk tipe {display_type.upper()} ====="
             )
-            evaluator = CachedEvaluator(llm, retriever)
-            mode_results, elapsed_seconds = evaluate_dataset_with_retriever(
+            evaluator = CachedEvaluator(
+                llm,
+                retriever,
+                use_grammar=args.grammar,
+                deterministic=args.deterministic,
+                small_llm=small_llm,
+                cascade_min_confidence=args.cascade_min_confidence,
+                key_index=key_index,
+                reference_mode=args.reference_mode
+            )
+            mode_results, elapsed_seconds, dedup = evaluate_dataset_with_retriever(
                 mode_name,
                 evaluator,
                 df_subset,
                 max_workers,
-                question_type_filter=type_name
+                question_type_filter=type_name,
+                multi_answer=args.multi_answer,
+                checkpoint=checkpoint,
+                config_hash=config_hash
             )
             if not mode_results:
                 logger.warning(f"Tidak ada hasil evaluasi untuk mode {mode_name} pada tipe {display_type}")
@@ -341,6 +792,20 @@ def main():
             metrics["elapsed_seconds"] = float(elapsed_seconds)
             metrics["answers_evaluated"] = int(len(df_mode))
             metrics["question_type_filter"] = type_name
+            metrics["dedup"] = dedup
+            metrics["timings"] = summarize_timings(mode_results)
+            all_results.extend(mode_results)
+            metrics["scoring_paths"] = {
+                str(path): int(count) for path, count in df_mode["scoring_path"].value_counts().items()
+            }
+            if small_llm is not None:
+                routing = evaluator.get_routing_stats()
+                metrics["routing"] = routing
+                logger.warning(
+                    f"Cascade mode {mode_name}: {routing['small_accepted']}/{routing['routed']} dinilai model kecil "
+                    f"({routing['small_share'] * 100:.1f}%), porsi waktu model besar "
+                    f"{routing['large_time_share'] * 100:.1f}%"
+                )
 
             type_suffix = "" if type_name == "all" else f"_{type_name}"
             json_path, csv_path = save_mode_outputs(
@@ -365,6 +830,17 @@ def main():
 
     total_time = time.time() - start_total
 
+    if checkpoint is not None:
+        checkpoint.close()
+
+    if isinstance(llm, CachedLLMBackend):
+        cache_stats = llm.get_cache_stats()
+        logger.warning(
+            f"Cache respons LLM: {cache_stats['hits']} hit, {cache_stats['misses']} miss "
+            f"(hit rate {cache_stats['hit_rate'] * 100:.1f}%), {cache_stats['bypassed']} dilewati "
+            f"(tidak deterministik), {cache_stats['entries']} entri"
+        )
+
     if comparison_summary:
         print("\n===== RINGKASAN PERFORMA RETRIEVAL =====")
         for entry in comparison_summary:
@@ -378,7 +854,8 @@ def main():
                 f"{entry['mode'].upper():<8} | {entry['description']:<22} | "
                 f"Tipe: {qtype_label.upper():<8} | "
                 f"Akurasi: {exact:6.2f}% | MAE: {mae:5.3f} | QWK: {qwk:6.4f} | "
-                f"Waktu: {elapsed/60:.2f} menit"
+                f"Waktu: {elapsed/60:.2f} menit | "
+                f"Dedup: {m.get('dedup', {}).get('dedup_ratio', 0.0) * 100:.1f}%"
             )
     else:
         print("Tidak ada hasil evaluasi yang berhasil dihasilkan.")
@@ -400,6 +877,7 @@ def main():
         "total_answers": int(len(df)),
         "total_time_seconds": float(total_time),
         "summary": comparison_summary,
+        "timings": summarize_timings(all_results),
         "combined_results_csv": combined_csv_path,
         "generated_at": time.strftime("%Y-%m-%d %H:%M:%S")
     }
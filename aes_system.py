@@ -15,11 +15,26 @@ import subprocess
 import tempfile
 import re
 import pickle
+import hashlib
+import math
+import functools
+import itertools
+import contextlib
+import contextvars
+import asyncio
+import difflib
+import unicodedata
+import sqlite3
 from pathlib import Path
+from collections.abc import Mapping, Sequence
 import numpy as np
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Callable
 import logging
 import concurrent.futures
+import threading
+import queue
+import atexit
+import http.client
 
 # Konfigurasi logging
 logging.basicConfig(
@@ -34,6 +49,224 @@ current_dir = Path(__file__).parent.absolute()
 if str(current_dir) not in sys.path:
     sys.path.append(str(current_dir))
 
+# Seed default untuk mode penilaian deterministik (greedy + seed tetap)
+DETERMINISTIC_SEED = 42
+
+# Ukuran konteks yang dipilih TokenBudgeter / llama-run: yang terkecil yang cukup untuk prompt + output
+CONTEXT_SIZE_STEPS = (2048, 4096, 8192, 16384, 32768, 65536, 131072)
+# Perkiraan karakter per token jika tokenizer model tidak tersedia (sengaja dibuat konservatif)
+CHARS_PER_TOKEN_ESTIMATE = 3.0
+
+# Waktu per tahap evaluasi yang sedang berjalan (lihat collect_stage_timings). ContextVar
+# terpisah per thread maupun per task asyncio, dan ikut terbawa ke run_blocking
+_stage_timings_var: contextvars.ContextVar = contextvars.ContextVar("aes_stage_timings", default=None)
+
+@contextlib.contextmanager
+def collect_stage_timings():
+    """
+    Kumpulkan waktu per tahap (retrieval, LLM, ...) yang dicatat di thread/task ini selama blok berjalan
+    
+    Yields:
+        Dict nama tahap -> nilai yang diakumulasi oleh record_stage_timing
+    """
+    timings: Dict[str, float] = {}
+    token = _stage_timings_var.set(timings)
+    try:
+        yield timings
+    finally:
+        _stage_timings_var.reset(token)
+
+def record_stage_timing(name: str, value: float):
+    """Tambahkan nilai ke tahap name; diabaikan jika tidak ada collect_stage_timings yang aktif"""
+    timings = _stage_timings_var.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0) + value
+
+def get_stage_timing(name: str) -> float:
+    """Nilai tahap name pada collect_stage_timings yang aktif (0 jika tidak ada)"""
+    timings = _stage_timings_var.get()
+    return timings.get(name, 0) if timings is not None else 0
+
+def timed_stage(name: str):
+    """Dekorator yang mencatat durasi pemanggilan fungsi (ms) ke tahap name; mendukung fungsi async"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start_time = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    record_stage_timing(name, (time.perf_counter() - start_time) * 1000.0)
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_stage_timing(name, (time.perf_counter() - start_time) * 1000.0)
+        return wrapper
+    return decorator
+
+async def run_blocking(func: Callable, *args, **kwargs):
+    """
+    Jalankan fungsi blocking (retrieval, subprocess, SQLite, ...) di executor default
+    tanpa menahan event loop; context (termasuk collect_stage_timings) ikut terbawa
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(context.run, func, *args, **kwargs))
+
+# Alur yang sama untuk versi sync dan async (misal _generate/_agenerate) ditulis sekali sebagai
+# generator "langkah": setiap pemanggilan yang bisa menunggu I/O di-yield sebagai step_call, lalu
+# run_steps menjalankannya langsung dan arun_steps memakai pasangan async-nya
+def step_call(target: Any, name: str, *args, **kwargs) -> Tuple[Any, str, tuple, Dict[str, Any]]:
+    """Langkah generator: panggil target.name(*args, **kwargs); hasil atau exception-nya dikirim balik"""
+    return target, name, args, kwargs
+
+def _async_method_name(name: str) -> str:
+    """Nama pasangan async: generate -> agenerate, _request -> _arequest"""
+    return "_a" + name[1:] if name.startswith("_") else "a" + name
+
+def run_steps(steps):
+    """
+    Jalankan generator langkah secara sinkron
+    
+    Args:
+        steps: Generator yang meng-yield step_call
+        
+    Returns:
+        Nilai return generator
+    """
+    value, error = None, None
+    while True:
+        try:
+            target, name, args, kwargs = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, error = getattr(target, name)(*args, **kwargs), None
+        except BaseException as e:
+            value, error = None, e
+
+async def arun_steps(steps):
+    """
+    Versi async dari run_steps: target.a<name> ditunggu jika ada, selain itu target.name
+    dijalankan di executor lewat run_blocking
+    """
+    value, error = None, None
+    while True:
+        try:
+            target, name, args, kwargs = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as stop:
+            return stop.value
+        async_method = getattr(target, _async_method_name(name), None)
+        try:
+            if async_method is not None:
+                value = await async_method(*args, **kwargs)
+            else:
+                value = await run_blocking(getattr(target, name), *args, **kwargs)
+            error = None
+        except BaseException as e:
+            value, error = None, e
+
+class ContextLocal:
+    """
+    Seperti threading.local, tetapi juga terpisah per task asyncio.
+    Setiap penulisan membuat salinan baru sehingga task lain yang berbagi context induk tidak terpengaruh.
+    """
+    
+    def __init__(self):
+        object.__setattr__(self, "_var", contextvars.ContextVar(f"aes_context_local_{id(self)}", default={}))
+    
+    def __getattr__(self, name):
+        values = object.__getattribute__(self, "_var").get()
+        if name not in values:
+            raise AttributeError(name)
+        return values[name]
+    
+    def __setattr__(self, name, value):
+        var = object.__getattribute__(self, "_var")
+        values = dict(var.get())
+        values[name] = value
+        var.set(values)
+
+# Kunci blok timings pada hasil evaluasi; tahap yang tidak dijalankan bernilai 0
+STAGE_TIMING_KEYS = (
+    "retrieval_ms", "retrieval_sparse_ms", "retrieval_dense_ms", "retrieval_fusion_ms",
+    "prompt_build_ms", "prompt_tokens", "generated_tokens", "llm_ms", "llm_calls",
+    "parse_ms", "retries", "total_ms"
+)
+
+def format_stage_timings(timings: Dict[str, float], total_ms: float) -> Dict[str, Any]:
+    """
+    Susun blok timings hasil evaluasi dari nilai yang dikumpulkan collect_stage_timings
+    
+    Args:
+        timings: Nilai per tahap
+        total_ms: Waktu total evaluasi (ms)
+        
+    Returns:
+        Dict dengan semua kunci STAGE_TIMING_KEYS; durasi dibulatkan ke 0.01 ms, hitungan berupa int
+    """
+    values = dict(timings, total_ms=total_ms)
+    return {
+        key: round(float(values.get(key, 0)), 2) if key.endswith("_ms") else int(values.get(key, 0))
+        for key in STAGE_TIMING_KEYS
+    }
+
+def select_retrieval_tier(tier_results: List[List[Dict[str, Any]]], min_scores: Tuple[float, ...],
+                          min_count: int) -> Dict[str, Any]:
+    """
+    Pilih hasil retrieval dari jenjang ambang pertama yang menghasilkan minimal min_count dokumen;
+    jika tidak ada, jenjang terakhir yang dipakai
+    
+    Args:
+        tier_results: Hasil retrieval per ambang (urutan sama dengan min_scores)
+        min_scores: Ambang skor minimum, dari yang paling ketat
+        min_count: Jumlah dokumen minimum agar suatu jenjang diterima
+        
+    Returns:
+        Dict berisi documents, tier (indeks jenjang), min_score, dan counts (jumlah dokumen per jenjang)
+    """
+    counts = [len(documents) for documents in tier_results]
+    tier = next((position for position, count in enumerate(counts) if count >= min_count), len(min_scores) - 1)
+    return {
+        "documents": tier_results[tier],
+        "tier": tier,
+        "min_score": min_scores[tier],
+        "counts": counts
+    }
+
+# Mode multi-jawaban: jumlah maksimum jawaban per prompt dan token output yang dicadangkan per slot
+MULTI_ANSWER_MAX_SLOTS = 8
+MULTI_ANSWER_SLOT_TOKENS = 48
+
+# Evaluasi batch paralel: jumlah maksimum kelompok jawaban yang sedang dievaluasi bersamaan
+BATCH_MAX_IN_FLIGHT = 8
+
+# Mode referensi per pertanyaan: kandidat (kelipatan top_k) diambil sekali per pertanyaan lalu
+# diurutkan ulang per jawaban dengan bobot skor retrieval vs. cakupan kata jawaban
+REFERENCE_MODES = ("answer", "question")
+QUESTION_REFERENCE_POOL_FACTOR = 2
+QUESTION_REFERENCE_RETRIEVAL_WEIGHT = 0.5
+
+# Retrieval banyak query sekaligus: jumlah query per blok perkalian skor (membatasi matriks
+# skor query x chunk di memori) dan jumlah kelompok jawaban per prefetch referensi batch
+RETRIEVAL_QUERY_BLOCK = 64
+REFERENCE_PREFETCH_CHUNK = 256
+
+# Ambang skor minimum referensi berjenjang: ambang berikutnya dipakai jika hasil ambang sebelumnya
+# kurang dari max(RETRIEVAL_MIN_RESULTS, top_k) dokumen
+RETRIEVAL_MIN_SCORE_TIERS = (1.0, 0.5)
+RETRIEVAL_MIN_RESULTS = 3
+
+# Dua chunk dianggap duplikat jika Jaccard himpunan token-nya melebihi ambang ini; hanya chunk
+# dengan skor tertinggi di antara duplikat yang dikembalikan BM25Retriever
+DUPLICATE_JACCARD_THRESHOLD = 0.7
+
 # Kelas untuk mengelola dokumen dan pemrosesan teks
 class DocumentProcessor:
     """Kelas untuk memproses dokumen PDF dan mengekstrak teks"""
@@ -184,6 +417,298 @@ class DocumentProcessor:
             
         return chunks
 
+# Indeks BM25 vektorisasi (matriks sparse) sebagai pengganti loop skor rank_bm25
+class RetrievedChunk(Mapping):
+    """
+    Satu hasil retrieval ringan yang dibaca seperti dict {"chunk", "score", "index"}.
+    Teks chunk tidak disalin; baru diambil dari list chunk retriever saat kunci "chunk" dibaca.
+    """
+    
+    __slots__ = ("_chunks", "index", "score")
+    _KEYS = ("chunk", "score", "index")
+    
+    def __init__(self, chunks: List[str], index: int, score: float):
+        self._chunks = chunks
+        self.index = index
+        self.score = score
+    
+    def __getitem__(self, key: str) -> Any:
+        if key == "chunk":
+            return self._chunks[self.index]
+        if key == "score":
+            return self.score
+        if key == "index":
+            return self.index
+        raise KeyError(key)
+    
+    def __iter__(self):
+        return iter(self._KEYS)
+    
+    def __len__(self) -> int:
+        return len(self._KEYS)
+    
+    def __repr__(self) -> str:
+        return f"RetrievedChunk(index={self.index}, score={self.score:.4f})"
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Salinan dict biasa (misal untuk serialisasi JSON)"""
+        return {"chunk": self._chunks[self.index], "score": self.score, "index": self.index}
+
+class RetrievalResults(Sequence):
+    """
+    Hasil retrieval sebagai array indeks chunk dan skor, terurut dari skor tertinggi.
+    Item berupa RetrievedChunk yang dibuat saat diakses, sehingga pemanggil lama tetap bisa
+    memakai doc["chunk"], doc["score"], dan doc["index"]. Gunakan to_list() (atau dict(doc))
+    sebelum serialisasi JSON.
+    """
+    
+    def __init__(self, chunks: List[str], indices: np.ndarray, scores: np.ndarray):
+        """
+        Args:
+            chunks: List chunk retriever (tidak disalin)
+            indices: Indeks chunk hasil retrieval
+            scores: Skor setiap indeks
+        """
+        self.chunks = chunks
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.scores = np.asarray(scores, dtype=np.float64)
+    
+    def __len__(self) -> int:
+        return int(self.indices.size)
+    
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return self.take(position)
+        return RetrievedChunk(self.chunks, int(self.indices[position]), float(self.scores[position]))
+    
+    def __repr__(self) -> str:
+        return f"RetrievalResults(indices={self.indices.tolist()}, scores={np.round(self.scores, 4).tolist()})"
+    
+    def take(self, positions) -> 'RetrievalResults':
+        """Subset hasil berdasarkan posisi (slice, array posisi, atau mask)"""
+        return RetrievalResults(self.chunks, self.indices[positions], self.scores[positions])
+    
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Hasil sebagai list dict biasa"""
+        return [item.to_dict() for item in self]
+
+class BM25Index:
+    """
+    Indeks BM25 Okapi dengan rumus yang sama persis dengan rank_bm25.BM25Okapi
+    (idf = ln(N - df + 0.5) - ln(df + 0.5), idf negatif diganti epsilon * rata-rata idf).
+    Bobot setiap pasangan (term, dokumen) = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+    dihitung sekali saat indeks dibangun dan disimpan sebagai matriks CSR term x dokumen,
+    sehingga skor satu query cukup satu perkalian sparse: frekuensi term query x baris term-nya.
+    """
+    
+    def __init__(self, tokenized_corpus: List[List[str]], k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        """
+        Args:
+            tokenized_corpus: List token per dokumen
+            k1: Parameter saturasi frekuensi term
+            b: Parameter normalisasi panjang dokumen
+            epsilon: Faktor lantai idf untuk term yang muncul di lebih dari separuh dokumen
+        """
+        from scipy import sparse
+        
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.corpus_size = len(tokenized_corpus)
+        self.vocabulary: Dict[str, int] = {}
+        
+        # Frekuensi term per dokumen dalam format COO (dokumen, term, tf); id term sesuai urutan kemunculan pertama
+        doc_ids: List[int] = []
+        term_ids: List[int] = []
+        term_freqs: List[int] = []
+        doc_len = np.zeros(self.corpus_size, dtype=np.float64)
+        for doc_id, tokens in enumerate(tokenized_corpus):
+            doc_len[doc_id] = len(tokens)
+            frequencies: Dict[int, int] = {}
+            for token in tokens:
+                term_id = self.vocabulary.setdefault(token, len(self.vocabulary))
+                frequencies[term_id] = frequencies.get(term_id, 0) + 1
+            doc_ids.extend([doc_id] * len(frequencies))
+            term_ids.extend(frequencies.keys())
+            term_freqs.extend(frequencies.values())
+        
+        n_terms = len(self.vocabulary)
+        doc_ids_arr = np.asarray(doc_ids, dtype=np.int64)
+        term_ids_arr = np.asarray(term_ids, dtype=np.int64)
+        tf = np.asarray(term_freqs, dtype=np.float64)
+        self.doc_len = doc_len
+        self.avgdl = float(doc_len.sum()) / self.corpus_size if self.corpus_size else 0.0
+        
+        # idf dihitung dengan math.log dan dijumlahkan berurutan seperti rank_bm25 agar nilainya identik
+        doc_freq = np.bincount(term_ids_arr, minlength=n_terms)
+        idf = [math.log(self.corpus_size - int(df) + 0.5) - math.log(int(df) + 0.5) for df in doc_freq]
+        idf_sum = 0.0
+        for value in idf:
+            idf_sum += value
+        self.average_idf = idf_sum / n_terms if n_terms else 0.0
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.idf[self.idf < 0] = self.epsilon * self.average_idf
+        
+        # avgdl hanya 0 jika korpus tidak punya token sama sekali (tidak ada entri yang dihitung)
+        length_norm = self.k1 * (1 - self.b + self.b * doc_len[doc_ids_arr] / (self.avgdl or 1.0))
+        weights = self.idf[term_ids_arr] * (tf * (self.k1 + 1) / (tf + length_norm))
+        self.term_doc = sparse.csr_matrix(
+            (weights, (term_ids_arr, doc_ids_arr)), shape=(n_terms, self.corpus_size), dtype=np.float64
+        )
+    
+    def query_terms(self, tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Id term dan jumlah kemunculannya di query; term di luar kosakata diabaikan
+        (kontribusinya 0, sama seperti rank_bm25). Term yang berulang dihitung berulang.
+        
+        Returns:
+            Tuple (array id term, array jumlah kemunculan)
+        """
+        counts: Dict[int, int] = {}
+        for token in tokens:
+            term_id = self.vocabulary.get(token)
+            if term_id is not None:
+                counts[term_id] = counts.get(term_id, 0) + 1
+        return np.fromiter(counts.keys(), dtype=np.int64, count=len(counts)), \
+            np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+    
+    def get_scores(self, tokens: List[str]) -> np.ndarray:
+        """
+        Skor BM25 query terhadap semua dokumen
+        
+        Args:
+            tokens: Token query
+            
+        Returns:
+            Array skor sepanjang jumlah dokumen
+        """
+        term_ids, counts = self.query_terms(tokens)
+        if term_ids.size == 0:
+            return np.zeros(self.corpus_size, dtype=np.float64)
+        return self.term_doc[term_ids].T.dot(counts)
+
+    def get_scores_many(self, tokenized_queries: List[List[str]]) -> np.ndarray:
+        """
+        Skor BM25 banyak query sekaligus: matriks sparse frekuensi term query (query x term)
+        dikalikan sekali dengan matriks term x dokumen
+        
+        Args:
+            tokenized_queries: List token per query
+        
+        Returns:
+            Array skor berukuran (jumlah query, jumlah dokumen)
+        """
+        from scipy import sparse
+        
+        rows: List[np.ndarray] = []
+        cols: List[np.ndarray] = []
+        values: List[np.ndarray] = []
+        for row, tokens in enumerate(tokenized_queries):
+            term_ids, counts = self.query_terms(tokens)
+            rows.append(np.full(term_ids.size, row, dtype=np.int64))
+            cols.append(term_ids)
+            values.append(counts)
+        if not rows:
+            return np.zeros((0, self.corpus_size), dtype=np.float64)
+        query_matrix = sparse.csr_matrix(
+            (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(len(tokenized_queries), len(self.vocabulary)), dtype=np.float64
+        )
+        return query_matrix.dot(self.term_doc).toarray()
+
+class NearDuplicateIndex:
+    """
+    Indeks near-duplicate chunk: dua chunk duplikat jika Jaccard himpunan token-nya > threshold.
+    Himpunan id token setiap chunk diambil dari pola matriks BM25Index (chunk x term),
+    lalu dibangun indeks prefiks: token paling jarang sebanyak |x| - ceil(t * |x|) + 1 per chunk.
+    Dua himpunan dengan Jaccard >= t pasti berbagi token di prefiksnya, sehingga kandidat duplikat
+    sebuah chunk cukup diambil dari posting token prefiksnya lalu Jaccard-nya dihitung persis.
+    Daftar duplikat per chunk dihitung saat pertama diminta lalu disimpan (peta cluster), sehingga
+    pengecekan berikutnya O(1) tanpa membangun semua pasangan di depan.
+    """
+    
+    def __init__(self, chunk_terms, threshold: float = DUPLICATE_JACCARD_THRESHOLD):
+        """
+        Args:
+            chunk_terms: Matriks sparse chunk x term; setiap entri yang tersimpan (termasuk bobot 0)
+                menandai term yang muncul di chunk, misal BM25Index.term_doc.T
+            threshold: Ambang Jaccard (duplikat jika lebih besar dari nilai ini)
+        """
+        from scipy import sparse
+        
+        self.threshold = threshold
+        chunk_terms = sparse.csr_matrix(chunk_terms)
+        chunk_terms.sum_duplicates()
+        n_docs, n_terms = chunk_terms.shape
+        self.sizes = np.diff(chunk_terms.indptr).astype(np.int64)
+        rows = np.repeat(np.arange(n_docs, dtype=np.int64), self.sizes)
+        terms = chunk_terms.indices.astype(np.int64)
+        
+        # Urutan global term: dari yang paling jarang (df kecil), seri diurutkan menurut id term
+        doc_freq = np.bincount(terms, minlength=n_terms)
+        rank_of = np.empty(n_terms, dtype=np.int64)
+        rank_of[np.lexsort((np.arange(n_terms), doc_freq))] = np.arange(n_terms)
+        ranks = rank_of[terms]
+        # Urutkan term setiap chunk menurut rank (kunci gabungan unik: chunk * n_terms + rank)
+        order = np.argsort(rows * max(n_terms, 1) + ranks)
+        rows, ranks = rows[order], ranks[order]
+        
+        # Posisi setiap term di dalam chunk-nya; toleransi kecil agar pembulatan float
+        # (misal 0.7 * 10) tidak memperpendek prefiks
+        row_start = np.concatenate(([0], np.cumsum(self.sizes)[:-1])).astype(np.int64)
+        position = np.arange(rows.size) - row_start[rows]
+        prefix_len = self.sizes - np.ceil(threshold * self.sizes - 1e-9).astype(np.int64) + 1
+        in_prefix = position < prefix_len[rows]
+        
+        shape = (n_docs, n_terms)
+        self.token_matrix = sparse.csr_matrix(
+            (np.ones(rows.size, dtype=np.float32), (rows, ranks)), shape=shape
+        )
+        self.prefix_matrix = sparse.csr_matrix(
+            (np.ones(int(in_prefix.sum()), dtype=np.float32), (rows[in_prefix], ranks[in_prefix])), shape=shape
+        )
+        self.postings = self.prefix_matrix.T.tocsr()
+        self._duplicates: Dict[int, frozenset] = {}
+        self._lock = threading.Lock()
+    
+    def duplicates_of(self, chunk_id: int) -> frozenset:
+        """
+        Indeks chunk lain dengan Jaccard token > threshold terhadap chunk ini
+        (chunk tanpa token tidak pernah dianggap duplikat)
+        """
+        cached = self._duplicates.get(chunk_id)
+        if cached is not None:
+            return cached
+        
+        duplicates = frozenset()
+        size = int(self.sizes[chunk_id])
+        if size:
+            prefix_terms = self.prefix_matrix.indices[self.prefix_matrix.indptr[chunk_id]:self.prefix_matrix.indptr[chunk_id + 1]]
+            candidates = np.unique(np.concatenate([
+                self.postings.indices[self.postings.indptr[term]:self.postings.indptr[term + 1]]
+                for term in prefix_terms
+            ]))
+            candidates = candidates[candidates != chunk_id]
+            # Filter ukuran: Jaccard <= min(|x|, |y|) / max(|x|, |y|)
+            other_sizes = self.sizes[candidates]
+            candidates = candidates[np.minimum(other_sizes, size) > self.threshold * np.maximum(other_sizes, size)]
+            if candidates.size:
+                # Irisan dihitung langsung dari array CSR (term tiap baris sudah terurut),
+                # tanpa overhead indexing baris scipy
+                indptr, indices = self.token_matrix.indptr, self.token_matrix.indices
+                own_terms = indices[indptr[chunk_id]:indptr[chunk_id + 1]]
+                lengths = self.sizes[candidates]
+                offsets = np.repeat(indptr[candidates] - np.cumsum(lengths) + lengths, lengths)
+                other_terms = indices[offsets + np.arange(offsets.size)]
+                found = np.minimum(np.searchsorted(own_terms, other_terms), size - 1)
+                hits = own_terms[found] == other_terms
+                overlap = np.bincount(np.repeat(np.arange(candidates.size), lengths), weights=hits, minlength=candidates.size)
+                jaccard = overlap / (size + lengths - overlap)
+                duplicates = frozenset(candidates[jaccard > self.threshold].tolist())
+        
+        with self._lock:
+            return self._duplicates.setdefault(chunk_id, duplicates)
+
 # Kelas untuk implementasi BM25
 class BM25Retriever:
     """Implementasi BM25 untuk retrieval dokumen"""
@@ -197,8 +722,10 @@ class BM25Retriever:
         """
         self.chunks = chunks
         self.tokenized_chunks = [self._tokenize(chunk) for chunk in chunks]
+        self.index = None
         self.bm25 = None
         self._initialize_bm25()
+        self._initialize_duplicates()
         
     def _tokenize(self, text: str) -> List[str]:
         """
@@ -214,7 +741,16 @@ class BM25Retriever:
         return text.lower().split()
     
     def _initialize_bm25(self):
-        """Inisialisasi model BM25"""
+        """Inisialisasi model BM25: indeks sparse jika scipy tersedia, jika tidak rank_bm25"""
+        try:
+            start_time = time.time()
+            self.index = BM25Index(self.tokenized_chunks)
+            logger.info(f"Indeks BM25 sparse dibuat dalam {time.time() - start_time:.2f} detik "
+                        f"({len(self.index.vocabulary)} term, {self.index.term_doc.nnz} entri)")
+            return
+        except ImportError:
+            logger.warning("scipy tidak ditemukan, memakai rank_bm25 (lebih lambat). Instal dengan 'pip install scipy'")
+        
         try:
             from rank_bm25 import BM25Okapi
             self.bm25 = BM25Okapi(self.tokenized_chunks)
@@ -222,6 +758,29 @@ class BM25Retriever:
             logger.error("rank_bm25 tidak ditemukan. Menginstal dengan 'pip install rank-bm25'")
             sys.exit(1)
     
+    def _initialize_duplicates(self):
+        """Indeks near-duplicate untuk filter hasil; tanpa indeks sparse, kemiripan dihitung per pasangan"""
+        self.duplicate_index = None
+        self._token_sets: Dict[int, frozenset] = {}
+        if self.index is not None:
+            start_time = time.time()
+            self.duplicate_index = NearDuplicateIndex(self.index.term_doc.T, DUPLICATE_JACCARD_THRESHOLD)
+            logger.info(f"Indeks near-duplicate dibuat dalam {time.time() - start_time:.2f} detik")
+    
+    def _token_set(self, chunk_id: int) -> frozenset:
+        """Himpunan token chunk untuk perbandingan per pasangan (disimpan setelah pertama dibuat)"""
+        tokens = self._token_sets.get(chunk_id)
+        if tokens is None:
+            tokens = self._token_sets.setdefault(chunk_id, frozenset(self.tokenized_chunks[chunk_id]))
+        return tokens
+    
+    def get_scores(self, tokenized_query: List[str]) -> np.ndarray:
+        """Skor BM25 query terhadap semua chunk"""
+        if self.index is not None:
+            return self.index.get_scores(tokenized_query)
+        return self.bm25.get_scores(tokenized_query)
+    
+    @timed_stage("retrieval_sparse_ms")
     def retrieve(self, query: str, top_k: int = 5, min_score: float = 0.0) -> List[Dict[str, Any]]:
         """
         Mengambil dokumen yang paling relevan dengan query
@@ -239,70 +798,135 @@ class BM25Retriever:
         tokenized_query = self._tokenize(query)
         
         try:
-            scores = self.bm25.get_scores(tokenized_query)
-            top_indices = np.argsort(scores)[::-1][:top_k*2]  # Ambil lebih banyak kandidat
-            
-            results = []
-            for idx in top_indices:
-                if scores[idx] > min_score:  # Filter berdasarkan skor minimum
-                    results.append({
-                        "chunk": self.chunks[idx],
-                        "score": float(scores[idx]),
-                        "index": int(idx)
-                    })
-            
-            # Filter hasil untuk menghilangkan duplikasi konten
-            filtered_results = self._filter_similar_chunks(results)
-            
-            # Batasi jumlah hasil akhir
-            return filtered_results[:top_k]
+            scores = self.get_scores(tokenized_query)
+            return self._results_from_candidates(scores, self._ranked_candidates(scores, top_k), top_k, min_score)
         except Exception as e:
             logger.error(f"Error saat melakukan retrieval: {e}")
             return []
     
-    def _filter_similar_chunks(self, chunks: List[Dict[str, Any]], similarity_threshold: float = 0.7) -> List[Dict[str, Any]]:
+    def retrieve_many(self, queries: List[str], top_k: int = 5, min_score: float = 0.0) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieval banyak query sekaligus; hasil per query sama dengan retrieve.
+        Dengan indeks sparse, skor setiap blok query dihitung dengan satu perkalian matriks.
+        
+        Args:
+            queries: List query pencarian
+            top_k: Jumlah dokumen teratas per query
+            min_score: Skor minimum untuk dokumen yang akan dikembalikan
+        
+        Returns:
+            List hasil retrieval dengan urutan yang sama dengan queries
+        """
+        return [tiers[0] for tiers in self.retrieve_tiers_many(queries, top_k=top_k, min_scores=(min_score,))]
+    
+    @timed_stage("retrieval_sparse_ms")
+    def retrieve_tiers_many(self, queries: List[str], top_k: int = 5,
+                            min_scores: Tuple[float, ...] = RETRIEVAL_MIN_SCORE_TIERS) -> List[List[List[Dict[str, Any]]]]:
+        """
+        Hasil retrieval setiap query untuk beberapa ambang skor minimum sekaligus. Skor dan
+        urutan kandidat dihitung sekali per query; setiap ambang hanya menyaring daftar yang sama.
+        
+        Args:
+            queries: List query pencarian
+            top_k: Jumlah dokumen teratas per query
+            min_scores: Ambang skor minimum, dari yang paling ketat
+        
+        Returns:
+            Per query, list hasil retrieval untuk setiap ambang (urutan sama dengan min_scores)
+        """
+        results: List[List[List[Dict[str, Any]]]] = []
+        for start in range(0, len(queries), RETRIEVAL_QUERY_BLOCK):
+            block = queries[start:start + RETRIEVAL_QUERY_BLOCK]
+            try:
+                if self.index is not None:
+                    scores = self.index.get_scores_many([self._tokenize(query) for query in block])
+                else:
+                    scores = [self.get_scores(self._tokenize(query)) for query in block]
+                for row in scores:
+                    candidates = self._ranked_candidates(row, top_k)
+                    results.append([self._results_from_candidates(row, candidates, top_k, min_score)
+                                    for min_score in min_scores])
+            except Exception as e:
+                logger.error(f"Error saat melakukan retrieval: {e}")
+                results.extend([[] for _ in min_scores] for _ in block)
+        return results
+    
+    @staticmethod
+    def _ranked_candidates(scores: np.ndarray, top_k: int) -> np.ndarray:
+        """
+        Indeks kandidat teratas (top_k * 2) berdasarkan skor, dari yang tertinggi.
+        np.argpartition memilih kandidat dalam O(n), lalu hanya kandidat tersebut yang diurutkan.
+        """
+        n_candidates = min(top_k * 2, scores.size)  # Ambil lebih banyak kandidat
+        if n_candidates <= 0:
+            return np.empty(0, dtype=np.int64)
+        if n_candidates < scores.size:
+            candidates = np.argpartition(scores, scores.size - n_candidates)[scores.size - n_candidates:]
+        else:
+            candidates = np.arange(scores.size)
+        # Skor sama diurutkan dari indeks terbesar, seperti np.argsort(scores)[::-1]
+        return candidates[np.lexsort((candidates, scores[candidates]))[::-1]]
+    
+    def _results_from_candidates(self, scores: np.ndarray, top_indices: np.ndarray, top_k: int,
+                                 min_score: float) -> RetrievalResults:
+        """Dokumen teratas dari kandidat satu query setelah filter skor minimum dan chunk yang mirip"""
+        candidate_scores = scores[top_indices]
+        keep = candidate_scores > min_score  # Filter berdasarkan skor minimum
+        results = RetrievalResults(self.chunks, top_indices[keep], candidate_scores[keep])
+        
+        # Filter hasil untuk menghilangkan duplikasi konten
+        filtered_results = self._filter_similar_chunks(results)
+        
+        # Batasi jumlah hasil akhir
+        return filtered_results[:top_k]
+    
+    def _filter_similar_chunks(self, chunks: RetrievalResults,
+                               similarity_threshold: float = DUPLICATE_JACCARD_THRESHOLD) -> RetrievalResults:
         """
-        Filter chunks yang terlalu mirip untuk menghindari duplikasi
+        Filter chunks yang terlalu mirip untuk menghindari duplikasi. Dengan ambang indeks
+        near-duplicate, chunk cukup dicek terhadap daftar duplikatnya (tersimpan per chunk).
         
         Args:
-            chunks: List chunk dengan skor
+            chunks: Hasil retrieval dengan skor
             similarity_threshold: Ambang batas kesamaan untuk menganggap dua chunk mirip
             
         Returns:
-            List chunk yang sudah difilter
+            Hasil retrieval yang sudah difilter
         """
-        if not chunks:
-            return []
+        if not len(chunks):
+            return chunks
             
         # Urutkan berdasarkan skor
-        sorted_chunks = sorted(chunks, key=lambda x: x["score"], reverse=True)
+        order = np.argsort(-chunks.scores, kind="stable")
         
-        filtered = [sorted_chunks[0]]  # Selalu ambil chunk dengan skor tertinggi
+        filtered = [int(order[0])]  # Selalu ambil chunk dengan skor tertinggi
+        selected_ids = {int(chunks.indices[order[0]])}
+        use_index = self.duplicate_index is not None and similarity_threshold == self.duplicate_index.threshold
         
-        for chunk in sorted_chunks[1:]:
+        for position in order[1:]:
+            chunk_id = int(chunks.indices[position])
             # Cek apakah chunk ini terlalu mirip dengan chunk yang sudah diambil
-            is_similar = False
-            for selected in filtered:
-                # Hitung kesamaan sederhana berdasarkan kata-kata yang sama
-                chunk_words = set(self._tokenize(chunk["chunk"]))
-                selected_words = set(self._tokenize(selected["chunk"]))
-                
-                if not chunk_words or not selected_words:  # Hindari division by zero
-                    continue
-                    
-                # Jaccard similarity
-                intersection = len(chunk_words.intersection(selected_words))
-                union = len(chunk_words.union(selected_words))
-                similarity = intersection / union if union > 0 else 0
-                
-                if similarity > similarity_threshold:
-                    is_similar = True
-                    break
+            if use_index:
+                is_similar = not self.duplicate_index.duplicates_of(chunk_id).isdisjoint(selected_ids)
+            else:
+                is_similar = any(
+                    self._jaccard(self._token_set(chunk_id), self._token_set(selected_id)) > similarity_threshold
+                    for selected_id in selected_ids
+                )
             
             if not is_similar:
-                filtered.append(chunk)
+                filtered.append(int(position))
+                selected_ids.add(chunk_id)
                 
-        return filtered
+        return chunks.take(filtered)
+    
+    @staticmethod
+    def _jaccard(chunk_words: frozenset, selected_words: frozenset) -> float:
+        """Jaccard similarity dua himpunan token; 0 jika salah satunya kosong"""
+        if not chunk_words or not selected_words:  # Hindari division by zero
+            return 0.0
+        intersection = len(chunk_words & selected_words)
+        return intersection / (len(chunk_words) + len(selected_words) - intersection)
 
 class DenseRetriever:
     """Implementasi Dense Passage Retrieval untuk retrieval dokumen"""
@@ -323,6 +947,9 @@ class DenseRetriever:
         self.embeddings = None
         self.index = None
         self._use_e5_format = "e5" in self.model_name.lower()
+        # Satu instance dipakai bersama oleh banyak thread: inisialisasi lazy dan tokenizer model
+        # (tokenizer cepat HuggingFace tidak boleh dipakai bersamaan) dijaga lock ini
+        self._lock = threading.RLock()
         
         # Coba inisialisasi model dan index
         if chunks:
@@ -459,6 +1086,7 @@ class DenseRetriever:
             logger.error(f"Error saat membuat index: {e}")
             return False
     
+    @timed_stage("retrieval_dense_ms")
     def retrieve(self, query: str, top_k: int = 5, min_score: float = 0.0) -> List[Dict[str, Any]]:
         """
         Mengambil dokumen yang paling relevan dengan query
@@ -471,33 +1099,12 @@ class DenseRetriever:
         Returns:
             List dokumen yang relevan dengan skor
         """
-        # Pastikan model tersedia
-        if self.model is None:
-            try:
-                self._initialize_model()
-            except Exception as e:
-                logger.error(f"Gagal menginisialisasi model: {e}")
-                return []
-        
-        # Pastikan index tersedia
-        if self.index is None:
-            success = self._create_index()
-            if not success:
-                logger.error("Gagal membuat index FAISS")
-                return []
+        if not self._ensure_index():
+            return []
         
         try:
-            # Pastikan model dan index tersedia
-            if self.model is None or self.index is None:
-                logger.error("Model atau index tidak tersedia")
-                return []
-                
             # Encode query
-            query_text = self._format_query(query) if self._use_e5_format else query
-            encode_kwargs = {}
-            if self._use_e5_format:
-                encode_kwargs["normalize_embeddings"] = True
-            query_embedding = self.model.encode([query_text], **encode_kwargs)[0].reshape(1, -1).astype('float32')
+            query_embedding = self._encode_queries([query])
             
             # Cari dokumen terdekat
             distances, indices = self.index.search(query_embedding, min(top_k, len(self.chunks)))
@@ -507,32 +1114,114 @@ class DenseRetriever:
                 logger.warning("Hasil pencarian kosong")
                 return []
             
-            # Konversi jarak ke skor (semakin kecil jarak, semakin besar skor)
-            max_distance = np.max(distances) if distances.size > 0 else 1.0
-            if max_distance == 0:
-                max_distance = 1.0
-            
-            results = []
-            for i, (idx, distance) in enumerate(zip(indices[0], distances[0])):
-                # Pastikan indeks valid
-                if idx < 0 or idx >= len(self.chunks):
-                    logger.warning(f"Indeks tidak valid: {idx}")
-                    continue
-                    
-                # Konversi jarak ke skor (1 - jarak/max_distance)
-                score = 1.0 - (distance / max_distance)
-                
-                results.append({
-                    "chunk": self.chunks[idx],
-                    "score": float(score),
-                    "index": int(idx),
-                    "distance": float(distance)
-                })
+            return self._results_from_search(distances[0], indices[0])
+        except Exception as e:
+            logger.error(f"Error saat melakukan retrieval: {e}")
+            return []
+    
+    @timed_stage("retrieval_dense_ms")
+    def retrieve_many(self, queries: List[str], top_k: int = 5, min_score: float = 0.0) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieval banyak query sekaligus: satu pemanggilan model.encode untuk semua query
+        dan satu pencarian FAISS per blok query. Hasil per query sama dengan retrieve.
+        
+        Args:
+            queries: List query pencarian
+            top_k: Jumlah dokumen teratas per query
+            min_score: Parameter tidak digunakan, hanya untuk kompatibilitas dengan BM25Retriever
             
+        Returns:
+            List hasil retrieval dengan urutan yang sama dengan queries
+        """
+        if not queries:
+            return []
+        if not self._ensure_index():
+            return [[] for _ in queries]
+        
+        try:
+            query_embeddings = self._encode_queries(queries)
+            results: List[List[Dict[str, Any]]] = []
+            for start in range(0, len(queries), RETRIEVAL_QUERY_BLOCK):
+                distances, indices = self.index.search(
+                    query_embeddings[start:start + RETRIEVAL_QUERY_BLOCK], min(top_k, len(self.chunks))
+                )
+                results.extend(self._results_from_search(row_distances, row_indices)
+                               for row_distances, row_indices in zip(distances, indices))
             return results
         except Exception as e:
             logger.error(f"Error saat melakukan retrieval: {e}")
-            return []
+            return [[] for _ in queries]
+    
+    def retrieve_tiers_many(self, queries: List[str], top_k: int = 5,
+                            min_scores: Tuple[float, ...] = RETRIEVAL_MIN_SCORE_TIERS) -> List[List[List[Dict[str, Any]]]]:
+        """
+        Hasil retrieval per ambang skor minimum, setara BM25Retriever.retrieve_tiers_many.
+        Skor dense tidak difilter dengan ambang, sehingga setiap jenjang berisi hasil yang sama
+        dan pencarian hanya dijalankan sekali.
+        """
+        return [[documents] * len(min_scores) for documents in self.retrieve_many(queries, top_k=top_k)]
+    
+    def _ensure_index(self) -> bool:
+        """Pastikan model dan index FAISS tersedia (dibuat saat pertama dipakai)"""
+        with self._lock:
+            # Pastikan model tersedia
+            if self.model is None:
+                try:
+                    self._initialize_model()
+                except Exception as e:
+                    logger.error(f"Gagal menginisialisasi model: {e}")
+                    return False
+            
+            # Pastikan index tersedia
+            if self.index is None:
+                success = self._create_index()
+                if not success:
+                    logger.error("Gagal membuat index FAISS")
+                    return False
+        
+        # Pastikan model dan index tersedia
+        if self.model is None or self.index is None:
+            logger.error("Model atau index tidak tersedia")
+            return False
+        return True
+    
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Embedding query (format e5 jika perlu) sebagai matriks float32 (jumlah query x dimensi)"""
+        query_texts = [self._format_query(query) for query in queries] if self._use_e5_format else list(queries)
+        encode_kwargs = {}
+        if self._use_e5_format:
+            encode_kwargs["normalize_embeddings"] = True
+        if len(query_texts) > 1:
+            encode_kwargs["show_progress_bar"] = False
+        with self._lock:
+            embeddings = self.model.encode(query_texts, **encode_kwargs)
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(query_texts), -1)
+    
+    def _results_from_search(self, distances: np.ndarray, indices: np.ndarray) -> List[Dict[str, Any]]:
+        """Hasil retrieval dari jarak dan indeks FAISS untuk satu query"""
+        # Konversi jarak ke skor (semakin kecil jarak, semakin besar skor)
+        max_distance = np.max(distances) if distances.size > 0 else 1.0
+        if max_distance == 0:
+            max_distance = 1.0
+        
+        results = []
+        for idx, distance in zip(indices, distances):
+            # Pastikan indeks valid
+            if idx < 0 or idx >= len(self.chunks):
+                logger.warning(f"Indeks tidak valid: {idx}")
+                continue
+                
+            # Konversi jarak ke skor (1 - jarak/max_distance)
+            score = 1.0 - (distance / max_distance)
+            
+            results.append({
+                "chunk": self.chunks[idx],
+                "score": float(score),
+                "index": int(idx),
+                "distance": float(distance)
+            })
+        
+        return results
     
     def _format_query(self, query: str) -> str:
         if not query:
@@ -747,6 +1436,43 @@ class HybridRetriever:
         candidate_multiplier = 2
         sparse_results = self.sparse_retriever.retrieve(query, top_k=top_k * candidate_multiplier, min_score=min_score)
         dense_results = self.dense_retriever.retrieve(query, top_k=top_k * candidate_multiplier, min_score=min_score)
+        return self._fuse(sparse_results, dense_results, top_k)
+
+    def retrieve_many(self, queries: List[str], top_k: int = 5, min_score: float = 0.0) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieval banyak query sekaligus: kandidat sparse dan dense diambil lewat retrieve_many
+        masing-masing (satu perkalian matriks BM25, satu encode + pencarian FAISS), lalu
+        digabung per query dengan fusi yang sama seperti retrieve
+        """
+        top_k = max(1, top_k)
+        candidate_multiplier = 2
+        sparse_batches = self.sparse_retriever.retrieve_many(queries, top_k=top_k * candidate_multiplier, min_score=min_score)
+        dense_batches = self.dense_retriever.retrieve_many(queries, top_k=top_k * candidate_multiplier, min_score=min_score)
+        return [
+            self._fuse(sparse_results, dense_results, top_k)
+            for sparse_results, dense_results in zip(sparse_batches, dense_batches)
+        ]
+
+    def retrieve_tiers_many(self, queries: List[str], top_k: int = 5,
+                            min_scores: Tuple[float, ...] = RETRIEVAL_MIN_SCORE_TIERS) -> List[List[List[Dict[str, Any]]]]:
+        """
+        Hasil fusi per ambang skor minimum: kandidat sparse setiap ambang berasal dari satu kali
+        penghitungan skor BM25, kandidat dense diambil sekali, lalu digabung per ambang
+        """
+        top_k = max(1, top_k)
+        candidate_multiplier = 2
+        sparse_tiers = self.sparse_retriever.retrieve_tiers_many(queries, top_k=top_k * candidate_multiplier,
+                                                                 min_scores=min_scores)
+        dense_batches = self.dense_retriever.retrieve_many(queries, top_k=top_k * candidate_multiplier)
+        return [
+            [self._fuse(sparse_results, dense_results, top_k) for sparse_results in tiers]
+            for tiers, dense_results in zip(sparse_tiers, dense_batches)
+        ]
+
+    def _fuse(self, sparse_results: List[Dict[str, Any]], dense_results: List[Dict[str, Any]],
+              top_k: int) -> List[Dict[str, Any]]:
+        """Gabungkan kandidat sparse dan dense satu query dengan skor ter-normalisasi dan (adaptive) alpha"""
+        fusion_start = time.perf_counter()
 
         sparse_norm = self._normalize_scores(sparse_results)
         dense_norm = self._normalize_scores(dense_results)
@@ -781,28 +1507,329 @@ class HybridRetriever:
             combined = sparse_results[:]
 
         combined_sorted = sorted(combined, key=lambda x: x["score"], reverse=True)
+        record_stage_timing("retrieval_fusion_ms", (time.perf_counter() - fusion_start) * 1000.0)
         return combined_sorted[:top_k]
 
-# Kelas untuk mengelola LLM dengan llama.cpp langsung
-class LlamaModelCpp:
-    """Kelas untuk mengelola model Llama menggunakan llama.cpp"""
+# Registry retriever agar setiap jenis hanya dibangun sekali per proses
+class RetrieverRegistry:
+    """
+    Membangun setiap jenis retriever (sparse, dense, hybrid) secara lazy saat pertama diminta,
+    lalu membagikan instance yang sama ke semua mode, filter tipe soal, dan thread.
+    Model SentenceTransformer, cache embedding, dan index FAISS hanya dimuat sekali;
+    hybrid memakai ulang instance sparse dan dense yang sama.
+    """
     
-    def __init__(self, model_path: str, llama_path: str = None, n_gpu_layers: int = 999, ctx_size: int = 16384):
+    def __init__(self, chunks: List[str], dense_cache_dir: Optional[str] = None,
+                 dense_model_name: str = "intfloat/multilingual-e5-base", hybrid_alpha: float = 0.5,
+                 use_adaptive: bool = True, adaptive_method: str = "confidence"):
         """
-        Inisialisasi model Llama dengan llama.cpp
-        
         Args:
-            model_path: Path ke file model GGUF
-            llama_path: Path ke binary llama-run.exe
-            n_gpu_layers: Jumlah layer yang akan dijalankan di GPU
-            ctx_size: Ukuran konteks maksimum
+            chunks: List chunk teks yang diindeks semua retriever
+            dense_cache_dir: Direktori cache embedding DenseRetriever
+            dense_model_name: Nama model sentence-transformer untuk DenseRetriever
+            hybrid_alpha: Bobot sparse default untuk HybridRetriever
+            use_adaptive: Gunakan adaptive alpha pada HybridRetriever
+            adaptive_method: Metode adaptive alpha HybridRetriever
         """
-        self.model_path = model_path
-        self.n_gpu_layers = n_gpu_layers
-        self.ctx_size = ctx_size
-        
-        # Cari llama-run.exe jika tidak disediakan
-        if llama_path is None:
+        self.chunks = chunks
+        self.dense_cache_dir = dense_cache_dir
+        self.dense_model_name = dense_model_name
+        self.hybrid_alpha = hybrid_alpha
+        self.use_adaptive = use_adaptive
+        self.adaptive_method = adaptive_method
+        self._instances: Dict[str, Any] = {}
+        # RLock karena hybrid meminta sparse dan dense dari dalam builder-nya
+        self._lock = threading.RLock()
+        self._builders: Dict[str, Callable[[], Any]] = {
+            "sparse": self._build_sparse,
+            "dense": self._build_dense,
+            "hybrid": self._build_hybrid
+        }
+    
+    def register(self, kind: str, builder: Callable[[], Any]):
+        """Daftarkan builder untuk jenis retriever tambahan (dipanggil sekali saat pertama diminta)"""
+        with self._lock:
+            self._builders[kind] = builder
+            self._instances.pop(kind, None)
+    
+    def get(self, kind: str):
+        """
+        Ambil instance retriever bersama untuk jenis tertentu, bangun jika belum ada
+        
+        Args:
+            kind: Jenis retriever (sparse, dense, hybrid, atau yang didaftarkan lewat register)
+            
+        Returns:
+            Instance retriever
+        """
+        with self._lock:
+            if kind not in self._instances:
+                if kind not in self._builders:
+                    raise ValueError(f"Jenis retriever tidak dikenal: {kind}")
+                logger.info(f"Membangun retriever {kind}...")
+                start_time = time.time()
+                self._instances[kind] = self._builders[kind]()
+                logger.info(f"Retriever {kind} siap dalam {time.time() - start_time:.2f} detik")
+            return self._instances[kind]
+    
+    def built(self) -> List[str]:
+        """Daftar jenis retriever yang sudah dibangun"""
+        with self._lock:
+            return list(self._instances)
+    
+    def _build_sparse(self) -> BM25Retriever:
+        return BM25Retriever(self.chunks)
+    
+    def _build_dense(self) -> DenseRetriever:
+        return DenseRetriever(chunks=self.chunks, model_name=self.dense_model_name, cache_dir=self.dense_cache_dir)
+    
+    def _build_hybrid(self) -> HybridRetriever:
+        return HybridRetriever(
+            self.get("sparse"),
+            self.get("dense"),
+            alpha=self.hybrid_alpha,
+            use_adaptive=self.use_adaptive,
+            adaptive_method=self.adaptive_method
+        )
+
+# Kebijakan berhenti untuk generasi streaming
+class EvaluationStopPolicy:
+    """
+    Menentukan kapan generasi evaluasi boleh dihentikan: begitu baris
+    '1. Skor: N' dan baris '2. Kata kunci penting: ...' sudah lengkap.
+    Semua teks setelahnya akan dibuang oleh _force_format, jadi tidak perlu di-decode.
+    """
+    
+    _score_regex = re.compile(r'(?i)skor\s*:\s*\(?\d')
+    _keywords_regex = re.compile(r'(?i)kata\s*kunci\s*penting\s*:[^\n]*\S[^\n]*\n')
+    _end_regex = re.compile(r'<\|im_end\|>|<\|im_start\|>')
+    
+    def __call__(self, text: str) -> bool:
+        """
+        Args:
+            text: Teks yang sudah dihasilkan sejauh ini
+            
+        Returns:
+            True jika generasi boleh dihentikan
+        """
+        if self._end_regex.search(text):
+            return True
+        return bool(self._score_regex.search(text) and self._keywords_regex.search(text))
+
+def estimate_tokens(text: str) -> int:
+    """Perkiraan jumlah token (termasuk BOS) tanpa tokenizer"""
+    return int(math.ceil(len(text or "") / CHARS_PER_TOKEN_ESTIMATE)) + 1
+
+def select_context_size(n_tokens: int, max_ctx: int) -> int:
+    """
+    Pilih ukuran konteks terkecil dari CONTEXT_SIZE_STEPS yang memuat n_tokens
+    
+    Args:
+        n_tokens: Jumlah token yang harus muat (prompt + output)
+        max_ctx: Ukuran konteks maksimum yang diizinkan
+        
+    Returns:
+        Ukuran konteks, tidak pernah melebihi max_ctx
+    """
+    for step in CONTEXT_SIZE_STEPS:
+        if step >= n_tokens:
+            return min(step, max_ctx)
+    return max_ctx
+
+# Kelas dasar untuk semua backend LLM
+class LLMBackend:
+    """Kelas dasar backend LLM; semua backend menyediakan generate(prompt, max_tokens, temperature)"""
+    
+    def close(self):
+        """Lepaskan resource yang dipegang backend (default: tidak ada)"""
+        return None
+    
+    # Backend yang bisa membatasi output dengan grammar GBNF menimpa atribut ini
+    supports_grammar = False
+    
+    # Backend yang mengembalikan probabilitas token dari generate_with_probs menimpa atribut ini
+    supports_token_probs = False
+    
+    # Backend yang generate_batch-nya benar-benar menjalankan beberapa sequence bersamaan
+    # menimpa atribut ini; hanya backend seperti ini yang layak dibungkus BatchingScheduler
+    supports_concurrent_batch = False
+    
+    def generate_stream(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                        prompt_prefix: Optional[str] = None, grammar: Optional[str] = None):
+        """
+        Hasilkan teks sebagai potongan token secara bertahap.
+        Implementasi default tidak benar-benar streaming: seluruh output generate()
+        dikirim sebagai satu potongan. Backend yang mendukung streaming menimpa metode ini.
+        
+        Yields:
+            Potongan teks sesuai urutan dihasilkan model
+        """
+        yield self.generate(prompt, max_tokens=max_tokens, temperature=temperature,
+                            prompt_prefix=prompt_prefix, grammar=grammar)
+    
+    def generate_until(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                       stop_policy=None, prompt_prefix: Optional[str] = None,
+                       grammar: Optional[str] = None) -> str:
+        """
+        Generate secara streaming dan hentikan begitu stop_policy(teks) bernilai True
+        
+        Args:
+            prompt: Prompt untuk model
+            max_tokens: Jumlah token maksimum yang akan dihasilkan
+            temperature: Parameter temperature untuk sampling
+            stop_policy: Callable yang menerima teks sejauh ini dan mengembalikan True untuk berhenti
+            prompt_prefix: Bagian awal prompt yang sama antar jawaban
+            grammar: Grammar GBNF untuk membatasi output (jika backend mendukung)
+            
+        Returns:
+            Teks yang dihasilkan sampai titik berhenti
+        """
+        pieces = []
+        stream = self.generate_stream(prompt, max_tokens=max_tokens, temperature=temperature,
+                                      prompt_prefix=prompt_prefix, grammar=grammar)
+        try:
+            for piece in stream:
+                pieces.append(piece)
+                if stop_policy is not None and stop_policy("".join(pieces)):
+                    logger.info(f"Generasi dihentikan lebih awal setelah {len(pieces)} potongan token")
+                    break
+        finally:
+            # Menutup generator menghentikan decoding di backend (koneksi/stream ditutup)
+            stream.close()
+        return "".join(pieces).strip()
+    
+    async def agenerate(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                        prompt_prefix: Optional[str] = None, grammar: Optional[str] = None) -> str:
+        """
+        Versi async dari generate. Implementasi default menjalankan generate() di executor;
+        backend dengan koneksi non-blocking (llama-server, llama-run via asyncio subprocess)
+        menimpa metode ini.
+        """
+        return await run_blocking(self.generate, prompt, max_tokens=max_tokens, temperature=temperature,
+                                  prompt_prefix=prompt_prefix, grammar=grammar)
+    
+    async def agenerate_stream(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                               prompt_prefix: Optional[str] = None, grammar: Optional[str] = None):
+        """
+        Versi async dari generate_stream. Implementasi default mengirim seluruh output agenerate()
+        sebagai satu potongan.
+        
+        Yields:
+            Potongan teks sesuai urutan dihasilkan model
+        """
+        yield await self.agenerate(prompt, max_tokens=max_tokens, temperature=temperature,
+                                   prompt_prefix=prompt_prefix, grammar=grammar)
+    
+    async def agenerate_until(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                              stop_policy=None, prompt_prefix: Optional[str] = None,
+                              grammar: Optional[str] = None) -> str:
+        """Versi async dari generate_until di atas agenerate_stream"""
+        pieces = []
+        stream = self.agenerate_stream(prompt, max_tokens=max_tokens, temperature=temperature,
+                                       prompt_prefix=prompt_prefix, grammar=grammar)
+        try:
+            async for piece in stream:
+                pieces.append(piece)
+                if stop_policy is not None and stop_policy("".join(pieces)):
+                    logger.info(f"Generasi dihentikan lebih awal setelah {len(pieces)} potongan token")
+                    break
+        finally:
+            await stream.aclose()
+        return "".join(pieces).strip()
+    
+    def generate_batch(self, requests: List[Dict[str, Any]]) -> List[str]:
+        """
+        Jalankan beberapa permintaan generate sekaligus.
+        Implementasi default menjalankannya berurutan; backend yang mendukung
+        beberapa sequence paralel menimpa metode ini.
+        
+        Args:
+            requests: List dict berisi argumen generate (prompt, max_tokens, temperature, ...);
+                request dengan stop_policy dijalankan lewat generate_until
+            
+        Returns:
+            List teks hasil, urutannya sama dengan requests
+        """
+        return [self._run_request(request) for request in requests]
+    
+    def _run_request(self, request: Dict[str, Any]) -> str:
+        """Jalankan satu request generate_batch: generate_until jika ada stop_policy, selain itu generate"""
+        request = dict(request)
+        stop_policy = request.pop("stop_policy", None)
+        if stop_policy is not None:
+            return self.generate_until(stop_policy=stop_policy, **request)
+        return self.generate(**request)
+    
+    def generate_with_probs(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                            prompt_prefix: Optional[str] = None,
+                            grammar: Optional[str] = None) -> Tuple[str, Optional[List[Tuple[str, float]]]]:
+        """
+        Generate sekaligus probabilitas setiap token output
+        
+        Returns:
+            Tuple (teks, list (token, probabilitas)); probabilitas None jika backend
+            tidak menyediakannya
+        """
+        return self.generate(prompt, max_tokens=max_tokens, temperature=temperature,
+                             prompt_prefix=prompt_prefix, grammar=grammar), None
+    
+    def count_tokens(self, text: str) -> int:
+        """
+        Hitung jumlah token teks dengan tokenizer model.
+        Implementasi default hanya memperkirakan dari jumlah karakter; backend yang
+        memiliki akses ke tokenizer menimpa metode ini.
+        """
+        return estimate_tokens(text)
+    
+    @staticmethod
+    def _prefix_key(prompt_prefix: str) -> str:
+        """Kunci stabil untuk prefix prompt yang KV-cache-nya disimpan"""
+        return hashlib.sha1(prompt_prefix.encode("utf-8")).hexdigest()[:16]
+    
+    def _create_default_response(self, prompt: str) -> str:
+        """Buat respons default jika semua metode gagal"""
+        logger.warning("Membuat respons default karena semua metode gagal")
+        return self._default_response_text(prompt)
+    
+    @staticmethod
+    def _default_response_text(prompt: str) -> str:
+        """Teks respons default untuk prompt tertentu"""
+        # Cek apakah ini adalah prompt evaluasi
+        if "PERTANYAAN:" in prompt and "JAWABAN SISWA:" in prompt and "REFERENSI:" in prompt:
+            return """
+        1. Skor: 0
+
+        2. Kata kunci penting: (tidak tersedia)
+        """
+        else:
+            return "Maaf, tidak dapat menghasilkan respons untuk prompt ini."
+
+# Kelas untuk mengelola LLM dengan llama.cpp langsung
+class LlamaModelCpp(LLMBackend):
+    """Kelas untuk mengelola model Llama menggunakan llama.cpp"""
+    
+    def __init__(self, model_path: str, llama_path: str = None, n_gpu_layers: int = 999, ctx_size: int = 16384,
+                 seed: Optional[int] = None):
+        """
+        Inisialisasi model Llama dengan llama.cpp
+        
+        Args:
+            model_path: Path ke file model GGUF
+            llama_path: Path ke binary llama-run.exe
+            n_gpu_layers: Jumlah layer yang akan dijalankan di GPU
+            ctx_size: Ukuran konteks maksimum
+            seed: Seed sampling; llama-run tidak menerima seed sehingga hasil hanya
+                deterministik dengan temperature 0 (greedy)
+        """
+        self.model_path = model_path
+        self.n_gpu_layers = n_gpu_layers
+        self.ctx_size = ctx_size
+        self.seed = seed
+        if seed is not None:
+            logger.warning("llama-run tidak mendukung seed; gunakan temperature 0 untuk hasil deterministik")
+        
+        # Cari llama-run.exe jika tidak disediakan
+        if llama_path is None:
             # Coba cari di lokasi default
             default_paths = [
                 os.path.join(current_dir, "llama.cpp", "build", "bin", "Release", "llama-run.exe"),
@@ -824,141 +1851,2840 @@ class LlamaModelCpp:
         logger.info(f"Model path: {self.model_path}")
         logger.info(f"Konfigurasi: GPU Layers={self.n_gpu_layers}, Context Size={self.ctx_size}")
     
-    def generate(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7) -> str:
+    def generate(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                 prompt_prefix: Optional[str] = None, grammar: Optional[str] = None) -> str:
+        """
+        Menghasilkan teks dari model berdasarkan prompt menggunakan llama-run
+        
+        Args:
+            prompt: Prompt untuk model
+            max_tokens: Jumlah token maksimum yang akan dihasilkan
+            temperature: Parameter temperature untuk sampling
+            prompt_prefix: Diabaikan; llama-run tidak menyimpan KV-cache antar proses
+            grammar: Diabaikan; llama-run tidak mendukung grammar (supports_grammar = False)
+            
+        Returns:
+            Teks yang dihasilkan
+        """
+        try:
+            cmd = self._build_command(prompt, max_tokens, temperature)
+            start_time = time.time()
+            
+            # Jalankan proses dengan timeout yang cukup
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+            
+            elapsed = time.time() - start_time
+            logger.info(f"Inferensi selesai dalam {elapsed:.2f} detik")
+            
+            if result.returncode != 0:
+                logger.error(f"Error saat menjalankan llama-run: {result.stderr}")
+                # Coba cara alternatif jika gagal
+                return self._generate_alternative(prompt, max_tokens, temperature)
+            
+            output = self._extract_output(prompt, result.stdout)
+            
+            # Jika output kosong, coba cara alternatif
+            if not output:
+                logger.warning("Output kosong, mencoba cara alternatif...")
+                return self._generate_alternative(prompt, max_tokens, temperature)
+                
+            return output
+            
+        except subprocess.TimeoutExpired:
+            logger.error("Timeout saat menjalankan llama-run, mencoba cara alternatif...")
+            return self._generate_alternative(prompt, max_tokens, temperature)
+        except Exception as e:
+            logger.error(f"Error saat menghasilkan teks: {e}")
+            return self._generate_alternative(prompt, max_tokens, temperature)
+    
+    async def agenerate(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                        prompt_prefix: Optional[str] = None, grammar: Optional[str] = None) -> str:
+        """
+        Versi async dari generate: llama-run dijalankan sebagai asyncio subprocess sehingga
+        tidak ada thread yang tertahan selama inferensi. Cara alternatif tetap lewat executor.
+        """
+        try:
+            cmd = self._build_command(prompt, max_tokens, temperature)
+            start_time = time.time()
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=300)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                logger.error("Timeout saat menjalankan llama-run, mencoba cara alternatif...")
+                return await run_blocking(self._generate_alternative, prompt, max_tokens, temperature)
+            
+            logger.info(f"Inferensi selesai dalam {time.time() - start_time:.2f} detik")
+            if process.returncode != 0:
+                logger.error(f"Error saat menjalankan llama-run: {stderr.decode('utf-8', errors='replace')}")
+                return await run_blocking(self._generate_alternative, prompt, max_tokens, temperature)
+            
+            output = self._extract_output(prompt, stdout.decode("utf-8", errors="replace"))
+            if not output:
+                logger.warning("Output kosong, mencoba cara alternatif...")
+                return await run_blocking(self._generate_alternative, prompt, max_tokens, temperature)
+            return output
+        except Exception as e:
+            logger.error(f"Error saat menghasilkan teks: {e}")
+            return await run_blocking(self._generate_alternative, prompt, max_tokens, temperature)
+    
+    def _build_command(self, prompt: str, max_tokens: int, temperature: float) -> List[str]:
+        """Susun perintah llama-run dengan prompt sebagai argumen"""
+        # Setiap proses llama-run mengalokasikan KV-cache sendiri, jadi pakai konteks
+        # terkecil yang cukup untuk prompt + output, bukan selalu ctx_size maksimum
+        ctx_size = select_context_size(self.count_tokens(prompt) + max_tokens, self.ctx_size)
+        logger.info(f"Menjalankan llama-run dengan {max_tokens} token maksimum (konteks {ctx_size})...")
+        
+        # Gunakan prompt langsung seperti di gpu_test.py
+        # Perhatikan bahwa llama-run mengharapkan prompt sebagai argumen terakhir
+        return [
+            self.llama_path,
+            "--ngl", str(self.n_gpu_layers),  # offload layer ke GPU
+            "-c", str(ctx_size),             # context size
+            "-n", str(max_tokens),           # max tokens
+            "--temp", str(temperature),     # temperature (-t adalah jumlah thread)
+            self.model_path,                # path ke model
+            prompt                          # prompt langsung setelah model
+        ]
+    
+    @staticmethod
+    def _extract_output(prompt: str, stdout: str) -> str:
+        """Ambil teks hasil dari stdout llama-run"""
+        output = stdout.strip()
+        
+        # Hapus prompt dari output jika ada
+        if output.startswith(prompt):
+            output = output[len(prompt):].strip()
+        return output
+            
+    def _generate_alternative(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7) -> str:
+        """
+        Metode alternatif untuk menghasilkan teks jika cara utama gagal
+        """
+        try:
+            # Simpan prompt ke file sementara
+            with tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', delete=False, suffix='.txt') as temp_file:
+                temp_file.write(prompt)
+                temp_file_path = temp_file.name
+            
+            # Gunakan pendekatan dengan file prompt
+            ctx_size = select_context_size(self.count_tokens(prompt) + max_tokens, self.ctx_size)
+            cmd = [
+                self.llama_path,
+                "--ngl", str(self.n_gpu_layers),
+                "-c", str(ctx_size),
+                "-n", str(max_tokens),
+                "--temp", str(temperature),
+                "-f", temp_file_path,
+                self.model_path
+            ]
+            
+            logger.info("Mencoba metode alternatif dengan file prompt...")
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+            
+            # Hapus file sementara
+            try:
+                os.unlink(temp_file_path)
+            except:
+                pass
+            
+            if result.returncode != 0:
+                logger.error(f"Metode alternatif juga gagal: {result.stderr}")
+                # Buat respons default
+                return self._create_default_response(prompt)
+            
+            output = result.stdout.strip()
+            
+            # Jika output kosong, buat respons default
+            if not output:
+                return self._create_default_response(prompt)
+                
+            return output
+            
+        except Exception as e:
+            logger.error(f"Error pada metode alternatif: {e}")
+            return self._create_default_response(prompt)
+
+# Kelas untuk mengelola LLM melalui proses llama-server yang berjalan terus
+class LlamaServerModel(LLMBackend):
+    """
+    Kelas untuk mengelola model Llama melalui satu proses llama-server yang persisten.
+    Model GGUF hanya dimuat sekali saat startup; setiap generate() dikirim lewat
+    koneksi HTTP lokal (keep-alive) sehingga tidak ada biaya load model per jawaban.
+    """
+    
+    supports_grammar = True
+    supports_token_probs = True
+    supports_concurrent_batch = True
+    
+    def __init__(
+        self,
+        model_path: str,
+        server_path: str = None,
+        n_gpu_layers: int = 999,
+        ctx_size: int = 16384,
+        host: str = "127.0.0.1",
+        port: int = 8089,
+        n_parallel: int = 1,
+        start_server: bool = True,
+        startup_timeout: float = 300.0,
+        request_timeout: float = 300.0,
+        health_check_interval: float = 30.0,
+        max_restarts: int = 3,
+        extra_args: Optional[List[str]] = None,
+        slot_save_path: Optional[str] = None,
+        cpu_cores: Optional[List[int]] = None,
+        seed: Optional[int] = None
+    ):
+        """
+        Inisialisasi backend llama-server
+        
+        Args:
+            model_path: Path ke file model GGUF
+            server_path: Path ke binary llama-server(.exe)
+            n_gpu_layers: Jumlah layer yang akan dijalankan di GPU
+            ctx_size: Ukuran konteks maksimum
+            host: Alamat host server lokal
+            port: Port server lokal
+            n_parallel: Jumlah slot paralel pada server
+            start_server: Jika False, hanya terhubung ke server yang sudah berjalan di host:port
+            startup_timeout: Batas waktu (detik) menunggu server siap
+            request_timeout: Batas waktu (detik) untuk satu request generate
+            health_check_interval: Interval minimal (detik) antar health check sebelum request
+            max_restarts: Jumlah maksimum restart otomatis berturut-turut sebelum menyerah
+            extra_args: Argumen tambahan untuk llama-server
+            slot_save_path: Direktori untuk menyimpan KV-cache prefix prompt ke disk
+                (diteruskan sebagai --slot-save-path); None = prefix hanya di-cache di slot
+            cpu_cores: Daftar core CPU tempat proses server dipatok (None = tanpa pinning);
+                jumlah thread server disamakan dengan jumlah core
+            seed: Seed sampling yang dikirim di setiap request (None = acak)
+        """
+        self.model_path = model_path
+        self.n_gpu_layers = n_gpu_layers
+        self.ctx_size = ctx_size
+        self.host = host
+        self.port = port
+        self.n_parallel = max(1, n_parallel)
+        self.start_server = start_server
+        self.startup_timeout = startup_timeout
+        self.request_timeout = request_timeout
+        self.health_check_interval = health_check_interval
+        self.max_restarts = max_restarts
+        self.extra_args = list(extra_args or [])
+        self.slot_save_path = slot_save_path
+        self.cpu_cores = list(cpu_cores) if cpu_cores else None
+        self.seed = seed
+        
+        # Prefix yang KV-cache-nya ada di setiap slot, dan slot yang sedang tidak dipinjam request
+        # (urut dari yang paling lama dilepas). Setiap request dipatok ke slot yang dipinjamnya agar
+        # request tanpa prefix tidak diletakkan server di slot yang sedang menyiapkan prefix
+        self._slot_prefix: Dict[int, str] = {}
+        self._free_slots: List[int] = list(range(self.n_parallel))
+        self._saved_prefixes = set()
+        self._prefix_lock = threading.Condition()
+        
+        self.process = None
+        self.restart_count = 0
+        self._last_health_check = 0.0
+        self._server_lock = threading.RLock()
+        self._local = threading.local()
+        self._log_file = None
+        self._batch_executor = None
+        
+        if self.start_server:
+            # Cari llama-server jika tidak disediakan
+            if server_path is None:
+                default_paths = [
+                    os.path.join(current_dir, "llama.cpp", "build", "bin", "Release", "llama-server.exe"),
+                    os.path.join(current_dir, "llama.cpp", "build", "bin", "llama-server.exe"),
+                    os.path.join(current_dir, "llama.cpp", "build", "bin", "llama-server"),
+                    os.path.join(current_dir.parent, "llama.cpp", "build", "bin", "Release", "llama-server.exe")
+                ]
+                for path in default_paths:
+                    if os.path.exists(path):
+                        server_path = path
+                        break
+            
+            if not server_path or not os.path.exists(server_path):
+                logger.error("Path ke llama-server tidak ditemukan. Harap tentukan path yang benar.")
+                sys.exit(1)
+        
+        self.server_path = server_path
+        logger.info(f"Menggunakan llama-server di http://{self.host}:{self.port}")
+        logger.info(f"Model path: {self.model_path}")
+        logger.info(f"Konfigurasi: GPU Layers={self.n_gpu_layers}, Context Size={self.ctx_size}, Slot={self.n_parallel}")
+        
+        if self.start_server:
+            self._start_server()
+            atexit.register(self.close)
+        elif not self._wait_until_ready(self.startup_timeout):
+            logger.error(f"llama-server di {self.host}:{self.port} tidak merespons")
+    
+    def _build_server_command(self) -> List[str]:
+        """Susun argumen command line untuk llama-server"""
+        cmd = [
+            self.server_path,
+            "-m", self.model_path,
+            "-ngl", str(self.n_gpu_layers),
+            "-c", str(self.ctx_size),
+            "--host", self.host,
+            "--port", str(self.port),
+            "--parallel", str(self.n_parallel)
+        ]
+        if self.slot_save_path:
+            os.makedirs(self.slot_save_path, exist_ok=True)
+            cmd += ["--slot-save-path", self.slot_save_path]
+        if self.cpu_cores:
+            cmd += ["--threads", str(len(self.cpu_cores))]
+        return cmd + self.extra_args
+    
+    def _apply_cpu_affinity(self):
+        """Patok proses server ke cpu_cores (Windows/macOS lewat psutil setelah proses dibuat)"""
+        if not self.cpu_cores or self.process is None or hasattr(os, "sched_setaffinity"):
+            return
+        try:
+            import psutil
+            psutil.Process(self.process.pid).cpu_affinity(self.cpu_cores)
+        except Exception as e:
+            logger.warning(f"Gagal mematok llama-server ke core {self.cpu_cores}: {e}")
+    
+    def _start_server(self):
+        """Jalankan proses llama-server dan tunggu sampai siap menerima request"""
+        with self._server_lock:
+            cmd = self._build_server_command()
+            log_path = os.path.join(tempfile.gettempdir(), f"llama-server-{self.port}.log")
+            if self._log_file is None:
+                self._log_file = open(log_path, "ab")
+            
+            logger.info(f"Menjalankan llama-server (log: {log_path})...")
+            start_time = time.time()
+            popen_kwargs = {}
+            if self.cpu_cores and hasattr(os, "sched_setaffinity"):
+                # Linux: affinity diset sebelum exec agar diwarisi semua thread server
+                cores = set(self.cpu_cores)
+                popen_kwargs["preexec_fn"] = lambda: os.sched_setaffinity(0, cores)
+            self.process = subprocess.Popen(
+                cmd,
+                stdout=self._log_file,
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL,
+                **popen_kwargs
+            )
+            self._apply_cpu_affinity()
+            
+            if not self._wait_until_ready(self.startup_timeout):
+                logger.error("llama-server gagal siap dalam batas waktu startup")
+                return False
+            
+            elapsed = time.time() - start_time
+            logger.info(f"llama-server siap dalam {elapsed:.2f} detik (PID {self.process.pid})")
+            return True
+    
+    def _stop_server(self):
+        """Hentikan proses llama-server jika masih berjalan"""
+        with self._server_lock:
+            if self.process is not None and self.process.poll() is None:
+                self.process.terminate()
+                try:
+                    self.process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+            self.process = None
+    
+    def restart(self) -> bool:
+        """Restart proses llama-server (dipanggil otomatis saat server mati/tidak sehat)"""
+        with self._server_lock:
+            if not self.start_server:
+                return self._wait_until_ready(self.startup_timeout)
+            if self.restart_count >= self.max_restarts:
+                logger.error(f"llama-server sudah direstart {self.restart_count} kali, tidak mencoba lagi")
+                return False
+            self.restart_count += 1
+            logger.warning(f"Merestart llama-server (percobaan {self.restart_count}/{self.max_restarts})...")
+            self._stop_server()
+            # KV-cache di slot hilang bersama proses lama; file di slot_save_path tetap bisa dipulihkan
+            with self._prefix_lock:
+                self._slot_prefix.clear()
+            return self._start_server()
+    
+    def close(self):
+        """Hentikan server dan tutup koneksi milik thread saat ini"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+        if self._batch_executor is not None:
+            self._batch_executor.shutdown(wait=False)
+            self._batch_executor = None
+        if self.start_server:
+            self._stop_server()
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+    
+    def _get_connection(self) -> http.client.HTTPConnection:
+        """Ambil koneksi HTTP keep-alive milik thread saat ini"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.request_timeout)
+            self._local.connection = connection
+        return connection
+    
+    def _reset_connection(self):
+        """Tutup koneksi thread saat ini agar dibuat ulang pada request berikutnya"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+        self._local.connection = None
+    
+    def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Tuple[int, Dict[str, Any]]:
+        """
+        Kirim request HTTP ke server lewat koneksi keep-alive
+        
+        Returns:
+            Tuple (status HTTP, body JSON)
+        """
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        
+        # Satu kali percobaan ulang jika koneksi keep-alive sudah ditutup server
+        for attempt in range(2):
+            connection = self._get_connection()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                raw = response.read()
+                data = json.loads(raw.decode("utf-8")) if raw else {}
+                return response.status, data
+            except (http.client.HTTPException, ConnectionError, OSError):
+                self._reset_connection()
+                if attempt == 1:
+                    raise
+        return 0, {}
+    
+    def _stream_request(self, path: str, payload: Dict[str, Any]):
+        """
+        Kirim request streaming dan hasilkan event SSE ('data: {...}') satu per satu.
+        Jika pembacaan dihentikan sebelum selesai, koneksi ditutup sehingga server
+        membatalkan decoding yang tersisa.
+        """
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Accept": "text/event-stream"}
+        connection = self._get_connection()
+        finished = False
+        try:
+            try:
+                connection.request("POST", path, body=body, headers=headers)
+                response = connection.getresponse()
+            except (http.client.HTTPException, ConnectionError, OSError):
+                # Koneksi keep-alive mungkin sudah ditutup server, coba sekali lagi
+                self._reset_connection()
+                connection = self._get_connection()
+                connection.request("POST", path, body=body, headers=headers)
+                response = connection.getresponse()
+            
+            if response.status != 200:
+                raw = response.read()
+                finished = True
+                raise RuntimeError(f"llama-server mengembalikan status {response.status}: {raw[:200]!r}")
+            
+            while True:
+                line = response.readline()
+                if not line:
+                    finished = True
+                    break
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):].strip())
+                yield event
+                if event.get("stop"):
+                    response.read()
+                    finished = True
+                    break
+        finally:
+            if not finished:
+                self._reset_connection()
+    
+    def generate_stream(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                        prompt_prefix: Optional[str] = None, grammar: Optional[str] = None):
+        """
+        Hasilkan token dari llama-server secara streaming (SSE)
+        
+        Yields:
+            Potongan teks sesuai urutan dihasilkan model
+        """
+        if not self._ensure_server():
+            yield self._create_default_response(prompt)
+            return
+        try:
+            yield from self.try_generate_stream(prompt, max_tokens=max_tokens, temperature=temperature,
+                                                prompt_prefix=prompt_prefix, grammar=grammar)
+        except Exception as e:
+            logger.error(f"Error saat streaming dari llama-server: {e}")
+            # Jatuh ke generate biasa yang punya health check dan restart otomatis
+            yield self.generate(prompt, max_tokens=max_tokens, temperature=temperature,
+                                prompt_prefix=prompt_prefix, grammar=grammar)
+    
+    def try_generate_stream(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                            prompt_prefix: Optional[str] = None, grammar: Optional[str] = None):
+        """
+        Seperti generate_stream, tetapi kegagalan sebelum potongan pertama dilempar sebagai
+        exception (tanpa fallback) sehingga LlamaWorkerPool bisa mengalihkan request ke worker lain.
+        Kegagalan setelah potongan pertama hanya dicatat dan stream berhenti.
+        
+        Yields:
+            Potongan teks sesuai urutan dihasilkan model
+        """
+        if not self._ensure_server():
+            raise ConnectionError(f"llama-server di {self.host}:{self.port} tidak tersedia")
+        
+        payload = self._completion_payload(prompt, max_tokens, temperature, grammar, stream=True)
+        yielded = False
+        slot = None
+        try:
+            slot = self._acquire_slot(prompt, prompt_prefix)
+            payload["id_slot"] = slot
+            
+            for event in self._stream_request("/completion", payload):
+                content = self._stream_content(event)
+                if content:
+                    yielded = True
+                    yield content
+        except Exception as e:
+            self._last_health_check = 0.0
+            if not yielded:
+                raise
+            logger.error(f"Error saat streaming dari llama-server: {e}")
+        finally:
+            # Juga dijalankan saat pemanggil menutup stream (early stop)
+            if slot is not None:
+                self._release_slot(slot)
+    
+    @staticmethod
+    def _stream_content(event: Dict[str, Any]) -> str:
+        """Potongan teks dari satu event SSE /completion"""
+        content = event.get("content", "")
+        if content:
+            # Setiap event SSE membawa satu token
+            record_stage_timing("generated_tokens", 1)
+        return content
+    
+    def _open_stream(self, prompt: str, **kwargs):
+        """
+        Buka try_generate_stream dan ambil potongan pertamanya (dipakai failover LlamaWorkerPool)
+        
+        Returns:
+            Tuple (stream, potongan pertama atau "" jika output kosong)
+        """
+        stream = self.try_generate_stream(prompt, **kwargs)
+        try:
+            return stream, next(stream, "")
+        except BaseException:
+            stream.close()
+            raise
+    
+    async def _aopen_stream(self, prompt: str, **kwargs):
+        """Versi async dari _open_stream di atas atry_generate_stream"""
+        stream = self.atry_generate_stream(prompt, **kwargs)
+        try:
+            return stream, await stream.__anext__()
+        except StopAsyncIteration:
+            return stream, ""
+        except BaseException:
+            await stream.aclose()
+            raise
+    
+    def count_tokens(self, text: str) -> int:
+        """Hitung token lewat endpoint /tokenize (ditambah satu untuk BOS)"""
+        try:
+            status, data = self._request("POST", "/tokenize", {"content": text})
+            if status == 200 and isinstance(data.get("tokens"), list):
+                return len(data["tokens"]) + 1
+        except Exception as e:
+            logger.warning(f"Gagal menghitung token lewat llama-server: {e}")
+        return estimate_tokens(text)
+    
+    def is_healthy(self) -> bool:
+        """Health check ke endpoint /health milik llama-server"""
+        if self.start_server and (self.process is None or self.process.poll() is not None):
+            return False
+        try:
+            status, data = self._request("GET", "/health")
+            return status == 200 and data.get("status", "ok") == "ok"
+        except Exception:
+            return False
+    
+    def _wait_until_ready(self, timeout: float) -> bool:
+        """Tunggu sampai /health melaporkan server siap"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.start_server and self.process is not None and self.process.poll() is not None:
+                logger.error(f"llama-server berhenti saat startup (exit code {self.process.returncode})")
+                return False
+            if self.is_healthy():
+                self._last_health_check = time.time()
+                return True
+            time.sleep(0.5)
+        return False
+    
+    def _health_check_due(self) -> bool:
+        """True jika proses server mati atau health check terakhir sudah kedaluwarsa"""
+        process_dead = self.start_server and (self.process is None or self.process.poll() is not None)
+        return process_dead or time.time() - self._last_health_check >= self.health_check_interval
+    
+    def _ensure_server(self) -> bool:
+        """Pastikan server hidup dan sehat sebelum mengirim prompt, restart jika perlu"""
+        if not self._health_check_due():
+            return True
+        
+        if self.is_healthy():
+            self._last_health_check = time.time()
+            return True
+        
+        logger.warning("llama-server tidak sehat atau berhenti")
+        return self.restart()
+    
+    def _acquire_slot(self, prompt: str, prompt_prefix: Optional[str] = None) -> int:
+        """
+        Pinjam slot server untuk satu request. Request ber-prefix lewat _acquire_prefix_slot;
+        request lain memakai slot kosong yang tidak memegang prefix bila ada, dan jika terpaksa
+        menimpa slot ber-prefix, slot itu tidak lagi dianggap memegang prefix tersebut.
+        
+        Returns:
+            Indeks slot (kembalikan dengan _release_slot)
+        """
+        if prompt_prefix and prompt.startswith(prompt_prefix):
+            return self._acquire_prefix_slot(prompt_prefix)
+        with self._prefix_lock:
+            while not self._free_slots:
+                self._prefix_lock.wait()
+            slot = next((free for free in self._free_slots if free not in self._slot_prefix), self._free_slots[0])
+            self._free_slots.remove(slot)
+            self._slot_prefix.pop(slot, None)
+        return slot
+    
+    async def _aacquire_slot(self, prompt: str, prompt_prefix: Optional[str] = None) -> int:
+        """Versi async dari _acquire_slot; menunggu slot dan memuat prefix dijalankan di executor"""
+        future = asyncio.ensure_future(run_blocking(self._acquire_slot, prompt, prompt_prefix))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Slot yang tetap didapat setelah task dibatalkan dikembalikan ke pool
+            future.add_done_callback(
+                lambda done: done.cancelled() or done.exception() is not None or self._release_slot(done.result())
+            )
+            raise
+    
+    def _acquire_prefix_slot(self, prompt_prefix: str) -> int:
+        """
+        Pinjam satu slot server yang sedang kosong untuk request ber-prefix dan pastikan KV-cache
+        prefix tersedia di slot itu. Slot yang sudah memegang prefix yang sama diutamakan; jika
+        tidak ada, prefix dipulihkan dari disk (slot_save_path) atau dievaluasi ulang di slot
+        kosong mana pun, sehingga request dengan prefix yang sama tetap tersebar ke semua slot.
+        Slot dipegang sampai _release_slot, jadi prefix lain tidak bisa dipulihkan ke slot
+        tersebut sebelum /completion milik pemanggil dikirim.
+        """
+        key = self._prefix_key(prompt_prefix)
+        with self._prefix_lock:
+            while not self._free_slots:
+                self._prefix_lock.wait()
+            slot = next(
+                (free for free in self._free_slots if self._slot_prefix.get(free) == key),
+                next((free for free in self._free_slots if free not in self._slot_prefix), self._free_slots[0])
+            )
+            self._free_slots.remove(slot)
+            if self._slot_prefix.get(slot) == key:
+                return slot
+            # Isi slot akan ditimpa; jangan sampai dianggap masih memegang prefix lama
+            self._slot_prefix.pop(slot, None)
+            saved = key in self._saved_prefixes
+        
+        # Request HTTP (restore/prefill) dijalankan di luar lock agar slot lain tetap bisa dipinjam
+        try:
+            self._load_prefix(slot, key, prompt_prefix, saved)
+        except Exception:
+            self._release_slot(slot)
+            raise
+        return slot
+    
+    def _release_slot(self, slot: int):
+        with self._prefix_lock:
+            self._free_slots.append(slot)
+            self._prefix_lock.notify()
+    
+    def _load_prefix(self, slot: int, key: str, prompt_prefix: str, saved: bool):
+        """
+        Muat KV-cache prefix ke slot yang sedang dipinjam. Prefix dievaluasi sekali (n_predict=0)
+        lalu, jika slot_save_path diatur, disimpan ke disk dan berikutnya cukup dipulihkan.
+        """
+        filename = f"aes-prefix-{key}.bin"
+        if self.slot_save_path and saved:
+            status, _ = self._request("POST", f"/slots/{slot}?action=restore", {"filename": filename})
+            if status == 200:
+                logger.info(f"KV-cache prefix {key} dipulihkan ke slot {slot}")
+                with self._prefix_lock:
+                    self._slot_prefix[slot] = key
+                return
+        
+        start_time = time.time()
+        status, _ = self._request("POST", "/completion", {
+            "prompt": prompt_prefix,
+            "n_predict": 0,
+            "cache_prompt": True,
+            "id_slot": slot
+        })
+        if status != 200:
+            logger.warning(f"Gagal mengevaluasi prefix prompt di slot {slot} (status {status})")
+            return
+        logger.info(f"Prefix prompt {key} dievaluasi di slot {slot} dalam {time.time() - start_time:.2f} detik")
+        with self._prefix_lock:
+            self._slot_prefix[slot] = key
+        
+        if self.slot_save_path and not saved:
+            status, _ = self._request("POST", f"/slots/{slot}?action=save", {"filename": filename})
+            if status == 200:
+                with self._prefix_lock:
+                    self._saved_prefixes.add(key)
+    
+    def generate_batch(self, requests: List[Dict[str, Any]]) -> List[str]:
+        """
+        Kirim beberapa prompt secara bersamaan ke slot-slot llama-server.
+        Server menggabungkan sequence yang aktif ke satu batch decoding (continuous batching).
+        Request dengan prompt_prefix meminjam slot yang sudah memegang KV-cache prefix-nya.
+        
+        Args:
+            requests: List dict berisi argumen generate
+            
+        Returns:
+            List teks hasil, urutannya sama dengan requests
+        """
+        if len(requests) <= 1:
+            return [self._run_request(request) for request in requests]
+        
+        with self._server_lock:
+            if self._batch_executor is None:
+                self._batch_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.n_parallel,
+                    thread_name_prefix="llama-server-slot"
+                )
+        futures = [self._batch_executor.submit(self._run_request, request) for request in requests]
+        return [future.result() for future in futures]
+    
+    def generate(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                 prompt_prefix: Optional[str] = None, grammar: Optional[str] = None) -> str:
+        """
+        Menghasilkan teks dari model berdasarkan prompt menggunakan llama-server
+        
+        Args:
+            prompt: Prompt untuk model
+            max_tokens: Jumlah token maksimum yang akan dihasilkan
+            temperature: Parameter temperature untuk sampling
+            prompt_prefix: Bagian awal prompt yang sama antar jawaban; KV-cache-nya disimpan
+                per slot sehingga hanya sufiks yang di-prefill
+            grammar: Grammar GBNF yang membatasi token yang boleh dihasilkan
+            
+        Returns:
+            Teks yang dihasilkan
+        """
+        output = self.try_generate(prompt, max_tokens=max_tokens, temperature=temperature,
+                                   prompt_prefix=prompt_prefix, grammar=grammar)
+        if not output:
+            return self._create_default_response(prompt)
+        return output
+    
+    def try_generate(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                     prompt_prefix: Optional[str] = None, grammar: Optional[str] = None) -> Optional[str]:
+        """
+        Sama seperti generate(), tetapi mengembalikan None jika server gagal dihubungi
+        (bukan respons default) sehingga pemanggil seperti LlamaWorkerPool bisa mengalihkan
+        request ke worker lain. Output kosong dikembalikan sebagai string kosong.
+        """
+        return self._completion_output(self._try_completion(prompt, max_tokens, temperature, prompt_prefix, grammar))
+    
+    def generate_with_probs(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                            prompt_prefix: Optional[str] = None,
+                            grammar: Optional[str] = None) -> Tuple[str, Optional[List[Tuple[str, float]]]]:
+        """Generate dengan probabilitas setiap token (n_probs=1 pada /completion)"""
+        result = self.try_generate_with_probs(prompt, max_tokens=max_tokens, temperature=temperature,
+                                              prompt_prefix=prompt_prefix, grammar=grammar)
+        if result is None or not result[0]:
+            return self._create_default_response(prompt), None
+        return result
+    
+    def try_generate_with_probs(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                                prompt_prefix: Optional[str] = None,
+                                grammar: Optional[str] = None) -> Optional[Tuple[str, Optional[List[Tuple[str, float]]]]]:
+        """Seperti generate_with_probs, tetapi None jika server gagal dihubungi (output kosong tetap "")"""
+        data = self._try_completion(prompt, max_tokens, temperature, prompt_prefix, grammar, n_probs=1)
+        if data is None:
+            return None
+        output = str(data.get("content", "")).strip()
+        return output, self._parse_token_probs(data.get("completion_probabilities")) if output else None
+    
+    @staticmethod
+    def _parse_token_probs(entries: Optional[List[Dict[str, Any]]]) -> Optional[List[Tuple[str, float]]]:
+        """
+        Ambil (token, probabilitas) dari completion_probabilities.
+        Versi llama-server baru mengirim logprob per token; versi lama mengirim daftar probs.
+        """
+        if not entries:
+            return None
+        tokens = []
+        for entry in entries:
+            if "logprob" in entry:
+                tokens.append((entry.get("token", ""), math.exp(entry["logprob"])))
+                continue
+            content = entry.get("content", "")
+            prob = 0.0
+            for candidate in entry.get("probs", []):
+                if candidate.get("tok_str") == content:
+                    prob = candidate.get("prob", 0.0)
+                    break
+            tokens.append((content, prob))
+        return tokens
+    
+    def _completion_payload(self, prompt: str, max_tokens: int, temperature: float,
+                            grammar: Optional[str] = None, n_probs: int = 0, stream: bool = False) -> Dict[str, Any]:
+        """Body request /completion (tanpa id_slot, yang diisi setelah slot dipinjam)"""
+        payload = {
+            "prompt": prompt,
+            "n_predict": max_tokens,
+            "temperature": temperature,
+            "cache_prompt": True
+        }
+        if stream:
+            payload["stream"] = True
+        if grammar:
+            payload["grammar"] = grammar
+        if self.seed is not None:
+            payload["seed"] = self.seed
+        if n_probs:
+            payload["n_probs"] = n_probs
+        return payload
+    
+    def _try_completion(self, prompt: str, max_tokens: int, temperature: float,
+                        prompt_prefix: Optional[str] = None, grammar: Optional[str] = None,
+                        n_probs: int = 0) -> Optional[Dict[str, Any]]:
+        """Kirim satu request /completion dengan health check dan satu kali percobaan ulang"""
+        return run_steps(self._completion_steps(prompt, max_tokens, temperature, prompt_prefix, grammar, n_probs))
+    
+    def _completion_steps(self, prompt: str, max_tokens: int, temperature: float, prompt_prefix: Optional[str],
+                          grammar: Optional[str], n_probs: int):
+        """Alur _try_completion/_atry_completion sebagai generator langkah (lihat run_steps)"""
+        payload = self._completion_payload(prompt, max_tokens, temperature, grammar, n_probs)
+        for attempt in range(2):
+            if not (yield step_call(self, "_ensure_server")):
+                break
+            slot = None
+            try:
+                slot = yield step_call(self, "_acquire_slot", prompt, prompt_prefix)
+                payload["id_slot"] = slot
+                logger.info(f"Mengirim prompt ke llama-server dengan {max_tokens} token maksimum...")
+                start_time = time.time()
+                status, data = yield step_call(self, "_request", "POST", "/completion", payload)
+                elapsed = time.time() - start_time
+                
+                if status == 200:
+                    logger.info(f"Inferensi selesai dalam {elapsed:.2f} detik")
+                    self.restart_count = 0
+                    record_stage_timing("generated_tokens", data.get("tokens_predicted", 0))
+                    return data
+                
+                logger.error(f"llama-server mengembalikan status {status}: {data}")
+            except Exception as e:
+                logger.error(f"Error saat menghubungi llama-server: {e}")
+            finally:
+                if slot is not None:
+                    self._release_slot(slot)
+            
+            # Paksa health check ulang sebelum percobaan berikutnya
+            self._last_health_check = 0.0
+        
+        return None
+    
+    @staticmethod
+    def _completion_output(data: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Teks output dari respons /completion; None jika request gagal"""
+        if data is None:
+            return None
+        output = str(data.get("content", "")).strip()
+        if not output:
+            logger.warning("Output kosong dari llama-server")
+        return output
+    
+    async def _aensure_server(self) -> bool:
+        """Versi async dari _ensure_server; health check/restart (jarang) dijalankan di executor"""
+        if not self._health_check_due():
+            return True
+        return await run_blocking(self._ensure_server)
+    
+    async def _aopen(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+                     accept: str = "application/json"):
+        """
+        Buka koneksi asyncio ke server, kirim satu request HTTP/1.1 lalu baca status dan header
+        
+        Returns:
+            Tuple (reader, writer, status HTTP, header dengan nama huruf kecil)
+        """
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+            request_head = (
+                f"{method} {path} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Accept: {accept}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n"
+            )
+            writer.write(request_head.encode("ascii") + body)
+            await writer.drain()
+            
+            status_line = (await reader.readline()).decode("latin-1").strip()
+            parts = status_line.split(" ", 2)
+            if len(parts) < 2 or not parts[1].isdigit():
+                raise ConnectionError(f"Respons HTTP tidak valid dari llama-server: {status_line!r}")
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            return reader, writer, int(parts[1]), headers
+        except BaseException:
+            writer.close()
+            raise
+    
+    @staticmethod
+    async def _aiter_body(reader: asyncio.StreamReader, headers: Dict[str, str]):
+        """Hasilkan body respons per potongan (chunked, Content-Length, atau sampai koneksi ditutup)"""
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            while True:
+                size_line = (await reader.readline()).decode("latin-1").strip()
+                size = int(size_line.split(";", 1)[0] or "0", 16)
+                if size == 0:
+                    await reader.readline()
+                    return
+                chunk = await reader.readexactly(size)
+                await reader.readline()
+                yield chunk
+        elif "content-length" in headers:
+            remaining = int(headers["content-length"])
+            if remaining:
+                yield await reader.readexactly(remaining)
+        else:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    return
+                yield chunk
+    
+    async def _arequest(self, method: str, path: str,
+                        payload: Optional[Dict[str, Any]] = None) -> Tuple[int, Dict[str, Any]]:
+        """
+        Versi async dari _request: satu koneksi asyncio per request, tanpa menahan thread
+        
+        Returns:
+            Tuple (status HTTP, body JSON)
+        """
+        async def send():
+            reader, writer, status, headers = await self._aopen(method, path, payload)
+            try:
+                raw = b"".join([chunk async for chunk in self._aiter_body(reader, headers)])
+            finally:
+                writer.close()
+            return status, json.loads(raw.decode("utf-8")) if raw else {}
+        
+        return await asyncio.wait_for(send(), timeout=self.request_timeout)
+    
+    async def _astream_request(self, path: str, payload: Dict[str, Any]):
+        """
+        Versi async dari _stream_request: hasilkan event SSE satu per satu.
+        Koneksi selalu ditutup di akhir, sehingga berhenti membaca lebih awal
+        membuat server membatalkan decoding yang tersisa.
+        """
+        reader, writer, status, headers = await asyncio.wait_for(
+            self._aopen("POST", path, payload, accept="text/event-stream"), timeout=self.request_timeout
+        )
+        try:
+            if status != 200:
+                raw = b"".join([chunk async for chunk in self._aiter_body(reader, headers)])
+                raise RuntimeError(f"llama-server mengembalikan status {status}: {raw[:200]!r}")
+            
+            buffer = b""
+            async for chunk in self._aiter_body(reader, headers):
+                buffer += chunk
+                lines = buffer.split(b"\n")
+                buffer = lines.pop()
+                for line in lines:
+                    line = line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[len("data:"):].strip())
+                    yield event
+                    if event.get("stop"):
+                        return
+        finally:
+            writer.close()
+    
+    async def _atry_completion(self, prompt: str, max_tokens: int, temperature: float,
+                               prompt_prefix: Optional[str] = None, grammar: Optional[str] = None,
+                               n_probs: int = 0) -> Optional[Dict[str, Any]]:
+        """Versi async dari _try_completion lewat koneksi asyncio; slot dipinjam lewat _aacquire_slot"""
+        return await arun_steps(self._completion_steps(prompt, max_tokens, temperature, prompt_prefix, grammar, n_probs))
+    
+    async def atry_generate(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                            prompt_prefix: Optional[str] = None, grammar: Optional[str] = None) -> Optional[str]:
+        """Versi async dari try_generate (None jika server gagal dihubungi)"""
+        return self._completion_output(await self._atry_completion(prompt, max_tokens, temperature, prompt_prefix, grammar))
+    
+    async def agenerate(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                        prompt_prefix: Optional[str] = None, grammar: Optional[str] = None) -> str:
+        """Versi async dari generate lewat koneksi asyncio (event loop tidak pernah diblokir)"""
+        output = await self.atry_generate(prompt, max_tokens=max_tokens, temperature=temperature,
+                                          prompt_prefix=prompt_prefix, grammar=grammar)
+        if not output:
+            return self._create_default_response(prompt)
+        return output
+    
+    async def agenerate_stream(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                               prompt_prefix: Optional[str] = None, grammar: Optional[str] = None):
+        """
+        Versi async dari generate_stream (SSE lewat koneksi asyncio)
+        
+        Yields:
+            Potongan teks sesuai urutan dihasilkan model
+        """
+        if not await self._aensure_server():
+            yield self._create_default_response(prompt)
+            return
+        stream = self.atry_generate_stream(prompt, max_tokens=max_tokens, temperature=temperature,
+                                           prompt_prefix=prompt_prefix, grammar=grammar)
+        try:
+            async for piece in stream:
+                yield piece
+        except Exception as e:
+            logger.error(f"Error saat streaming dari llama-server: {e}")
+            yield await self.agenerate(prompt, max_tokens=max_tokens, temperature=temperature,
+                                       prompt_prefix=prompt_prefix, grammar=grammar)
+        finally:
+            await stream.aclose()
+    
+    async def atry_generate_stream(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                                   prompt_prefix: Optional[str] = None, grammar: Optional[str] = None):
+        """Versi async dari try_generate_stream (kegagalan sebelum potongan pertama dilempar)"""
+        if not await self._aensure_server():
+            raise ConnectionError(f"llama-server di {self.host}:{self.port} tidak tersedia")
+        
+        payload = self._completion_payload(prompt, max_tokens, temperature, grammar, stream=True)
+        yielded = False
+        slot = await self._aacquire_slot(prompt, prompt_prefix)
+        payload["id_slot"] = slot
+        events = self._astream_request("/completion", payload)
+        try:
+            async for event in events:
+                content = self._stream_content(event)
+                if content:
+                    yielded = True
+                    yield content
+        except Exception as e:
+            self._last_health_check = 0.0
+            if not yielded:
+                raise
+            logger.error(f"Error saat streaming dari llama-server: {e}")
+        finally:
+            # Menutup stream SSE lebih awal memutus koneksi sehingga server berhenti decoding
+            try:
+                await events.aclose()
+            finally:
+                self._release_slot(slot)
+
+# Kelas untuk mengelola beberapa proses llama-server yang masing-masing dipatok ke core sendiri
+class LlamaWorkerPool(LLMBackend):
+    """
+    Pool beberapa proses llama-server. Pada node CPU multi-socket satu stream inferensi
+    tidak bisa memakai semua core, sehingga core dibagi menjadi beberapa partisi dan
+    setiap partisi menjalankan satu proses llama-server sendiri. Setiap generate()
+    dikirim ke worker sehat dengan request berjalan paling sedikit.
+    """
+    
+    supports_grammar = True
+    supports_token_probs = True
+    supports_concurrent_batch = True
+    
+    def __init__(
+        self,
+        model_path: str,
+        n_workers: int = 2,
+        cores_per_worker: Optional[int] = None,
+        base_port: int = 8090,
+        cpu_partitions: Optional[List[List[int]]] = None,
+        **server_kwargs
+    ):
+        """
+        Inisialisasi pool worker llama-server
+        
+        Args:
+            model_path: Path ke file model GGUF
+            n_workers: Jumlah proses llama-server (diabaikan jika cpu_partitions diberikan)
+            cores_per_worker: Jumlah core per worker; None = core yang tersedia dibagi rata
+            base_port: Port worker pertama; worker ke-i memakai base_port + i
+            cpu_partitions: Daftar core eksplisit per worker, misal [[0, 1, 2, 3], [4, 5, 6, 7]]
+            **server_kwargs: Argumen tambahan untuk setiap LlamaServerModel
+        """
+        self.model_path = model_path
+        self.seed = server_kwargs.get("seed")
+        if cpu_partitions is None:
+            cpu_partitions = self.partition_cores(n_workers, cores_per_worker)
+        self.cpu_partitions = [list(cores) for cores in cpu_partitions]
+        self.n_workers = len(self.cpu_partitions)
+        server_kwargs.pop("port", None)
+        server_kwargs.pop("cpu_cores", None)
+        
+        logger.info(f"Menjalankan {self.n_workers} worker llama-server mulai port {base_port}")
+        
+        # Model dimuat di semua worker secara bersamaan agar startup tidak N kali lebih lama
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+            futures = [
+                executor.submit(
+                    LlamaServerModel,
+                    model_path=model_path,
+                    port=base_port + index,
+                    cpu_cores=cores,
+                    **server_kwargs
+                )
+                for index, cores in enumerate(self.cpu_partitions)
+            ]
+            self.workers: List[LlamaServerModel] = [future.result() for future in futures]
+        
+        for index, (worker, cores) in enumerate(zip(self.workers, self.cpu_partitions)):
+            logger.info(f"Worker {index}: port {worker.port}, core {cores or 'tanpa pinning'}")
+        
+        self.n_parallel = sum(worker.n_parallel for worker in self.workers)
+        self.ctx_size = self.workers[0].ctx_size
+        self._in_flight = [0] * self.n_workers
+        self._healthy = [True] * self.n_workers
+        self._restarting = set()
+        self._lock = threading.Lock()
+        self._batch_executor = None
+    
+    @staticmethod
+    def partition_cores(n_workers: int, cores_per_worker: Optional[int] = None) -> List[List[int]]:
+        """
+        Bagi core CPU yang tersedia untuk proses ini menjadi partisi yang bersebelahan
+        
+        Args:
+            n_workers: Jumlah partisi
+            cores_per_worker: Jumlah core per partisi; None = dibagi rata
+            
+        Returns:
+            List daftar core per worker (list kosong = tanpa pinning)
+        """
+        n_workers = max(1, n_workers)
+        if hasattr(os, "sched_getaffinity"):
+            cores = sorted(os.sched_getaffinity(0))
+        else:
+            cores = list(range(os.cpu_count() or 1))
+        
+        if cores_per_worker is None:
+            cores_per_worker = len(cores) // n_workers
+        if cores_per_worker <= 0 or cores_per_worker * n_workers > len(cores):
+            logger.warning(f"Core tidak cukup untuk {n_workers} worker x {cores_per_worker} core, "
+                           f"worker dijalankan tanpa pinning")
+            return [[] for _ in range(n_workers)]
+        
+        return [cores[i * cores_per_worker:(i + 1) * cores_per_worker] for i in range(n_workers)]
+    
+    def _acquire_worker(self, exclude: set) -> Optional[int]:
+        """Pilih worker sehat dengan request berjalan paling sedikit dan tandai sedang dipakai"""
+        with self._lock:
+            candidates = [
+                index for index in range(self.n_workers)
+                if self._healthy[index] and index not in exclude
+            ]
+            if not candidates:
+                return None
+            index = min(candidates, key=lambda i: (self._in_flight[i], i))
+            self._in_flight[index] += 1
+            return index
+    
+    def _release_worker(self, index: int):
+        with self._lock:
+            self._in_flight[index] -= 1
+    
+    def _acquire_live_worker(self, tried: set) -> Optional[int]:
+        """
+        Seperti _acquire_worker, tetapi worker yang prosesnya sudah mati langsung direstart
+        di background dan dilewati. Indeks yang dicoba ditambahkan ke tried.
+        """
+        while True:
+            index = self._acquire_worker(tried)
+            if index is None:
+                return None
+            tried.add(index)
+            worker = self.workers[index]
+            if worker.start_server and (worker.process is None or worker.process.poll() is not None):
+                # Proses mati: restart di background, jangan tahan request ini menunggu model dimuat ulang
+                self._release_worker(index)
+                self._mark_unhealthy(index)
+                continue
+            return index
+    
+    def _mark_unhealthy(self, index: int):
+        """Keluarkan worker dari rotasi dan restart di background"""
+        with self._lock:
+            self._healthy[index] = False
+            if index in self._restarting:
+                return
+            self._restarting.add(index)
+        logger.warning(f"Worker {index} (port {self.workers[index].port}) ditandai tidak sehat")
+        threading.Thread(target=self._restart_worker, args=(index,), daemon=True).start()
+    
+    def _restart_worker(self, index: int):
+        worker = self.workers[index]
+        try:
+            recovered = worker.is_healthy() or worker.restart()
+        except Exception as e:
+            logger.error(f"Gagal merestart worker {index}: {e}")
+            recovered = False
+        with self._lock:
+            self._restarting.discard(index)
+            self._healthy[index] = recovered
+        if recovered:
+            logger.info(f"Worker {index} kembali sehat")
+        else:
+            logger.error(f"Worker {index} tidak bisa dipulihkan, dikeluarkan dari pool")
+    
+    def _failover_steps(self, method: str, kwargs: Dict[str, Any], hold: bool = False):
+        """
+        Generator langkah (lihat run_steps): jalankan worker.method(**kwargs) di worker hidup dengan
+        beban paling ringan. Jika gagal (exception atau None), worker direstart di background dan
+        request dicoba di worker lain. Versi async memanggil pasangan async method (misal atry_generate).
+        
+        Args:
+            method: Nama metode LlamaServerModel yang mengembalikan None jika server gagal
+            kwargs: Argumen metode
+            hold: Jika True, worker yang berhasil tetap ditandai dipakai (pemanggil wajib memanggil
+                _release_worker, misal setelah stream selesai)
+            
+        Returns:
+            Tuple (indeks worker, hasil); (None, None) jika semua worker gagal
+        """
+        tried = set()
+        while True:
+            index = self._acquire_live_worker(tried)
+            if index is None:
+                break
+            try:
+                result = yield step_call(self.workers[index], method, **kwargs)
+            except Exception as e:
+                logger.error(f"Error pada worker {index}: {e}")
+                result = None
+            if result is None or not hold:
+                self._release_worker(index)
+            if result is not None:
+                return index, result
+            self._mark_unhealthy(index)
+        if not tried:
+            logger.error("Tidak ada worker llama-server yang sehat")
+        return None, None
+    
+    def generate(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                 prompt_prefix: Optional[str] = None, grammar: Optional[str] = None) -> str:
+        """
+        Menghasilkan teks lewat worker dengan beban paling ringan.
+        Jika worker gagal, worker tersebut direstart dan request dicoba di worker lain.
+        
+        Args:
+            prompt: Prompt untuk model
+            max_tokens: Jumlah token maksimum yang akan dihasilkan
+            temperature: Parameter temperature untuk sampling
+            prompt_prefix: Bagian awal prompt yang sama antar jawaban
+            grammar: Grammar GBNF yang membatasi token yang boleh dihasilkan
+            
+        Returns:
+            Teks yang dihasilkan
+        """
+        _, output = run_steps(self._failover_steps("try_generate", dict(
+            prompt=prompt, max_tokens=max_tokens, temperature=temperature,
+            prompt_prefix=prompt_prefix, grammar=grammar
+        )))
+        return output or self._create_default_response(prompt)
+    
+    async def agenerate(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                        prompt_prefix: Optional[str] = None, grammar: Optional[str] = None) -> str:
+        """Versi async dari generate: worker paling ringan dan failover yang sama, lewat koneksi asyncio"""
+        _, output = await arun_steps(self._failover_steps("try_generate", dict(
+            prompt=prompt, max_tokens=max_tokens, temperature=temperature,
+            prompt_prefix=prompt_prefix, grammar=grammar
+        )))
+        return output or self._create_default_response(prompt)
+    
+    def generate_with_probs(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                            prompt_prefix: Optional[str] = None,
+                            grammar: Optional[str] = None) -> Tuple[str, Optional[List[Tuple[str, float]]]]:
+        """Generate dengan probabilitas token lewat worker paling ringan, dengan failover yang sama"""
+        _, result = run_steps(self._failover_steps("try_generate_with_probs", dict(
+            prompt=prompt, max_tokens=max_tokens, temperature=temperature,
+            prompt_prefix=prompt_prefix, grammar=grammar
+        )))
+        if result is None or not result[0]:
+            return self._create_default_response(prompt), None
+        return result
+    
+    def generate_stream(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                        prompt_prefix: Optional[str] = None, grammar: Optional[str] = None):
+        """
+        Streaming lewat worker dengan beban paling ringan. Worker yang gagal sebelum potongan
+        pertama dialihkan ke worker lain; worker tetap dipakai sampai stream selesai/ditutup.
+        """
+        index, opened = run_steps(self._failover_steps("_open_stream", dict(
+            prompt=prompt, max_tokens=max_tokens, temperature=temperature,
+            prompt_prefix=prompt_prefix, grammar=grammar
+        ), hold=True))
+        if opened is None:
+            yield self._create_default_response(prompt)
+            return
+        stream, first = opened
+        try:
+            if first:
+                yield first
+            yield from stream
+        finally:
+            stream.close()
+            self._release_worker(index)
+    
+    async def agenerate_stream(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                               prompt_prefix: Optional[str] = None, grammar: Optional[str] = None):
+        """Versi async dari generate_stream dengan failover yang sama"""
+        index, opened = await arun_steps(self._failover_steps("_open_stream", dict(
+            prompt=prompt, max_tokens=max_tokens, temperature=temperature,
+            prompt_prefix=prompt_prefix, grammar=grammar
+        ), hold=True))
+        if opened is None:
+            yield self._create_default_response(prompt)
+            return
+        stream, first = opened
+        try:
+            if first:
+                yield first
+            async for piece in stream:
+                yield piece
+        finally:
+            await stream.aclose()
+            self._release_worker(index)
+    
+    def generate_batch(self, requests: List[Dict[str, Any]]) -> List[str]:
+        """
+        Sebar beberapa prompt ke semua worker secara bersamaan
+        
+        Args:
+            requests: List dict berisi argumen generate
+            
+        Returns:
+            List teks hasil, urutannya sama dengan requests
+        """
+        if len(requests) <= 1:
+            return [self._run_request(request) for request in requests]
+        
+        with self._lock:
+            if self._batch_executor is None:
+                self._batch_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.n_parallel,
+                    thread_name_prefix="llama-pool"
+                )
+        futures = [self._batch_executor.submit(self._run_request, request) for request in requests]
+        return [future.result() for future in futures]
+    
+    def count_tokens(self, text: str) -> int:
+        """Hitung token dengan worker sehat pertama (semua worker memuat model yang sama)"""
+        with self._lock:
+            healthy = [index for index in range(self.n_workers) if self._healthy[index]]
+        if not healthy:
+            return estimate_tokens(text)
+        return self.workers[healthy[0]].count_tokens(text)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Status setiap worker: port, core, sehat tidaknya, dan request yang sedang berjalan"""
+        with self._lock:
+            return {
+                "workers": [
+                    {
+                        "port": worker.port,
+                        "cores": cores,
+                        "healthy": self._healthy[index],
+                        "in_flight": self._in_flight[index],
+                        "restarts": worker.restart_count
+                    }
+                    for index, (worker, cores) in enumerate(zip(self.workers, self.cpu_partitions))
+                ]
+            }
+    
+    def close(self):
+        """Hentikan semua worker"""
+        if self._batch_executor is not None:
+            self._batch_executor.shutdown(wait=False)
+            self._batch_executor = None
+        for worker in self.workers:
+            worker.close()
+
+# Kelas untuk mengelola LLM in-process melalui binding llama-cpp-python
+class LlamaCppPythonModel(LLMBackend):
+    """
+    Kelas untuk mengelola model Llama in-process menggunakan llama-cpp-python.
+    Model GGUF dimuat sekali dan tetap resident di memori, tanpa spawn proses,
+    tanpa melewatkan prompt lewat argv, dan tanpa parsing stdout.
+    """
+    
+    supports_grammar = True
+    
+    def __init__(
+        self,
+        model_path: str,
+        n_gpu_layers: int = 999,
+        ctx_size: int = 16384,
+        n_threads: Optional[int] = None,
+        n_batch: int = 512,
+        verbose: bool = False,
+        prefix_cache_dir: Optional[str] = None,
+        seed: Optional[int] = None,
+        logits_all: bool = False
+    ):
+        """
+        Inisialisasi model Llama dengan llama-cpp-python
+        
+        Args:
+            model_path: Path ke file model GGUF
+            n_gpu_layers: Jumlah layer yang akan dijalankan di GPU (0 untuk CPU saja)
+            ctx_size: Ukuran konteks maksimum
+            n_threads: Jumlah thread CPU untuk inferensi (None = default llama.cpp)
+            n_batch: Ukuran batch untuk evaluasi prompt (prefill)
+            verbose: Tampilkan log internal llama.cpp
+            prefix_cache_dir: Direktori untuk menyimpan state KV prefix prompt ke disk
+                (None = state hanya disimpan di memori)
+            seed: Seed sampling untuk setiap completion (None = acak)
+            logits_all: Simpan logits semua token agar generate_with_probs bisa mengembalikan
+                probabilitas token (wajib untuk model kecil cascade; menambah memori n_ctx x vocab)
+        """
+        self.model_path = model_path
+        self.n_gpu_layers = n_gpu_layers
+        self.ctx_size = ctx_size
+        self.n_threads = n_threads
+        self.n_batch = n_batch
+        self.prefix_cache_dir = prefix_cache_dir
+        self.seed = seed
+        self.logits_all = logits_all
+        # llama-cpp-python menolak logprobs jika model dimuat tanpa logits_all
+        self.supports_token_probs = logits_all
+        # State KV per prefix prompt dan prefix yang sedang aktif di konteks model
+        self._prefix_states: Dict[str, Any] = {}
+        self._active_prefix: Optional[str] = None
+        # Grammar GBNF yang sudah di-compile, dikunci dengan teks grammar
+        self._grammars: Dict[str, Any] = {}
+        # Instance Llama tidak thread-safe, jadi semua panggilan diserialkan
+        self._lock = threading.Lock()
+        
+        try:
+            from llama_cpp import Llama
+        except ImportError:
+            logger.error("llama-cpp-python tidak ditemukan. Menginstal dengan 'pip install llama-cpp-python'")
+            sys.exit(1)
+        
+        logger.info(f"Memuat model {self.model_path} dengan llama-cpp-python...")
+        logger.info(
+            f"Konfigurasi: GPU Layers={self.n_gpu_layers}, Context Size={self.ctx_size}, "
+            f"Threads={self.n_threads or 'default'}, Batch={self.n_batch}"
+        )
+        start_time = time.time()
+        try:
+            self.llm = Llama(
+                model_path=self.model_path,
+                n_gpu_layers=self.n_gpu_layers,
+                n_ctx=self.ctx_size,
+                n_threads=self.n_threads,
+                n_batch=self.n_batch,
+                logits_all=self.logits_all,
+                verbose=verbose
+            )
+        except Exception as e:
+            logger.error(f"Gagal memuat model dengan llama-cpp-python: {e}")
+            sys.exit(1)
+        elapsed = time.time() - start_time
+        logger.info(f"Model berhasil dimuat dalam {elapsed:.2f} detik")
+    
+    def _prefix_state_path(self, key: str) -> Optional[str]:
+        if not self.prefix_cache_dir:
+            return None
+        return os.path.join(self.prefix_cache_dir, f"aes-prefix-{key}.pkl")
+    
+    def _restore_prefix(self, prompt_prefix: str):
+        """
+        Pulihkan state KV untuk prefix prompt (harus dipanggil sambil memegang lock).
+        Prefix dievaluasi sekali lalu state-nya disimpan; create_completion berikutnya
+        otomatis memakai ulang token prefix yang sama dan hanya mengevaluasi sufiks.
+        """
+        key = self._prefix_key(prompt_prefix)
+        if self._active_prefix == key:
+            # Konteks model masih diawali prefix ini dari panggilan sebelumnya
+            return
+        
+        state = self._prefix_states.get(key)
+        state_path = self._prefix_state_path(key)
+        if state is None and state_path and os.path.exists(state_path):
+            try:
+                with open(state_path, "rb") as f:
+                    state = pickle.load(f)
+                self._prefix_states[key] = state
+                logger.info(f"State KV prefix {key} dimuat dari {state_path}")
+            except Exception as e:
+                logger.warning(f"Gagal memuat state KV prefix dari disk: {e}")
+                state = None
+        
+        if state is None:
+            start_time = time.time()
+            tokens = self.llm.tokenize(prompt_prefix.encode("utf-8"), add_bos=True, special=True)
+            self.llm.reset()
+            self.llm.eval(tokens)
+            state = self.llm.save_state()
+            self._prefix_states[key] = state
+            logger.info(f"Prefix prompt {key} ({len(tokens)} token) dievaluasi dalam {time.time() - start_time:.2f} detik")
+            if state_path:
+                try:
+                    os.makedirs(self.prefix_cache_dir, exist_ok=True)
+                    with open(state_path, "wb") as f:
+                        pickle.dump(state, f)
+                except Exception as e:
+                    logger.warning(f"Gagal menyimpan state KV prefix ke disk: {e}")
+        else:
+            self.llm.load_state(state)
+        self._active_prefix = key
+    
+    def generate_with_probs(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                            prompt_prefix: Optional[str] = None,
+                            grammar: Optional[str] = None) -> Tuple[str, Optional[List[Tuple[str, float]]]]:
+        """
+        Generate dengan log-prob setiap token (logprobs pada create_completion).
+        Tanpa logits_all, output dihasilkan biasa dan probabilitasnya None.
+        """
+        if not self.logits_all:
+            return self.generate(prompt, max_tokens=max_tokens, temperature=temperature,
+                                 prompt_prefix=prompt_prefix, grammar=grammar), None
+        try:
+            with self._lock:
+                if prompt_prefix and prompt.startswith(prompt_prefix):
+                    self._restore_prefix(prompt_prefix)
+                else:
+                    self._active_prefix = None
+                completion = self.llm.create_completion(
+                    prompt,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    grammar=self._get_grammar(grammar),
+                    seed=self.seed,
+                    logprobs=1
+                )
+            record_stage_timing("generated_tokens", completion.get("usage", {}).get("completion_tokens", 0))
+            choice = completion["choices"][0]
+            output = choice["text"].strip()
+            if not output:
+                return self._create_default_response(prompt), None
+            logprobs = choice.get("logprobs") or {}
+            tokens = [
+                (token, math.exp(logprob) if logprob is not None else 0.0)
+                for token, logprob in zip(logprobs.get("tokens") or [], logprobs.get("token_logprobs") or [])
+            ]
+            return output, tokens or None
+        except Exception as e:
+            logger.error(f"Error saat menghasilkan teks: {e}")
+            return self._create_default_response(prompt), None
+    
+    def count_tokens(self, text: str) -> int:
+        """Hitung token dengan tokenizer model yang sudah dimuat"""
+        try:
+            return len(self.llm.tokenize(text.encode("utf-8"), add_bos=True, special=True))
+        except Exception as e:
+            logger.warning(f"Gagal menghitung token dengan llama-cpp-python: {e}")
+            return estimate_tokens(text)
+    
+    def _get_grammar(self, grammar: Optional[str]):
+        """Compile grammar GBNF sekali lalu simpan untuk dipakai ulang"""
+        if not grammar:
+            return None
+        compiled = self._grammars.get(grammar)
+        if compiled is None:
+            from llama_cpp import LlamaGrammar
+            compiled = LlamaGrammar.from_string(grammar, verbose=False)
+            self._grammars[grammar] = compiled
+        return compiled
+    
+    def generate(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                 prompt_prefix: Optional[str] = None, grammar: Optional[str] = None) -> str:
+        """
+        Menghasilkan teks dari model yang sudah resident di memori
+        
+        Args:
+            prompt: Prompt untuk model
+            max_tokens: Jumlah token maksimum yang akan dihasilkan
+            temperature: Parameter temperature untuk sampling
+            prompt_prefix: Bagian awal prompt yang sama antar jawaban; state KV-nya
+                dipulihkan sehingga hanya sufiks yang perlu di-prefill
+            grammar: Grammar GBNF yang membatasi token yang boleh dihasilkan
+            
+        Returns:
+            Teks yang dihasilkan
+        """
+        try:
+            logger.info(f"Menjalankan llama-cpp-python dengan {max_tokens} token maksimum...")
+            start_time = time.time()
+            with self._lock:
+                if prompt_prefix and prompt.startswith(prompt_prefix):
+                    self._restore_prefix(prompt_prefix)
+                else:
+                    self._active_prefix = None
+                completion = self.llm.create_completion(
+                    prompt,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    grammar=self._get_grammar(grammar),
+                    seed=self.seed
+                )
+            elapsed = time.time() - start_time
+            logger.info(f"Inferensi selesai dalam {elapsed:.2f} detik")
+            record_stage_timing("generated_tokens", completion.get("usage", {}).get("completion_tokens", 0))
+            
+            output = completion["choices"][0]["text"].strip()
+            if not output:
+                logger.warning("Output kosong dari llama-cpp-python")
+                return self._create_default_response(prompt)
+            return output
+        except Exception as e:
+            logger.error(f"Error saat menghasilkan teks: {e}")
+            return self._create_default_response(prompt)
+    
+    def generate_stream(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                        prompt_prefix: Optional[str] = None, grammar: Optional[str] = None):
+        """
+        Hasilkan token dari model resident secara streaming.
+        Lock dipegang selama stream berjalan; menutup generator menghentikan decoding.
+        
+        Yields:
+            Potongan teks sesuai urutan dihasilkan model
+        """
+        yielded = False
+        with self._lock:
+            try:
+                if prompt_prefix and prompt.startswith(prompt_prefix):
+                    self._restore_prefix(prompt_prefix)
+                else:
+                    self._active_prefix = None
+                stream = self.llm.create_completion(
+                    prompt,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    grammar=self._get_grammar(grammar),
+                    seed=self.seed,
+                    stream=True
+                )
+                try:
+                    for chunk in stream:
+                        text = chunk["choices"][0]["text"]
+                        if text:
+                            yielded = True
+                            record_stage_timing("generated_tokens", 1)
+                            yield text
+                finally:
+                    stream.close()
+            except Exception as e:
+                logger.error(f"Error saat streaming teks: {e}")
+                if not yielded:
+                    yield self._create_default_response(prompt)
+    
+    def close(self):
+        """Lepaskan model dari memori"""
+        with self._lock:
+            llm = getattr(self, "llm", None)
+            if llm is not None and hasattr(llm, "close"):
+                llm.close()
+            self.llm = None
+
+# Scheduler untuk menggabungkan panggilan generate dari banyak thread menjadi satu batch decoding
+class BatchingScheduler(LLMBackend):
+    """
+    Scheduler continuous batching di depan backend LLM.
+    Prompt dari semua thread pemanggil dikumpulkan ke antrean, lalu dikirim ke backend
+    sebagai satu batch (beberapa sequence/slot sekaligus). Batch baru langsung diterima
+    begitu ada slot yang kosong, tanpa menunggu batch sebelumnya selesai seluruhnya.
+    Hasil setiap prompt dikembalikan ke thread pemanggilnya masing-masing.
+    Request early stop (generate_until) ikut antrean yang sama; setiap request di batch di-stream
+    sendiri oleh backend dan dihentikan menurut stop_policy masing-masing. Hanya generate_stream
+    (dikonsumsi langsung oleh pemanggil) yang diteruskan ke backend tanpa antrean.
+    """
+    
+    def __init__(self, backend: LLMBackend, max_batch_size: int = 4, max_wait_ms: float = 20.0):
+        """
+        Inisialisasi scheduler
+        
+        Args:
+            backend: Backend LLM yang menjalankan batch (idealnya LlamaServerModel dengan n_parallel >= max_batch_size)
+            max_batch_size: Jumlah maksimum prompt yang diproses bersamaan
+            max_wait_ms: Waktu tunggu maksimum (milidetik) untuk mengumpulkan prompt tambahan ke batch
+        """
+        self.backend = backend
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        if not backend.supports_concurrent_batch:
+            logger.warning(
+                f"{type(backend).__name__} menjalankan batch secara berurutan; "
+                f"BatchingScheduler hanya menambah waktu tunggu"
+            )
+        self.stats = {"batches": 0, "requests": 0, "max_batch_seen": 0}
+        
+        self._queue = queue.Queue()
+        self._capacity = threading.Semaphore(self.max_batch_size)
+        self._stats_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_batch_size,
+            thread_name_prefix="llm-batch"
+        )
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="llm-batch-scheduler", daemon=True)
+        self._dispatcher.start()
+        logger.info(f"Batching scheduler aktif: max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait_ms}")
+    
+    def __getattr__(self, name):
+        # Atribut lain (model_path, ctx_size, ...) diambil dari backend
+        backend = self.__dict__.get("backend")
+        if backend is None:
+            raise AttributeError(name)
+        return getattr(backend, name)
+    
+    @property
+    def supports_grammar(self) -> bool:
+        return self.backend.supports_grammar
+    
+    @property
+    def supports_token_probs(self) -> bool:
+        return self.backend.supports_token_probs
+    
+    @property
+    def supports_concurrent_batch(self) -> bool:
+        return self.backend.supports_concurrent_batch
+    
+    def count_tokens(self, text: str) -> int:
+        return self.backend.count_tokens(text)
+    
+    def generate_with_probs(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                            prompt_prefix: Optional[str] = None,
+                            grammar: Optional[str] = None) -> Tuple[str, Optional[List[Tuple[str, float]]]]:
+        # Probabilitas token hanya tersedia dari request tunggal, tidak lewat antrean batch
+        return self.backend.generate_with_probs(prompt, max_tokens=max_tokens, temperature=temperature,
+                                                prompt_prefix=prompt_prefix, grammar=grammar)
+    
+    def generate_stream(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                        prompt_prefix: Optional[str] = None, grammar: Optional[str] = None):
+        """Streaming diteruskan langsung ke backend karena potongannya dikonsumsi pemanggil"""
+        return self.backend.generate_stream(prompt, max_tokens=max_tokens, temperature=temperature,
+                                            prompt_prefix=prompt_prefix, grammar=grammar)
+    
+    def agenerate_stream(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                         prompt_prefix: Optional[str] = None, grammar: Optional[str] = None):
+        """Versi async dari generate_stream (juga langsung ke backend)"""
+        return self.backend.agenerate_stream(prompt, max_tokens=max_tokens, temperature=temperature,
+                                             prompt_prefix=prompt_prefix, grammar=grammar)
+    
+    def generate_until(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                       stop_policy=None, prompt_prefix: Optional[str] = None,
+                       grammar: Optional[str] = None) -> str:
+        """Masukkan prompt ke antrean batch; backend menghentikan generasinya menurut stop_policy"""
+        if self._stopped.is_set():
+            return self.backend.generate_until(prompt, max_tokens=max_tokens, temperature=temperature,
+                                               stop_policy=stop_policy, prompt_prefix=prompt_prefix,
+                                               grammar=grammar)
+        return self._enqueue(prompt, max_tokens, temperature, prompt_prefix, grammar, stop_policy).result()
+    
+    async def agenerate_until(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                              stop_policy=None, prompt_prefix: Optional[str] = None,
+                              grammar: Optional[str] = None) -> str:
+        """Versi async dari generate_until: prompt masuk antrean batch yang sama"""
+        if self._stopped.is_set():
+            return await self.backend.agenerate_until(prompt, max_tokens=max_tokens, temperature=temperature,
+                                                      stop_policy=stop_policy, prompt_prefix=prompt_prefix,
+                                                      grammar=grammar)
+        return await asyncio.wrap_future(
+            self._enqueue(prompt, max_tokens, temperature, prompt_prefix, grammar, stop_policy)
+        )
+    
+    def generate(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                 prompt_prefix: Optional[str] = None, grammar: Optional[str] = None) -> str:
+        """
+        Masukkan prompt ke antrean batch dan tunggu hasilnya
+        
+        Args:
+            prompt: Prompt untuk model
+            max_tokens: Jumlah token maksimum yang akan dihasilkan
+            temperature: Parameter temperature untuk sampling
+            prompt_prefix: Bagian awal prompt yang sama antar jawaban
+            grammar: Grammar GBNF untuk membatasi output
+            
+        Returns:
+            Teks yang dihasilkan
+        """
+        if self._stopped.is_set():
+            return self.backend.generate(prompt, max_tokens=max_tokens, temperature=temperature,
+                                         prompt_prefix=prompt_prefix, grammar=grammar)
+        
+        return self._enqueue(prompt, max_tokens, temperature, prompt_prefix, grammar).result()
+    
+    async def agenerate(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                        prompt_prefix: Optional[str] = None, grammar: Optional[str] = None) -> str:
+        """Versi async dari generate: prompt masuk antrean batch yang sama, event loop tidak diblokir"""
+        if self._stopped.is_set():
+            return await self.backend.agenerate(prompt, max_tokens=max_tokens, temperature=temperature,
+                                                prompt_prefix=prompt_prefix, grammar=grammar)
+        return await asyncio.wrap_future(self._enqueue(prompt, max_tokens, temperature, prompt_prefix, grammar))
+    
+    def _enqueue(self, prompt: str, max_tokens: int, temperature: float, prompt_prefix: Optional[str],
+                 grammar: Optional[str], stop_policy=None) -> concurrent.futures.Future:
+        """Masukkan satu prompt ke antrean batch; hasilnya dikirim lewat future"""
+        future = concurrent.futures.Future()
+        request = {
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "prompt_prefix": prompt_prefix,
+            "grammar": grammar
+        }
+        if stop_policy is not None:
+            request["stop_policy"] = stop_policy
+        self._queue.put((request, future))
+        return future
+    
+    def _collect_batch(self) -> List[Tuple[Dict[str, Any], concurrent.futures.Future]]:
+        """Ambil prompt dari antrean sampai batch penuh, slot habis, atau waktu tunggu habis"""
+        self._capacity.acquire()
+        item = self._queue.get()
+        if item is None:
+            self._capacity.release()
+            return []
+        
+        batch = [item]
+        deadline = time.time() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0 or not self._capacity.acquire(timeout=remaining):
+                break
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.time()))
+            except queue.Empty:
+                self._capacity.release()
+                break
+            if item is None:
+                self._capacity.release()
+                self._stopped.set()
+                break
+            batch.append(item)
+        return batch
+    
+    def _run_batch(self, batch: List[Tuple[Dict[str, Any], concurrent.futures.Future]]):
+        """Jalankan satu batch di backend dan kirim hasil ke masing-masing pemanggil"""
+        try:
+            outputs = self.backend.generate_batch([request for request, _ in batch])
+            for (_, future), output in zip(batch, outputs):
+                future.set_result(output)
+        except Exception as e:
+            logger.error(f"Error saat menjalankan batch LLM: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for _ in batch:
+                self._capacity.release()
+    
+    def _dispatch_loop(self):
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                break
+            with self._stats_lock:
+                self.stats["batches"] += 1
+                self.stats["requests"] += len(batch)
+                self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+            self._executor.submit(self._run_batch, batch)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistik batching: jumlah batch, jumlah prompt, dan rata-rata ukuran batch"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["avg_batch_size"] = stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+    
+    def close(self):
+        """Hentikan dispatcher lalu tutup backend"""
+        if not self._stopped.is_set():
+            self._queue.put(None)
+            self._dispatcher.join()
+            self._stopped.set()
+            self._executor.shutdown(wait=True)
+        self.backend.close()
+
+# Cache respons LLM di disk (SQLite) agar prompt yang identik tidak diinferensi ulang
+# Aktif selama bypass_response_cache: lookup cache dilewati, output baru tetap disimpan
+_response_cache_bypass_var: contextvars.ContextVar = contextvars.ContextVar("aes_response_cache_bypass", default=False)
+
+@contextlib.contextmanager
+def bypass_response_cache(enabled: bool = True):
+    """
+    Lewati lookup CachedLLMBackend di thread/task ini selama blok berjalan (misal evaluasi ulang
+    yang dipaksa); output backend tetap disimpan sehingga entri cache lama diperbarui
+    
+    Args:
+        enabled: False = tidak mengubah apa pun (memudahkan pemakaian bersyarat)
+    """
+    token = _response_cache_bypass_var.set(_response_cache_bypass_var.get() or enabled)
+    try:
+        yield
+    finally:
+        _response_cache_bypass_var.reset(token)
+
+class CachedLLMBackend(LLMBackend):
+    """
+    Pembungkus backend LLM dengan cache respons persisten berbasis SQLite.
+    Kunci cache terdiri dari path model, hash prompt, max_tokens, temperature, seed,
+    grammar, dan mode berhenti; cache hit langsung dikembalikan tanpa inferensi.
+    Hanya request deterministik (temperature 0 atau seed tetap) yang di-cache; request
+    sampling lain diteruskan langsung ke backend agar variasinya tidak dibekukan.
+    Di dalam bypass_response_cache() lookup dilewati dan hasil baru menimpa entri lama.
+    Ukuran cache dibatasi jumlah entri dengan eviction LRU (berdasarkan waktu akses terakhir).
+    """
+    
+    def __init__(self, backend: LLMBackend, db_path: str, max_entries: int = 50000):
+        """
+        Inisialisasi cache respons
+        
+        Args:
+            backend: Backend LLM yang dibungkus
+            db_path: Path file database SQLite
+            max_entries: Jumlah entri maksimum sebelum entri yang paling lama tidak dipakai dihapus
+        """
+        self.backend = backend
+        self.db_path = db_path
+        self.max_entries = max(1, max_entries)
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+        
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        logger.info(f"Cache respons LLM: {db_path} ({count} entri, maksimum {self.max_entries})")
+    
+    def __getattr__(self, name):
+        # Atribut lain (model_path, ctx_size, get_stats milik scheduler, ...) diambil dari backend
+        backend = self.__dict__.get("backend")
+        if backend is None:
+            raise AttributeError(name)
+        return getattr(backend, name)
+    
+    @property
+    def supports_grammar(self) -> bool:
+        return self.backend.supports_grammar
+    
+    @property
+    def supports_token_probs(self) -> bool:
+        return self.backend.supports_token_probs
+    
+    @property
+    def supports_concurrent_batch(self) -> bool:
+        return self.backend.supports_concurrent_batch
+    
+    def count_tokens(self, text: str) -> int:
+        return self.backend.count_tokens(text)
+    
+    def _cache_key(self, prompt: str, max_tokens: int, temperature: float,
+                   grammar: Optional[str] = None, mode: str = "full") -> Optional[str]:
+        """Hash dari semua parameter yang memengaruhi output model; None jika output tidak deterministik"""
+        if float(temperature) != 0.0 and getattr(self.backend, "seed", None) is None:
+            return None
+        parts = [
+            str(getattr(self.backend, "model_path", "")),
+            hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+            str(int(max_tokens)),
+            repr(float(temperature)),
+            str(getattr(self.backend, "seed", None)),
+            hashlib.sha256(grammar.encode("utf-8")).hexdigest() if grammar else "",
+            mode
+        ]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+    
+    def _lookup(self, key: Optional[str]) -> Optional[str]:
+        with self._lock:
+            if key is None or _response_cache_bypass_var.get():
+                self.stats["bypassed"] += 1
+                return None
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+    
+    def _store(self, key: Optional[str], prompt: str, response: str):
+        # Respons default (backend gagal) dan output kosong tidak disimpan agar bisa dicoba ulang
+        if key is None or not response or response.strip() == self._default_response_text(prompt).strip():
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            self.stats["stores"] += 1
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                excess = count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                    (excess,)
+                )
+                self.stats["evictions"] += excess
+            self._conn.commit()
+    
+    def generate(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                 prompt_prefix: Optional[str] = None, grammar: Optional[str] = None) -> str:
+        """
+        Ambil respons dari cache; jika tidak ada, jalankan backend lalu simpan hasilnya
+        
+        Args:
+            prompt: Prompt untuk model
+            max_tokens: Jumlah token maksimum yang akan dihasilkan
+            temperature: Parameter temperature untuk sampling
+            prompt_prefix: Bagian awal prompt yang sama antar jawaban (tidak memengaruhi kunci)
+            grammar: Grammar GBNF untuk membatasi output
+            
+        Returns:
+            Teks yang dihasilkan
+        """
+        key = self._cache_key(prompt, max_tokens, temperature, grammar)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        
+        output = self.backend.generate(prompt, max_tokens=max_tokens, temperature=temperature,
+                                       prompt_prefix=prompt_prefix, grammar=grammar)
+        self._store(key, prompt, output)
+        return output
+    
+    async def agenerate(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                        prompt_prefix: Optional[str] = None, grammar: Optional[str] = None) -> str:
+        """Versi async dari generate; akses SQLite dijalankan di executor"""
+        key = self._cache_key(prompt, max_tokens, temperature, grammar)
+        cached = await run_blocking(self._lookup, key)
+        if cached is not None:
+            return cached
+        
+        output = await self.backend.agenerate(prompt, max_tokens=max_tokens, temperature=temperature,
+                                              prompt_prefix=prompt_prefix, grammar=grammar)
+        await run_blocking(self._store, key, prompt, output)
+        return output
+    
+    def generate_stream(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                        prompt_prefix: Optional[str] = None, grammar: Optional[str] = None):
+        """Streaming tidak di-cache karena pemanggil bisa menghentikannya di tengah jalan"""
+        return self.backend.generate_stream(prompt, max_tokens=max_tokens, temperature=temperature,
+                                            prompt_prefix=prompt_prefix, grammar=grammar)
+    
+    def agenerate_stream(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                         prompt_prefix: Optional[str] = None, grammar: Optional[str] = None):
+        """Versi async dari generate_stream (juga tidak di-cache)"""
+        return self.backend.agenerate_stream(prompt, max_tokens=max_tokens, temperature=temperature,
+                                             prompt_prefix=prompt_prefix, grammar=grammar)
+    
+    def generate_until(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                       stop_policy=None, prompt_prefix: Optional[str] = None,
+                       grammar: Optional[str] = None) -> str:
+        """Seperti generate(), tetapi output yang dihentikan stop_policy di-cache terpisah"""
+        mode = type(stop_policy).__name__ if stop_policy is not None else "full"
+        key = self._cache_key(prompt, max_tokens, temperature, grammar, mode=mode)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        
+        output = self.backend.generate_until(prompt, max_tokens=max_tokens, temperature=temperature,
+                                             stop_policy=stop_policy, prompt_prefix=prompt_prefix,
+                                             grammar=grammar)
+        self._store(key, prompt, output)
+        return output
+    
+    async def agenerate_until(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                              stop_policy=None, prompt_prefix: Optional[str] = None,
+                              grammar: Optional[str] = None) -> str:
+        """Versi async dari generate_until dengan kunci cache yang sama"""
+        mode = type(stop_policy).__name__ if stop_policy is not None else "full"
+        key = self._cache_key(prompt, max_tokens, temperature, grammar, mode=mode)
+        cached = await run_blocking(self._lookup, key)
+        if cached is not None:
+            return cached
+        
+        output = await self.backend.agenerate_until(prompt, max_tokens=max_tokens, temperature=temperature,
+                                                    stop_policy=stop_policy, prompt_prefix=prompt_prefix,
+                                                    grammar=grammar)
+        await run_blocking(self._store, key, prompt, output)
+        return output
+    
+    def generate_with_probs(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                            prompt_prefix: Optional[str] = None,
+                            grammar: Optional[str] = None) -> Tuple[str, Optional[List[Tuple[str, float]]]]:
+        """Seperti generate(), probabilitas token ikut disimpan di cache (sebagai JSON)"""
+        key = self._cache_key(prompt, max_tokens, temperature, grammar, mode="probs")
+        cached = self._lookup(key)
+        if cached is not None:
+            entry = json.loads(cached)
+            tokens = entry.get("tokens")
+            return entry["text"], [tuple(token) for token in tokens] if tokens is not None else None
+        
+        output, tokens = self.backend.generate_with_probs(prompt, max_tokens=max_tokens, temperature=temperature,
+                                                          prompt_prefix=prompt_prefix, grammar=grammar)
+        if output and output.strip() != self._default_response_text(prompt).strip():
+            self._store(key, prompt, json.dumps({"text": output, "tokens": tokens}, ensure_ascii=False))
+        return output, tokens
+    
+    def generate_batch(self, requests: List[Dict[str, Any]]) -> List[str]:
+        """Hanya request yang belum ada di cache yang diteruskan ke backend sebagai satu batch"""
+        results: List[Optional[str]] = [None] * len(requests)
+        pending = []
+        for index, request in enumerate(requests):
+            stop_policy = request.get("stop_policy")
+            key = self._cache_key(request["prompt"], request.get("max_tokens", 1024),
+                                  request.get("temperature", 0.7), request.get("grammar"),
+                                  mode=type(stop_policy).__name__ if stop_policy is not None else "full")
+            cached = self._lookup(key)
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.append((index, key, request))
+        
+        if pending:
+            outputs = self.backend.generate_batch([request for _, _, request in pending])
+            for (index, key, request), output in zip(pending, outputs):
+                self._store(key, request["prompt"], output)
+                results[index] = output
+        return results
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Statistik cache: hit, miss, request yang dilewati (non-deterministik/bypass), entri tersimpan, eviction, dan hit rate"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+    
+    def close(self):
+        """Tutup database cache lalu backend"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self.backend.close()
+
+def create_llm_backend(backend: str, model_path: str, **kwargs) -> LLMBackend:
+    """
+    Membuat instance backend LLM berdasarkan nama backend
+    
+    Args:
+        backend: Nama backend ("llama-run", "llama-server", "llama-server-pool", atau "llama-cpp-python")
+        model_path: Path ke file model GGUF
+        **kwargs: Argumen tambahan untuk konstruktor backend
+        
+    Returns:
+        Instance backend LLM
+    """
+    normalized = (backend or "llama-run").strip().lower()
+    if normalized == "llama-run":
+        return LlamaModelCpp(model_path=model_path, **kwargs)
+    if normalized == "llama-server":
+        return LlamaServerModel(model_path=model_path, **kwargs)
+    if normalized == "llama-server-pool":
+        return LlamaWorkerPool(model_path=model_path, **kwargs)
+    if normalized in {"llama-cpp-python", "llama_cpp"}:
+        return LlamaCppPythonModel(model_path=model_path, **kwargs)
+    raise ValueError(f"Backend LLM tidak dikenal: {backend}")
+
+def build_evaluation_grammar(allowed_scores: List[int], max_keywords: int = 5, max_keyword_chars: int = 40) -> str:
+    """
+    Membuat grammar GBNF untuk format output evaluasi.
+    Model hanya bisa menghasilkan skor dari allowed_scores dan daftar kata kunci terbatas,
+    sehingga panjang output juga terbatas secara konstruksi.
+    
+    Args:
+        allowed_scores: Daftar skor yang diperbolehkan
+        max_keywords: Jumlah maksimum kata kunci
+        max_keyword_chars: Panjang maksimum satu kata kunci (karakter)
+        
+    Returns:
+        Grammar dalam format GBNF llama.cpp
+    """
+    score_rule = " | ".join(f'"{score}"' for score in sorted(set(allowed_scores)))
+    return (
+        'root ::= "1. Skor: " score "\\n2. Kata kunci penting: " keywords "\\n"\n'
+        f"score ::= {score_rule}\n"
+        f'keywords ::= keyword (", " keyword){{0,{max(0, max_keywords - 1)}}}\n'
+        f"keyword ::= [^,\\n] [^,\\n]{{0,{max(0, max_keyword_chars - 1)}}}\n"
+    )
+
+def grammar_max_tokens(max_keywords: int = 5, max_keyword_chars: int = 40) -> int:
+    """Batas atas token untuk output ber-grammar (setiap token minimal satu karakter)"""
+    fixed_chars = len("1. Skor: 0\n2. Kata kunci penting: \n")
+    return fixed_chars + max_keywords * (max_keyword_chars + 2)
+
+# Indeks kunci jawaban per soal untuk jalur cepat jawaban singkat
+class KeyAnswerIndex:
+    """
+    Indeks kunci jawaban per pertanyaan (bentuk ternormalisasi, sinonim yang diterima,
+    dan varian dengan salah ketik). Jawaban singkat yang cocok dengan kunci bisa langsung
+    diberi skor penuh tanpa retrieval dan tanpa LLM.
+    """
+    
+    # Kata pengantar yang sering ditulis siswa sebelum jawaban inti
+    LEADING_FILLERS = ("jawaban", "jawabannya", "adalah", "yaitu", "ialah", "merupakan")
+    
+    def __init__(self, fuzzy_threshold: float = 0.88, synonyms: Optional[Dict[str, List[str]]] = None):
+        """
+        Inisialisasi indeks kunci jawaban
+        
+        Args:
+            fuzzy_threshold: Rasio kemiripan minimum (difflib) untuk kecocokan mendekati
+            synonyms: Peta kunci jawaban -> sinonim yang juga diterima, berlaku untuk semua soal
+        """
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_word_threshold = 0.75
+        self.synonyms: Dict[str, List[str]] = {
+            self.normalize(key): [self.normalize(value) for value in values]
+            for key, values in (synonyms or {}).items()
+        }
+        # kunci pertanyaan -> {jawaban ternormalisasi: (kunci asli, jenis kecocokan)}
+        self._keys: Dict[str, Dict[str, Tuple[str, str]]] = {}
+        # Jawaban yang pernah dinilai salah oleh guru; tidak boleh lewat jalur cepat
+        self._rejected: Dict[str, set] = {}
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def normalize(cls, text: str) -> str:
+        """Huruf kecil, tanpa tanda baca, spasi tunggal, dan tanpa kata pengantar di awal"""
+        text = unicodedata.normalize("NFKC", str(text or "")).lower()
+        words = re.sub(r"[^\w]+", " ", text).split()
+        while words and words[0] in cls.LEADING_FILLERS:
+            words = words[1:]
+        return " ".join(words)
+    
+    @classmethod
+    def question_key(cls, question: str) -> str:
+        return hashlib.sha1(cls.normalize(question).encode("utf-8")).hexdigest()
+    
+    def add(self, question: str, key_answer: str, match_type: str = "exact"):
+        """Tambahkan satu kunci jawaban (beserta sinonim globalnya) untuk pertanyaan"""
+        normalized = self.normalize(key_answer)
+        if not normalized:
+            return
+        with self._lock:
+            keys = self._keys.setdefault(self.question_key(question), {})
+            keys.setdefault(normalized, (key_answer.strip(), match_type))
+            for synonym in self.synonyms.get(normalized, []):
+                keys.setdefault(synonym, (key_answer.strip(), "synonym"))
+    
+    def add_rejected(self, question: str, answer: str):
+        """Catat jawaban yang dinilai salah agar tidak pernah dicocokkan secara fuzzy"""
+        normalized = self.normalize(answer)
+        if normalized:
+            with self._lock:
+                self._rejected.setdefault(self.question_key(question), set()).add(normalized)
+    
+    def set_key_answers(self, question: str, key_answers: List[str], synonyms: Optional[List[str]] = None):
+        """Ganti seluruh kunci jawaban sebuah pertanyaan (misal setelah soal diedit)"""
+        with self._lock:
+            self._keys.pop(self.question_key(question), None)
+        for key_answer in key_answers or []:
+            self.add(question, key_answer)
+        for synonym in synonyms or []:
+            self.add(question, synonym, match_type="synonym")
+    
+    def key_answers(self, question: str) -> List[str]:
+        """Daftar kunci jawaban ternormalisasi untuk pertanyaan (terurut)"""
+        with self._lock:
+            return sorted(self._keys.get(self.question_key(question), {}))
+    
+    def lookup(self, question: str, answer: str) -> Optional[Dict[str, Any]]:
+        """
+        Cari kunci jawaban yang cocok dengan jawaban siswa
+        
+        Args:
+            question: Pertanyaan
+            answer: Jawaban siswa
+            
+        Returns:
+            Dict berisi key_answer, match ("exact", "synonym", atau "fuzzy") dan similarity,
+            atau None jika tidak ada kecocokan yang meyakinkan
+        """
+        normalized = self.normalize(answer)
+        if not normalized:
+            return None
+        question_key = self.question_key(question)
+        with self._lock:
+            keys = dict(self._keys.get(question_key, {}))
+            rejected = self._rejected.get(question_key, set())
+        if not keys or normalized in rejected:
+            return None
+        
+        if normalized in keys:
+            key_answer, match_type = keys[normalized]
+            return {"key_answer": key_answer, "match": match_type, "similarity": 1.0}
+        
+        # Kecocokan fuzzy hanya untuk salah ketik: jumlah kata sama dan setiap kata mirip,
+        # sehingga jawaban dengan kata berbeda ("lambung dan usus") tidak ikut cocok
+        words = normalized.split()
+        best = None
+        for candidate, (key_answer, _) in keys.items():
+            candidate_words = candidate.split()
+            if len(candidate_words) != len(words):
+                continue
+            if any(
+                difflib.SequenceMatcher(None, word, candidate_word).ratio() < self.fuzzy_word_threshold
+                for word, candidate_word in zip(words, candidate_words)
+            ):
+                continue
+            similarity = difflib.SequenceMatcher(None, normalized, candidate).ratio()
+            if similarity >= self.fuzzy_threshold and (best is None or similarity > best["similarity"]):
+                best = {"key_answer": key_answer, "match": "fuzzy", "similarity": similarity}
+        return best
+    
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]], fuzzy_threshold: float = 0.88,
+                  synonyms: Optional[Dict[str, List[str]]] = None) -> 'KeyAnswerIndex':
+        """
+        Bangun indeks dari jawaban yang sudah dinilai guru
+        
+        Args:
+            rows: List dict dengan kunci question, answer, score, dan max_score;
+                jawaban yang mayoritas diberi skor penuh menjadi kunci, yang mayoritas
+                diberi skor 0 dicatat sebagai jawaban salah
+            fuzzy_threshold: Rasio kemiripan minimum untuk kecocokan mendekati
+            synonyms: Sinonim global yang diterima
+            
+        Returns:
+            Instance KeyAnswerIndex
+        """
+        index = cls(fuzzy_threshold=fuzzy_threshold, synonyms=synonyms)
+        # (pertanyaan, jawaban ternormalisasi) -> [jumlah skor penuh, jumlah skor 0, jawaban asli]
+        votes: Dict[Tuple[str, str], List[Any]] = {}
+        for row in rows:
+            score = row.get("score")
+            normalized = cls.normalize(row.get("answer", ""))
+            if score is None or not normalized:
+                continue
+            vote = votes.setdefault((row["question"], normalized), [0, 0, row["answer"]])
+            if score >= row.get("max_score", 2):
+                vote[0] += 1
+            elif score == 0:
+                vote[1] += 1
+        
+        # Penilaian guru tidak selalu konsisten; pakai suara mayoritas
+        for (question, _), (correct, wrong, answer) in votes.items():
+            if correct > wrong:
+                index.add(question, answer)
+            elif wrong > correct:
+                index.add_rejected(question, answer)
+        return index
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(keys) for keys in self._keys.values())
+
+# Pengatur anggaran token prompt terhadap jendela konteks model
+class TokenBudgeter:
+    """
+    Memastikan prompt evaluasi + output muat di jendela konteks model.
+    Referensi diurutkan dari yang paling relevan; jika prompt terlalu panjang,
+    referensi dengan peringkat terendah dibuang lebih dulu, lalu referensi terakhir
+    yang tersisa dipotong sampai prompt muat.
+    """
+    
+    def __init__(self, llm: LLMBackend, ctx_size: Optional[int] = None, safety_margin: int = 32,
+                 min_reference_chars: int = 200):
+        """
+        Inisialisasi budgeter
+        
+        Args:
+            llm: Backend LLM yang menyediakan count_tokens()
+            ctx_size: Ukuran konteks maksimum (None = ctx_size milik backend, atau 16384)
+            safety_margin: Cadangan token untuk token khusus/perbedaan tokenisasi
+            min_reference_chars: Panjang minimum referensi terakhir setelah dipotong
+        """
+        self.llm = llm
+        self.ctx_size = ctx_size or getattr(llm, "ctx_size", None) or 16384
+        self.safety_margin = safety_margin
+        self.min_reference_chars = min_reference_chars
+    
+    def count(self, text: str) -> int:
+        """Jumlah token teks menurut tokenizer backend"""
+        return self.llm.count_tokens(text)
+    
+    def token_limit(self, max_tokens: int) -> int:
+        """Jumlah token prompt maksimum agar masih tersisa max_tokens untuk output"""
+        return self.ctx_size - max_tokens - self.safety_margin
+    
+    def select_context_size(self, n_prompt_tokens: int, max_tokens: int) -> int:
+        """Ukuran konteks terkecil yang memuat prompt + output"""
+        return select_context_size(n_prompt_tokens + max_tokens + self.safety_margin, self.ctx_size)
+    
+    def fit_references(
+        self,
+        build_prompt: Callable[[List[str]], str],
+        references: List[str],
+        max_tokens: int
+    ) -> Tuple[str, List[str], int]:
+        """
+        Susun prompt dengan referensi sebanyak mungkin yang masih muat di konteks
+        
+        Args:
+            build_prompt: Fungsi yang membangun prompt lengkap dari daftar referensi
+            references: Referensi terurut dari peringkat tertinggi
+            max_tokens: Jumlah token yang dicadangkan untuk output
+            
+        Returns:
+            Tuple (prompt, referensi yang dipakai, jumlah token prompt)
+        """
+        limit = self.token_limit(max_tokens)
+        references = list(references)
+        prompt = build_prompt(references)
+        n_tokens = self.count(prompt)
+        if n_tokens <= limit:
+            return prompt, references, n_tokens
+        
+        original_count = len(references)
+        original_tokens = n_tokens
+        
+        # Buang referensi peringkat terendah selama masih ada lebih dari satu
+        while n_tokens > limit and len(references) > 1:
+            references.pop()
+            prompt = build_prompt(references)
+            n_tokens = self.count(prompt)
+        
+        # Potong referensi terakhir secara proporsional terhadap kelebihan token
+        for _ in range(5):
+            if n_tokens <= limit:
+                break
+            last = references[-1]
+            excess_chars = int((n_tokens - limit) * CHARS_PER_TOKEN_ESTIMATE) + 16
+            keep_chars = max(len(last) - excess_chars, self.min_reference_chars)
+            if keep_chars >= len(last):
+                break
+            references[-1] = last[:keep_chars].rsplit(" ", 1)[0] + " ..."
+            prompt = build_prompt(references)
+            n_tokens = self.count(prompt)
+        
+        logger.warning(
+            f"Prompt {original_tokens} token melebihi batas {limit} token (konteks {self.ctx_size}); "
+            f"referensi dikurangi dari {original_count} menjadi {len(references)} ({n_tokens} token)"
+        )
+        if n_tokens > limit:
+            logger.error("Prompt tetap melebihi konteks walaupun referensi sudah dipangkas")
+        return prompt, references, n_tokens
+    
+    def max_slots(self, build_prompt: Callable[[int], str], max_slots: int, tokens_per_slot: int) -> int:
+        """
+        Jumlah slot jawaban terbanyak yang prompt + output-nya masih muat di konteks
+        
+        Args:
+            build_prompt: Fungsi yang membangun prompt untuk k slot pertama
+            max_slots: Batas atas jumlah slot
+            tokens_per_slot: Token output yang dicadangkan per slot
+            
+        Returns:
+            Jumlah slot (minimal 1)
+        """
+        def fits(k: int) -> bool:
+            return self.count(build_prompt(k)) <= self.token_limit(k * tokens_per_slot)
+        
+        # Pencarian biner: panjang prompt bertambah monoton dengan jumlah slot
+        low, high = 1, max(1, max_slots)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if fits(middle):
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+# Kelas untuk penilaian jawaban
+class AnswerEvaluator:
+    """Kelas untuk mengevaluasi jawaban siswa"""
+    
+    def __init__(self, llm: LLMBackend, retriever: BM25Retriever, early_stop: bool = True,
+                 use_grammar: bool = False, max_keywords: int = 5, deterministic: bool = False,
+                 small_llm: Optional[LLMBackend] = None, cascade_min_confidence: float = 0.8,
+                 key_index: Optional[KeyAnswerIndex] = None, reference_mode: str = "answer",
+                 rerank_references: bool = True):
         """
-        Menghasilkan teks dari model berdasarkan prompt menggunakan llama-run
+        Inisialisasi evaluator jawaban
         
         Args:
-            prompt: Prompt untuk model
-            max_tokens: Jumlah token maksimum yang akan dihasilkan
-            temperature: Parameter temperature untuk sampling
+            llm: Instance backend LLM (LlamaModelCpp, LlamaServerModel, ...)
+            retriever: Instance dari BM25Retriever
+            early_stop: Hentikan generasi begitu baris skor dan kata kunci sudah lengkap
+            use_grammar: Batasi output LLM dengan grammar GBNF dari allowed_scores
+                (hanya berlaku jika backend mendukung grammar)
+            max_keywords: Jumlah maksimum kata kunci pada output ber-grammar
+            deterministic: Gunakan decoding greedy (temperature 0) di semua pemanggilan LLM
+                sehingga input yang sama selalu menghasilkan evaluasi yang sama; seed
+                diatur pada backend (lihat from_backend)
+            small_llm: Backend model kecil untuk cascade; soal singkat dinilai model kecil lebih
+                dulu dan hanya dieskalasi ke llm jika output tidak bisa diparse atau ragu.
+                Backend tanpa probabilitas token (llama-run) ditolak karena keyakinannya tidak bisa diukur
+            cascade_min_confidence: Probabilitas minimum token skor dari model kecil agar
+                hasilnya diterima tanpa eskalasi
+            key_index: Indeks kunci jawaban; jawaban singkat yang cocok langsung diberi skor
+                penuh tanpa retrieval dan LLM
+            reference_mode: "answer" = retrieval per jawaban (query pertanyaan + jawaban);
+                "question" = referensi diambil sekali per pertanyaan lalu dipakai ulang untuk
+                semua jawaban pada pertanyaan tersebut
+            rerank_references: Pada mode "question", urutkan ulang kandidat referensi per jawaban
+                berdasarkan cakupan kata jawaban (di memori, tanpa retrieval ulang)
+        """
+        if reference_mode not in REFERENCE_MODES:
+            raise ValueError(f"reference_mode harus salah satu dari {REFERENCE_MODES}: {reference_mode}")
+        self.llm = llm
+        self.retriever = retriever
+        self.early_stop = early_stop
+        self.stop_policy = EvaluationStopPolicy()
+        self.use_grammar = use_grammar
+        self.max_keywords = max_keywords
+        self.deterministic = deterministic
+        self.budgeter = TokenBudgeter(llm)
+        self.key_index = key_index
+        if small_llm is not None and not getattr(small_llm, "supports_token_probs", False):
+            # Tanpa probabilitas token setiap output model kecil akan dieskalasi: hanya menambah latensi
+            logger.warning("Model kecil tidak menyediakan probabilitas token, cascade dinonaktifkan")
+            small_llm = None
+        self.small_llm = small_llm
+        self.cascade_min_confidence = cascade_min_confidence
+        self.reference_mode = reference_mode
+        self.rerank_references = rerank_references
+        # Kandidat referensi per (pertanyaan, jumlah kandidat) beserta token setiap chunk dan jenjang retrieval
+        self._question_references: Dict[Tuple[str, int], Tuple[List[Dict[str, Any]], List[set], Dict[str, Any]]] = {}
+        # Hasil select_retrieval_tier dari prefetch_references per (query, top_k); diambil sekali oleh _retrieve_documents
+        self._prefetched_documents: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        # Porsi waktu retrieval prefetch per (query, top_k); dicatat ke timings evaluasi pertama yang memakainya
+        self._prefetch_timings: Dict[Tuple[str, int], Dict[str, float]] = {}
+        self._reference_lock = threading.Lock()
+        self.routing_stats = {
+            "small_accepted": 0,
+            "escalated_long": 0,
+            "escalated_parse": 0,
+            "escalated_confidence": 0,
+            "escalated_error": 0,
+            "large_calls": 0,
+            "small_seconds": 0.0,
+            "large_seconds": 0.0
+        }
+        self._routing_lock = threading.Lock()
+        # Konfigurasi generasi terakhir per thread/task asyncio, dicatat ke setiap hasil evaluasi
+        self._local = ContextLocal()
+        if self.use_grammar and not getattr(self.llm, "supports_grammar", False):
+            logger.warning("Backend LLM tidak mendukung grammar; evaluasi memakai parsing biasa")
+        if self.deterministic and getattr(self.llm, "seed", None) is None:
+            logger.warning("Mode deterministik tanpa seed di backend; hasil bergantung pada decoding greedy saja")
+    
+    @classmethod
+    def from_backend(cls, backend: str, model_path: str, retriever: BM25Retriever,
+                     deterministic: bool = False, seed: int = DETERMINISTIC_SEED, **llm_kwargs) -> 'AnswerEvaluator':
+        """
+        Membuat evaluator sekaligus backend LLM berdasarkan nama backend
+        
+        Args:
+            backend: Nama backend LLM ("llama-run", "llama-server", atau "llama-cpp-python")
+            model_path: Path ke file model GGUF
+            retriever: Instance retriever
+            deterministic: Aktifkan mode deterministik (greedy + seed tetap)
+            seed: Seed backend untuk mode deterministik
+            **llm_kwargs: Argumen tambahan untuk backend (misal n_threads, n_batch)
             
         Returns:
-            Teks yang dihasilkan
+            Instance AnswerEvaluator
         """
-        try:
-            # Gunakan prompt langsung seperti di gpu_test.py
-            # Perhatikan bahwa llama-run mengharapkan prompt sebagai argumen terakhir
-            cmd = [
-                self.llama_path,
-                "--ngl", str(self.n_gpu_layers),  # offload layer ke GPU
-                "-c", str(self.ctx_size),        # context size
-                "-n", str(max_tokens),           # max tokens
-                "-t", str(temperature),         # temperature
-                self.model_path,                # path ke model
-                prompt                          # prompt langsung setelah model
+        if deterministic:
+            llm_kwargs.setdefault("seed", seed)
+        return cls(create_llm_backend(backend, model_path, **llm_kwargs), retriever, deterministic=deterministic)
+    
+    def _generation_config(self, max_tokens: Optional[int] = None, temperature: Optional[float] = None,
+                           grammar: Optional[str] = None, llm: Optional[LLMBackend] = None) -> Dict[str, Any]:
+        """Parameter generasi yang menentukan output LLM, dicatat bersama hasil evaluasi"""
+        llm = llm or self.llm
+        return {
+            "model": os.path.basename(str(getattr(llm, "model_path", "") or "")),
+            "deterministic": self.deterministic,
+            "temperature": temperature,
+            "seed": getattr(llm, "seed", None),
+            "max_tokens": max_tokens,
+            "grammar": grammar is not None,
+            "early_stop": self.early_stop and grammar is None
+        }
+    
+    def evaluation_fingerprint(self, question: str, student_answer: str, top_k: int = 5,
+                               question_type: Optional[str] = None) -> Optional[str]:
+        """
+        Sidik jari input evaluasi dalam mode deterministik.
+        Hasil yang tersimpan dengan sidik jari yang sama bisa dipakai ulang tanpa evaluasi ulang.
+        
+        Returns:
+            Hash hex, atau None jika evaluator tidak deterministik
+        """
+        if not self.deterministic:
+            return None
+        payload = {
+            "question": question,
+            "answer": student_answer,
+            "top_k": top_k,
+            "question_type": self._get_scoring_config(question_type)["type"],
+            "retriever": type(self.retriever).__name__,
+            "use_grammar": self.use_grammar,
+            "key_answers": self.key_index.key_answers(question) if self.key_index is not None else None,
+            "config": self._generation_config()
+        }
+        if self.reference_mode != "answer":
+            # Hanya ditambahkan di luar mode default agar sidik jari lama tetap berlaku
+            payload["reference_mode"] = [self.reference_mode, self.rerank_references]
+        if self.small_llm is not None:
+            # Model kecil dan ambang keyakinan menentukan jawaban mana yang dinilai model kecil
+            payload["cascade"] = [
+                self._generation_config(llm=self.small_llm)["model"],
+                self.cascade_min_confidence
             ]
-            
-            logger.info(f"Menjalankan llama-run dengan {max_tokens} token maksimum...")
-            start_time = time.time()
-            
-            # Jalankan proses dengan timeout yang cukup
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-            
-            elapsed = time.time() - start_time
-            logger.info(f"Inferensi selesai dalam {elapsed:.2f} detik")
-            
-            if result.returncode != 0:
-                logger.error(f"Error saat menjalankan llama-run: {result.stderr}")
-                # Coba cara alternatif jika gagal
-                return self._generate_alternative(prompt, max_tokens, temperature)
-            
-            # Ambil output dari stdout
-            output = result.stdout.strip()
-            
-            # Hapus prompt dari output jika ada
-            if output.startswith(prompt):
-                output = output[len(prompt):].strip()
-            
-            # Jika output kosong, coba cara alternatif
-            if not output:
-                logger.warning("Output kosong, mencoba cara alternatif...")
-                return self._generate_alternative(prompt, max_tokens, temperature)
-                
-            return output
-            
-        except subprocess.TimeoutExpired:
-            logger.error("Timeout saat menjalankan llama-run, mencoba cara alternatif...")
-            return self._generate_alternative(prompt, max_tokens, temperature)
-        except Exception as e:
-            logger.error(f"Error saat menghasilkan teks: {e}")
-            return self._generate_alternative(prompt, max_tokens, temperature)
-            
-    def _generate_alternative(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.7) -> str:
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    
+    def _generate(self, prompt: str, max_tokens: int, temperature: float, prompt_prefix: Optional[str] = None,
+                  grammar: Optional[str] = None, scoring_config: Optional[Dict[str, Any]] = None,
+                  early_stop: Optional[bool] = None) -> str:
         """
-        Metode alternatif untuk menghasilkan teks jika cara utama gagal
+        Panggil LLM; dengan early_stop, generasi streaming dihentikan setelah format output lengkap.
+        Jika scoring_config diberikan dan small_llm diatur, request dirutekan lewat cascade.
+        early_stop=False mematikan early stop untuk output yang formatnya berbeda (multi-jawaban).
         """
+        return run_steps(self._generation_steps(prompt, max_tokens, temperature, prompt_prefix, grammar,
+                                                scoring_config, early_stop))
+    
+    async def _agenerate(self, prompt: str, max_tokens: int, temperature: float, prompt_prefix: Optional[str] = None,
+                         grammar: Optional[str] = None, scoring_config: Optional[Dict[str, Any]] = None,
+                         early_stop: Optional[bool] = None) -> str:
+        """Versi async dari _generate: menunggu backend tanpa menahan thread"""
+        return await arun_steps(self._generation_steps(prompt, max_tokens, temperature, prompt_prefix, grammar,
+                                                       scoring_config, early_stop))
+    
+    def _generation_steps(self, prompt: str, max_tokens: int, temperature: float, prompt_prefix: Optional[str],
+                          grammar: Optional[str], scoring_config: Optional[Dict[str, Any]],
+                          early_stop: Optional[bool]):
+        """Alur _generate/_agenerate sebagai generator langkah (lihat run_steps); waktunya dicatat ke llm_ms"""
+        start_time = time.perf_counter()
         try:
-            # Simpan prompt ke file sementara
-            with tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', delete=False, suffix='.txt') as temp_file:
-                temp_file.write(prompt)
-                temp_file_path = temp_file.name
-            
-            # Gunakan pendekatan dengan file prompt
-            cmd = [
-                self.llama_path,
-                "--ngl", str(self.n_gpu_layers),
-                "-c", str(self.ctx_size),
-                "-n", str(max_tokens),
-                "-t", str(temperature),
-                "-f", temp_file_path,
-                self.model_path
-            ]
-            
-            logger.info("Mencoba metode alternatif dengan file prompt...")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-            
-            # Hapus file sementara
-            try:
-                os.unlink(temp_file_path)
-            except:
-                pass
-            
-            if result.returncode != 0:
-                logger.error(f"Metode alternatif juga gagal: {result.stderr}")
-                # Buat respons default
-                return self._create_default_response(prompt)
-            
-            output = result.stdout.strip()
+            if self.deterministic:
+                temperature = 0.0
+            if scoring_config is not None and self.small_llm is not None:
+                output = yield from self._small_generation_steps(prompt, max_tokens, temperature, prompt_prefix,
+                                                                 grammar, scoring_config)
+                if output is not None:
+                    return output
             
-            # Jika output kosong, buat respons default
-            if not output:
-                return self._create_default_response(prompt)
-                
+            early_stop, generated_before, large_start = self._begin_large_call(max_tokens, temperature, grammar, early_stop)
+            if early_stop and hasattr(self.llm, "generate_until"):
+                output = yield step_call(self.llm, "generate_until", prompt, max_tokens=max_tokens,
+                                         temperature=temperature, stop_policy=self.stop_policy,
+                                         prompt_prefix=prompt_prefix)
+            else:
+                output = yield step_call(self.llm, "generate", prompt, max_tokens=max_tokens, temperature=temperature,
+                                         prompt_prefix=prompt_prefix, grammar=grammar)
+            self._end_large_call(output, generated_before, large_start)
             return output
-            
-        except Exception as e:
-            logger.error(f"Error pada metode alternatif: {e}")
-            return self._create_default_response(prompt)
+        finally:
+            record_stage_timing("llm_ms", (time.perf_counter() - start_time) * 1000.0)
     
-    def _create_default_response(self, prompt: str) -> str:
-        """Buat respons default jika semua metode gagal"""
-        logger.warning("Membuat respons default karena semua metode gagal")
+    def _begin_large_call(self, max_tokens: int, temperature: float, grammar: Optional[str],
+                          early_stop: Optional[bool]) -> Tuple[bool, float, float]:
+        """Catat konfigurasi generasi model utama; mengembalikan (early_stop efektif, token sebelum, waktu mulai)"""
+        early_stop = (self.early_stop if early_stop is None else early_stop) and grammar is None
+        self._local.generation_config = self._generation_config(max_tokens, temperature, grammar)
+        self._local.generation_config["early_stop"] = early_stop
+        record_stage_timing("llm_calls", 1)
+        return early_stop, get_stage_timing("generated_tokens"), time.time()
+    
+    def _end_large_call(self, output: Optional[str], generated_before: float, start_time: float):
+        self._record_generated_tokens(generated_before, output)
+        if self.small_llm is not None:
+            self._local.generation_config["route"] = "large"
+            self._record_route("large_calls", large_seconds=time.time() - start_time)
+    
+    @staticmethod
+    def _record_generated_tokens(generated_before: float, output: Optional[str]):
+        """
+        Perkirakan token output jika backend tidak mencatatnya sendiri
+        (llama-run, cache respons, atau request yang lewat thread BatchingScheduler)
+        """
+        if get_stage_timing("generated_tokens") == generated_before:
+            record_stage_timing("generated_tokens", estimate_tokens(output) - 1 if output else 0)
+    
+    def _record_route(self, outcome: Optional[str], small_seconds: float = 0.0, large_seconds: float = 0.0):
+        with self._routing_lock:
+            if outcome:
+                self.routing_stats[outcome] += 1
+            self.routing_stats["small_seconds"] += small_seconds
+            self.routing_stats["large_seconds"] += large_seconds
+    
+    def _small_generation_steps(self, prompt: str, max_tokens: int, temperature: float,
+                                prompt_prefix: Optional[str], grammar: Optional[str],
+                                scoring_config: Dict[str, Any]):
+        """
+        Tahap pertama cascade: nilai dengan model kecil. Generator langkah; pada versi async
+        generate_with_probs dijalankan di executor.
         
-        # Cek apakah ini adalah prompt evaluasi
-        if "PERTANYAAN:" in prompt and "JAWABAN SISWA:" in prompt and "REFERENSI:" in prompt:
-            return """
-        1. Skor: 0
-
-        2. Kata kunci penting: (tidak tersedia)
+        Returns:
+            Output model kecil jika diterima, atau None jika harus dieskalasi ke model besar
         """
-        else:
-            return "Maaf, tidak dapat menghasilkan respons untuk prompt ini."
-
-# Kelas untuk penilaian jawaban
-class AnswerEvaluator:
-    """Kelas untuk mengevaluasi jawaban siswa"""
+        if not self._small_eligible(scoring_config):
+            return None
+        if grammar and not getattr(self.small_llm, "supports_grammar", False):
+            grammar = None
+        generated_before = get_stage_timing("generated_tokens")
+        record_stage_timing("llm_calls", 1)
+        start_time = time.time()
+        output, token_probs = yield step_call(
+            self.small_llm, "generate_with_probs", prompt, max_tokens=max_tokens, temperature=temperature,
+            prompt_prefix=prompt_prefix, grammar=grammar
+        )
+        self._record_generated_tokens(generated_before, output)
+        return self._accept_small_output(prompt, output, token_probs, time.time() - start_time,
+                                         max_tokens, temperature, grammar, scoring_config)
+    
+    def _small_eligible(self, scoring_config: Dict[str, Any]) -> bool:
+        if scoring_config["type"] == "panjang":
+            # Rubrik 1-4 terlalu halus untuk model kecil
+            self._record_route("escalated_long")
+            return False
+        return True
     
-    def __init__(self, llm: LlamaModelCpp, retriever: BM25Retriever):
+    def _accept_small_output(self, prompt: str, output: str, token_probs: Optional[List[Tuple[str, float]]],
+                             elapsed: float, max_tokens: int, temperature: float, grammar: Optional[str],
+                             scoring_config: Dict[str, Any]) -> Optional[str]:
         """
-        Inisialisasi evaluator jawaban
+        Terima output model kecil, atau None (eskalasi) jika model kecil gagal, output tidak bisa
+        diparse, atau keyakinannya rendah
+        """
+        # Respons default ("Skor: 0") berarti model kecil gagal, bukan penilaian skor 0
+        if not output or output.strip() == LLMBackend._default_response_text(prompt).strip():
+            logger.info("Model kecil gagal menghasilkan output, eskalasi ke model besar")
+            self._record_route("escalated_error", small_seconds=elapsed)
+            record_stage_timing("retries", 1)
+            return None
+        
+        match = re.search(r'Skor[:\s]*\(?(\d+)', output or "")
+        if not match or int(match.group(1)) not in scoring_config["allowed_scores"]:
+            logger.info("Output model kecil tidak dapat diparse, eskalasi ke model besar")
+            self._record_route("escalated_parse", small_seconds=elapsed)
+            record_stage_timing("retries", 1)
+            return None
+        
+        confidence = self._score_confidence(token_probs, match.start(1), output)
+        if confidence is None:
+            logger.info("Probabilitas token skor dari model kecil tidak tersedia, eskalasi ke model besar")
+            self._record_route("escalated_error", small_seconds=elapsed)
+            record_stage_timing("retries", 1)
+            return None
+        if confidence is not None and confidence < self.cascade_min_confidence:
+            logger.info(f"Keyakinan skor model kecil rendah ({confidence:.2f}), eskalasi ke model besar")
+            self._record_route("escalated_confidence", small_seconds=elapsed)
+            record_stage_timing("retries", 1)
+            return None
+        
+        self._record_route("small_accepted", small_seconds=elapsed)
+        config = self._generation_config(max_tokens, temperature, grammar, llm=self.small_llm)
+        config["route"] = "small"
+        config["score_confidence"] = confidence
+        self._local.generation_config = config
+        return output
+    
+    @staticmethod
+    def _score_confidence(token_probs: Optional[List[Tuple[str, float]]], score_offset: int,
+                          output: str) -> Optional[float]:
+        """
+        Probabilitas token yang memuat angka skor pada output
         
         Args:
-            llm: Instance dari LlamaModel
-            retriever: Instance dari BM25Retriever
+            token_probs: List (token, probabilitas) dari backend
+            score_offset: Posisi karakter angka skor pada output (yang sudah di-strip)
+            output: Teks output
+            
+        Returns:
+            Probabilitas token skor, atau None jika backend tidak menyediakan probabilitas
         """
-        self.llm = llm
-        self.retriever = retriever
+        if not token_probs:
+            return None
+        text = "".join(token for token, _ in token_probs)
+        # Output di-strip oleh backend; sesuaikan posisi dengan whitespace di awal teks token
+        position = score_offset + (len(text) - len(text.lstrip()))
+        offset = 0
+        for token, prob in token_probs:
+            if offset <= position < offset + len(token):
+                return prob
+            offset += len(token)
+        return None
+    
+    def get_routing_stats(self) -> Dict[str, Any]:
+        """
+        Statistik routing cascade: berapa request diselesaikan model kecil, berapa yang
+        dieskalasi (per alasan), dan porsi waktu inferensi tiap model
+        """
+        with self._routing_lock:
+            stats = dict(self.routing_stats)
+        routed = (stats["small_accepted"] + stats["escalated_long"] + stats["escalated_parse"]
+                  + stats["escalated_confidence"] + stats["escalated_error"])
+        stats["routed"] = routed
+        stats["small_share"] = stats["small_accepted"] / routed if routed else 0.0
+        total_seconds = stats["small_seconds"] + stats["large_seconds"]
+        stats["large_time_share"] = stats["large_seconds"] / total_seconds if total_seconds else 0.0
+        return stats
+    
+    def _parse_constrained_output(self, evaluation_text: str, scoring_config: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+        """
+        Parse output yang dihasilkan dengan grammar evaluasi dalam satu langkah
+        
+        Returns:
+            Tuple (skor, teks evaluasi) atau None jika output tidak sesuai grammar
+        """
+        match = re.match(
+            r'\s*1\. Skor: (\d+)\n2\. Kata kunci penting: ([^\n]*)',
+            evaluation_text or ""
+        )
+        if not match:
+            return None
+        score = int(match.group(1))
+        if score not in scoring_config["allowed_scores"]:
+            return None
+        keywords = match.group(2).strip()
+        return score, f"1. Skor: {score}\n2. Kata kunci penting: {keywords}"
     
     def _get_scoring_config(self, question_type: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -1192,6 +4918,13 @@ class AnswerEvaluator:
         # Gabungkan semua bagian
         return "\n\n".join(parts)
         
+    @staticmethod
+    def _similarity_tokens(text: str) -> set:
+        """Tokenisasi sederhana untuk kemiripan kata: huruf kecil, tanpa tanda baca"""
+        # Hapus karakter khusus
+        text = re.sub(r'[^\w\s]', ' ', text.lower())
+        return set(text.split())
+    
     def _calculate_answer_similarity(self, student_answer: str, reference_texts: List[str]) -> float:
         """
         Menghitung kemiripan antara jawaban siswa dan referensi
@@ -1203,21 +4936,12 @@ class AnswerEvaluator:
         Returns:
             Skor kemiripan (0-1)
         """
-        # Tokenisasi sederhana
-        def tokenize(text):
-            # Bersihkan teks dan tokenisasi
-            text = text.lower()
-            # Hapus karakter khusus
-            text = re.sub(r'[^\w\s]', ' ', text)
-            # Tokenisasi
-            return set(text.split())
-        
         # Tokenisasi jawaban siswa
-        student_tokens = tokenize(student_answer)
+        student_tokens = self._similarity_tokens(student_answer)
         
         # Gabungkan semua referensi
         combined_reference = " ".join(reference_texts)
-        reference_tokens = tokenize(combined_reference)
+        reference_tokens = self._similarity_tokens(combined_reference)
         
         # Hitung Jaccard similarity
         if not student_tokens or not reference_tokens:
@@ -1228,30 +4952,20 @@ class AnswerEvaluator:
         
         return intersection / union if union > 0 else 0.0
     
-    def create_evaluation_prompt(
-        self,
-        question: str,
-        student_answer: str,
-        reference_texts: List[str],
-        scoring_config: Optional[Dict[str, Any]] = None,
-        reference_hint: str = ""
-    ) -> str:
+    def create_evaluation_prompt_prefix(self, scoring_config: Optional[Dict[str, Any]] = None) -> str:
         """
-        Membuat prompt untuk evaluasi jawaban
+        Membuat bagian awal prompt evaluasi yang sama untuk semua jawaban dengan tipe soal
+        yang sama (instruksi, rubrik, contoh, dan opsi skor). Backend LLM dapat menyimpan
+        KV-cache bagian ini sehingga hanya sufiks (pertanyaan, jawaban, referensi) yang
+        perlu di-prefill ulang.
         
         Args:
-            question: Pertanyaan yang diberikan
-            student_answer: Jawaban siswa
-            reference_texts: Teks referensi dari retriever
             scoring_config: Konfigurasi penilaian khusus tipe soal
-            reference_hint: Petunjuk tambahan tentang kemiripan dengan referensi
             
         Returns:
-            Prompt untuk model
+            Prefix prompt, diakhiri dengan pembuka giliran user
         """
         config = scoring_config or self._get_scoring_config(None)
-        max_score = config["max_score"]
-        references = "\n\n".join(reference_texts)
         if config["type"] == "singkat":
             scoring_instructions = (
                 "Soal ini bertipe singkat. Gunakan hanya skor 0 atau 2 sesuai rubrik berikut:\n"
@@ -1346,7 +5060,33 @@ Jangan ubah awalan angka di atas (harus persis "1." dan "2.").
 <|im_end|>
 
 <|im_start|>user
-PERTANYAAN:
+"""
+        return prompt
+    
+    def create_evaluation_prompt(
+        self,
+        question: str,
+        student_answer: str,
+        reference_texts: List[str],
+        scoring_config: Optional[Dict[str, Any]] = None,
+        reference_hint: str = ""
+    ) -> str:
+        """
+        Membuat prompt untuk evaluasi jawaban
+        
+        Args:
+            question: Pertanyaan yang diberikan
+            student_answer: Jawaban siswa
+            reference_texts: Teks referensi dari retriever
+            scoring_config: Konfigurasi penilaian khusus tipe soal
+            reference_hint: Petunjuk tambahan tentang kemiripan dengan referensi
+            
+        Returns:
+            Prompt untuk model
+        """
+        config = scoring_config or self._get_scoring_config(None)
+        references = "\n\n".join(reference_texts)
+        prompt = self.create_evaluation_prompt_prefix(config) + f"""PERTANYAAN:
 {question}
 
 JAWABAN SISWA:
@@ -1358,6 +5098,47 @@ REFERENSI:
 Beri skor jawaban siswa mengikuti rubrik di atas.
 <|im_end|>
 
+<|im_start|>assistant
+"""
+        return prompt
+
+    def create_multi_evaluation_prompt(
+        self,
+        question: str,
+        student_answers: List[str],
+        reference_texts: List[str],
+        scoring_config: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Membuat prompt evaluasi untuk beberapa jawaban dari pertanyaan yang sama
+        
+        Args:
+            question: Pertanyaan yang diberikan
+            student_answers: Jawaban siswa, masing-masing mendapat slot bernomor
+            reference_texts: Teks referensi dari retriever
+            scoring_config: Konfigurasi penilaian khusus tipe soal
+            
+        Returns:
+            Prompt untuk model
+        """
+        config = scoring_config or self._get_scoring_config(None)
+        references = "\n\n".join(reference_texts)
+        answers = "\n".join(
+            f"[{slot}] {' '.join(str(answer).split())}" for slot, answer in enumerate(student_answers, start=1)
+        )
+        prompt = self.create_evaluation_prompt_prefix(config) + f"""PERTANYAAN:
+{question}
+
+JAWABAN SISWA ({len(student_answers)} jawaban dari siswa berbeda, nilai masing-masing secara terpisah):
+{answers}
+
+REFERENSI:
+{references}
+
+Beri skor setiap jawaban siswa mengikuti rubrik di atas. Tulis tepat satu baris per jawaban, berurutan, dengan format:
+[nomor] Skor: [angka {config['score_options_display']}] | Kata kunci penting: [kata kunci penting]
+<|im_end|>
+
 <|im_start|>assistant
 """
         return prompt
@@ -1365,23 +5146,446 @@ Beri skor jawaban siswa mengikuti rubrik di atas.
     def evaluate_answer(
         self,
         question: str,
-        student_answer: str,
+        student_answer: str,
+        top_k: int = 5,
+        question_type: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Mengevaluasi jawaban siswa
+        
+        Args:
+            question: Pertanyaan yang diberikan
+            student_answer: Jawaban siswa
+            top_k: Jumlah dokumen referensi yang akan diambil
+            question_type: Jenis soal untuk menentukan rubrik penilaian
+            
+        Returns:
+            Hasil evaluasi, termasuk scoring_path (jalur yang menghasilkan skor), retrieval_tier
+            (jenjang skor minimum referensi: tier, min_score, counts; None tanpa retrieval), generation_config,
+            timings (waktu per tahap dan jumlah token), dan evaluation_fingerprint dalam mode deterministik
+        """
+        return run_steps(self._evaluation_steps(question, student_answer, top_k, question_type))
+    
+    def _evaluation_steps(self, question: str, student_answer: str, top_k: int, question_type: Optional[str]):
+        """Alur evaluate_answer/aevaluate_answer sebagai generator langkah: timings lalu finalisasi hasil"""
+        self._local.generation_config = None
+        self._local.retrieval_tier = None
+        start_time = time.perf_counter()
+        with collect_stage_timings() as timings:
+            result = yield from self._answer_steps(question, student_answer, top_k, question_type)
+        result["timings"] = format_stage_timings(timings, (time.perf_counter() - start_time) * 1000.0)
+        return self._finalize_result(result, question, student_answer, top_k, question_type)
+    
+    def _finalize_result(self, result: Dict[str, Any], question: str, student_answer: str, top_k: int,
+                         question_type: Optional[str]) -> Dict[str, Any]:
+        """Lengkapi hasil evaluasi dengan scoring_path, retrieval_tier, generation_config, dan evaluation_fingerprint"""
+        result.setdefault("scoring_path", "llm")
+        result.setdefault("retrieval_tier", getattr(self._local, "retrieval_tier", None))
+        # Tanpa pemanggilan LLM (misal jawaban kosong), yang dicatat hanya konfigurasi statis
+        result["generation_config"] = (
+            result.get("generation_config") or self._local.generation_config or self._generation_config()
+        )
+        fingerprint = self.evaluation_fingerprint(question, student_answer, top_k=top_k, question_type=question_type)
+        if fingerprint:
+            result["evaluation_fingerprint"] = fingerprint
+        return result
+    
+    def _references_for(self, question: str, answer_text: str, top_k: int) -> List[str]:
+        """
+        Teks referensi untuk prompt sesuai reference_mode
+        
+        Args:
+            question: Pertanyaan
+            answer_text: Jawaban siswa (atau gabungan jawaban untuk prompt multi-jawaban)
+            top_k: Jumlah referensi
+            
+        Returns:
+            List teks referensi
+        """
+        if self.reference_mode == "answer":
+            # Gabungkan pertanyaan (dengan bobot lebih) dan jawaban untuk retrieval
+            # Biarkan LLM yang mengidentifikasi kata kunci penting
+            return self._retrieve_references(self._answer_query(question, answer_text), top_k)
+        
+        candidates, candidate_tokens = self._question_candidates(question, top_k)
+        if self.rerank_references and len(candidates) > 1:
+            candidates = self._rerank_candidates(candidates, candidate_tokens, answer_text)
+        reference_texts = [doc["chunk"] for doc in candidates[:top_k]]
+        if not reference_texts:
+            logger.warning("Tidak ada referensi yang ditemukan untuk evaluasi")
+            reference_texts = ["Tidak ada referensi yang ditemukan."]
+        return reference_texts
+    
+    @staticmethod
+    def _answer_query(question: str, answer_text: str) -> str:
+        """Query retrieval mode "answer": pertanyaan (bobot ganda) ditambah jawaban"""
+        return f"{question} {question} {answer_text}"
+    
+    def _question_pool_size(self, top_k: int) -> int:
+        """Jumlah kandidat referensi yang diambil per pertanyaan pada mode question"""
+        return top_k * QUESTION_REFERENCE_POOL_FACTOR if self.rerank_references else top_k
+    
+    def _question_candidates(self, question: str, top_k: int) -> Tuple[List[Dict[str, Any]], List[set]]:
+        """Kandidat referensi untuk pertanyaan; retrieval hanya dijalankan sekali per pertanyaan"""
+        pool_size = self._question_pool_size(top_k)
+        key = (question, pool_size)
+        with self._reference_lock:
+            entry = self._question_references.get(key)
+        self._record_prefetch_timings((f"{question} {question}", pool_size))
+        if entry is None:
+            retrieval_start = time.perf_counter()
+            candidates = self._retrieve_documents(f"{question} {question}", pool_size)
+            record_stage_timing("retrieval_ms", (time.perf_counter() - retrieval_start) * 1000.0)
+            entry = self._question_entry(candidates, self._local.retrieval_tier)
+            with self._reference_lock:
+                entry = self._question_references.setdefault(key, entry)
+        candidates, candidate_tokens, self._local.retrieval_tier = entry
+        return candidates, candidate_tokens
+    
+    def _question_entry(self, candidates: List[Dict[str, Any]],
+                        retrieval_tier: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[set], Dict[str, Any]]:
+        """Entri _question_references: kandidat, token setiap chunk, dan jenjang retrieval"""
+        return candidates, [self._similarity_tokens(doc["chunk"]) for doc in candidates], retrieval_tier
+    
+    @staticmethod
+    def _rerank_candidates(candidates: List[Dict[str, Any]], candidate_tokens: List[set],
+                           answer_text: str) -> List[Dict[str, Any]]:
+        """
+        Urutkan ulang kandidat untuk satu jawaban: skor retrieval ternormalisasi digabung dengan
+        porsi kata jawaban yang muncul di chunk. Urutan retrieval dipertahankan jika skornya sama.
+        """
+        answer_tokens = AnswerEvaluator._similarity_tokens(answer_text)
+        if not answer_tokens:
+            return candidates
+        scores = [doc.get("score", 0.0) for doc in candidates]
+        low, high = min(scores), max(scores)
+        weight = QUESTION_REFERENCE_RETRIEVAL_WEIGHT
+        
+        def combined(position: int) -> float:
+            retrieval_score = (scores[position] - low) / (high - low) if high > low else 1.0
+            coverage = len(answer_tokens & candidate_tokens[position]) / len(answer_tokens)
+            return weight * retrieval_score + (1.0 - weight) * coverage
+        
+        order = sorted(range(len(candidates)), key=lambda position: -combined(position))
+        return [candidates[position] for position in order]
+    
+    @timed_stage("retrieval_ms")
+    def _retrieve_references(self, query: str, top_k: int) -> List[str]:
+        """Ambil teks referensi untuk query; skor minimum diturunkan jika hasil terlalu sedikit"""
+        reference_texts = [doc["chunk"] for doc in self._retrieve_documents(query, top_k)]
+        
+        if not reference_texts:
+            logger.warning("Tidak ada referensi yang ditemukan untuk evaluasi")
+            reference_texts = ["Tidak ada referensi yang ditemukan."]
+        return reference_texts
+    
+    def _retrieve_documents(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        """
+        Dokumen hasil retrieval untuk query dengan skor minimum 1.0, diturunkan ke 0.5 jika terlalu sedikit.
+        Jenjang yang dipakai dicatat di _local.retrieval_tier untuk hasil evaluasi.
+        """
+        with self._reference_lock:
+            retrieval = self._prefetched_documents.pop((query, top_k), None)
+        if retrieval is None:
+            retrieval = self._retrieve_tiered([query], top_k)[0]
+        else:
+            self._record_prefetch_timings((query, top_k))
+        self._local.retrieval_tier = self._tier_summary(retrieval)
+        return retrieval["documents"]
+    
+    @staticmethod
+    def _tier_summary(retrieval: Dict[str, Any]) -> Dict[str, Any]:
+        """Hasil select_retrieval_tier tanpa dokumennya (tier, min_score, counts)"""
+        return {"tier": retrieval["tier"], "min_score": retrieval["min_score"], "counts": list(retrieval["counts"])}
+    
+    def _retrieve_tiered(self, queries: List[str], top_k: int) -> List[Dict[str, Any]]:
+        """
+        Retrieval berjenjang: skor minimum RETRIEVAL_MIN_SCORE_TIERS (1.0 lalu 0.5) diterapkan pada
+        satu daftar kandidat per query, dan jenjang pertama yang menghasilkan minimal
+        max(RETRIEVAL_MIN_RESULTS, top_k) dokumen yang dipakai
+        
+        Returns:
+            Hasil select_retrieval_tier per query (documents, tier, min_score, counts)
+        """
+        min_scores = RETRIEVAL_MIN_SCORE_TIERS
+        min_count = max(RETRIEVAL_MIN_RESULTS, top_k)
+        if hasattr(self.retriever, "retrieve_tiers_many"):
+            tier_results = self.retriever.retrieve_tiers_many(queries, top_k=top_k, min_scores=min_scores)
+            retrievals = [select_retrieval_tier(tiers, min_scores, min_count) for tiers in tier_results]
+        else:
+            # Retriever tanpa dukungan jenjang: retrieve diulang per ambang hanya jika hasilnya kurang
+            retrievals = []
+            for query in queries:
+                tiers: List[List[Dict[str, Any]]] = []
+                for min_score in min_scores:
+                    tiers.append(self.retriever.retrieve(query, top_k=top_k, min_score=min_score))
+                    if len(tiers[-1]) >= min_count:
+                        break
+                retrieval = select_retrieval_tier(tiers, min_scores[:len(tiers)], min_count)
+                retrievals.append(retrieval)
+        
+        fallbacks = [retrieval for retrieval in retrievals if retrieval["tier"] > 0]
+        if fallbacks:
+            logger.warning(f"{len(fallbacks)} dari {len(queries)} query menemukan kurang dari {min_count} referensi "
+                           f"dengan skor minimum {min_scores[0]}; memakai skor minimum "
+                           f"{', '.join(str(score) for score in sorted({retrieval['min_score'] for retrieval in fallbacks}, reverse=True))}")
+        return retrievals
+    
+    def _prefetch_tiered(self, queries: List[str], top_k: int) -> List[Dict[str, Any]]:
+        """
+        _retrieve_tiered untuk prefetch; waktu retrieval (termasuk sub-tahap sparse/dense/fusion)
+        dibagi rata per query agar baris yang memakai hasil prefetch tidak tercatat retrieval ~0 ms
+        """
+        start_time = time.perf_counter()
+        with collect_stage_timings() as timings:
+            retrievals = self._retrieve_tiered(queries, top_k)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000.0
+        timings["retrieval_ms"] = elapsed_ms
+        share = {name: value / len(queries) for name, value in timings.items()}
+        with self._reference_lock:
+            for query in queries:
+                self._prefetch_timings[(query, top_k)] = share
+        logger.info(f"Prefetch referensi untuk {len(queries)} query dalam {elapsed_ms:.1f} ms")
+        return retrievals
+    
+    def _record_prefetch_timings(self, key: Tuple[str, int]):
+        """Catat porsi waktu prefetch untuk key ke collect_stage_timings yang aktif (sekali per key)"""
+        with self._reference_lock:
+            share = self._prefetch_timings.pop(key, None)
+        for name, value in (share or {}).items():
+            record_stage_timing(name, value)
+    
+    def prefetch_references(self, groups: List[Tuple[str, List[str], Optional[str]]], top_k: int = 5,
+                            max_slots: int = 1) -> int:
+        """
+        Ambil referensi untuk banyak kelompok jawaban sekaligus lewat retriever.retrieve_tiers_many,
+        sebelum pemanggilan LLM untuk kelompok tersebut dimulai. Hasilnya dipakai oleh
+        evaluate_answer/evaluate_answers tanpa retrieval ulang; waktu prefetch dibagi rata per query dan
+        masuk ke timings evaluasi yang memakainya. Tanpa retrieve_tiers_many di retriever,
+        tidak ada yang diambil dan retrieval tetap berjalan per jawaban.
+        
+        Args:
+            groups: List (pertanyaan, daftar jawaban, tipe soal); satu jawaban dinilai lewat
+                evaluate_answer, lebih dari satu lewat evaluate_answers
+            top_k: Jumlah referensi per evaluasi
+            max_slots: Nilai max_slots yang dipakai evaluate_answers
+            
+        Returns:
+            Jumlah query retrieval yang dijalankan
+        """
+        if not hasattr(self.retriever, "retrieve_tiers_many"):
+            return 0
+        
+        if self.reference_mode == "question":
+            # Satu query per pertanyaan yang kandidatnya belum tersimpan
+            pool_size = self._question_pool_size(top_k)
+            questions: List[str] = []
+            for question, answers, question_type in groups:
+                with self._reference_lock:
+                    known = (question, pool_size) in self._question_references
+                if known or question in questions or not self._pending_answers(question, answers, question_type):
+                    continue
+                questions.append(question)
+            if not questions:
+                return 0
+            retrieved = self._prefetch_tiered([f"{question} {question}" for question in questions], pool_size)
+            with self._reference_lock:
+                for question, retrieval in zip(questions, retrieved):
+                    self._question_references.setdefault(
+                        (question, pool_size),
+                        self._question_entry(retrieval["documents"], self._tier_summary(retrieval))
+                    )
+            return len(questions)
+        
+        # Query sama persis dengan yang dibentuk _references_for untuk setiap evaluasi
+        queries: Dict[str, None] = {}
+        for question, answers, question_type in groups:
+            pending = self._pending_answers(question, answers, question_type)
+            if len(pending) > 1 and max_slots > 1:
+                queries[self._answer_query(question, " ".join(pending))] = None
+            else:
+                for answer in pending:
+                    queries[self._answer_query(question, answer)] = None
+        with self._reference_lock:
+            queries_to_fetch = [query for query in queries if (query, top_k) not in self._prefetched_documents]
+        if not queries_to_fetch:
+            return 0
+        retrieved = self._prefetch_tiered(queries_to_fetch, top_k)
+        with self._reference_lock:
+            for query, retrieval in zip(queries_to_fetch, retrieved):
+                self._prefetched_documents[(query, top_k)] = retrieval
+        return len(queries_to_fetch)
+    
+    def _pending_answers(self, question: str, answers: List[str], question_type: Optional[str]) -> List[str]:
+        """Jawaban yang tidak selesai lewat jalur cepat sehingga membutuhkan referensi"""
+        scoring_config = self._get_scoring_config(question_type)
+        return [answer for answer in answers if self._fast_path_result(question, answer, scoring_config) is None]
+    
+    def evaluate_answers(
+        self,
+        question: str,
+        student_answers: List[str],
         top_k: int = 5,
-        question_type: Optional[str] = None
-    ) -> Dict[str, Any]:
+        question_type: Optional[str] = None,
+        max_slots: int = MULTI_ANSWER_MAX_SLOTS
+    ) -> List[Dict[str, Any]]:
         """
-        Mengevaluasi jawaban siswa
+        Mengevaluasi beberapa jawaban untuk pertanyaan yang sama dengan satu pemanggilan LLM
+        per kelompok. Rubrik dan referensi hanya ditulis sekali per prompt; jawaban diberi
+        slot bernomor. Jumlah slot per prompt dibatasi max_slots dan jendela konteks.
+        Slot yang skornya tidak dapat diparse dievaluasi ulang sendiri lewat evaluate_answer.
         
         Args:
             question: Pertanyaan yang diberikan
-            student_answer: Jawaban siswa
+            student_answers: Daftar jawaban siswa
             top_k: Jumlah dokumen referensi yang akan diambil
             question_type: Jenis soal untuk menentukan rubrik penilaian
+            max_slots: Jumlah maksimum jawaban per prompt
             
         Returns:
-            Hasil evaluasi
+            List hasil evaluasi dengan urutan yang sama dengan student_answers
         """
         scoring_config = self._get_scoring_config(question_type)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(student_answers)
+        
+        pending = []
+        for position, student_answer in enumerate(student_answers):
+            self._local.generation_config = None
+            self._local.retrieval_tier = None
+            start_time = time.perf_counter()
+            fast_result = self._fast_path_result(question, student_answer, scoring_config)
+            if fast_result is not None:
+                fast_result["timings"] = format_stage_timings({}, (time.perf_counter() - start_time) * 1000.0)
+                results[position] = self._finalize_result(fast_result, question, student_answer, top_k, question_type)
+            else:
+                pending.append(position)
+        
+        if len(pending) <= 1 or max_slots <= 1:
+            for position in pending:
+                results[position] = self.evaluate_answer(question, student_answers[position], top_k=top_k,
+                                                         question_type=question_type)
+            return results
+        
+        # Referensi dipakai bersama oleh semua slot; query memuat seluruh jawaban
+        shared_start = time.perf_counter()
+        with collect_stage_timings() as shared_timings:
+            reference_texts = self._references_for(
+                question, " ".join(student_answers[position] for position in pending), top_k
+            )
+            prompt_build_start = time.perf_counter()
+            _, reference_texts, _ = self.budgeter.fit_references(
+                lambda references: self.create_multi_evaluation_prompt(
+                    question, [student_answers[pending[0]]], references, scoring_config=scoring_config
+                ),
+                reference_texts,
+                max_tokens=MULTI_ANSWER_SLOT_TOKENS
+            )
+            record_stage_timing("prompt_build_ms", (time.perf_counter() - prompt_build_start) * 1000.0)
+        shared_ms = (time.perf_counter() - shared_start) * 1000.0
+        # Evaluasi ulang slot yang gagal diparse menimpa _local.retrieval_tier; simpan jenjang referensi bersama
+        shared_tier = self._local.retrieval_tier
+        
+        while pending:
+            group_start = time.perf_counter()
+            # Setiap slot mendapat waktu kelompoknya (termasuk retrieval bersama), bukan porsi per jawaban
+            with collect_stage_timings() as group_timings:
+                prompt_build_start = time.perf_counter()
+                group_size = self.budgeter.max_slots(
+                    lambda k: self.create_multi_evaluation_prompt(
+                        question, [student_answers[position] for position in pending[:k]], reference_texts,
+                        scoring_config=scoring_config
+                    ),
+                    min(max_slots, len(pending)),
+                    MULTI_ANSWER_SLOT_TOKENS
+                )
+                record_stage_timing("prompt_build_ms", (time.perf_counter() - prompt_build_start) * 1000.0)
+                group, pending = pending[:group_size], pending[group_size:]
+                group_results = self._evaluate_group(
+                    question, [student_answers[position] for position in group], reference_texts, scoring_config
+                )
+            for name, value in shared_timings.items():
+                group_timings[name] = group_timings.get(name, 0) + value
+            timings = format_stage_timings(group_timings, shared_ms + (time.perf_counter() - group_start) * 1000.0)
+            for position, group_result in zip(group, group_results):
+                if group_result is None:
+                    # Slot gagal diparse: nilai ulang jawaban ini sendiri
+                    logger.warning(f"Slot multi-jawaban tidak dapat diparse, evaluasi ulang jawaban ke-{position + 1} sendiri")
+                    group_result = self.evaluate_answer(question, student_answers[position], top_k=top_k,
+                                                        question_type=question_type)
+                else:
+                    group_result["timings"] = dict(timings)
+                    group_result["retrieval_tier"] = shared_tier
+                    group_result = self._finalize_result(group_result, question, student_answers[position],
+                                                         top_k, question_type)
+                results[position] = group_result
+        return results
+    
+    def _evaluate_group(self, question: str, student_answers: List[str], reference_texts: List[str],
+                        scoring_config: Dict[str, Any]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Satu pemanggilan LLM untuk sekelompok jawaban
+        
+        Returns:
+            List hasil per slot; None untuk slot yang tidak dapat diparse
+        """
+        allowed_scores = scoring_config["allowed_scores"]
+        prompt_build_start = time.perf_counter()
+        prompt = self.create_multi_evaluation_prompt(question, student_answers, reference_texts,
+                                                     scoring_config=scoring_config)
+        record_stage_timing("prompt_build_ms", (time.perf_counter() - prompt_build_start) * 1000.0)
+        record_stage_timing("prompt_tokens", self.budgeter.count(prompt))
+        self._local.generation_config = None
+        output = self._generate(
+            prompt,
+            max_tokens=MULTI_ANSWER_SLOT_TOKENS * len(student_answers),
+            temperature=0.3,
+            prompt_prefix=self.create_evaluation_prompt_prefix(scoring_config),
+            early_stop=False
+        )
+        generation_config = dict(self._local.generation_config or self._generation_config())
+        generation_config["multi_answer_slots"] = len(student_answers)
+        
+        parse_start = time.perf_counter()
+        parsed: Dict[int, Tuple[int, str]] = {}
+        for match in re.finditer(
+            r'^\s*\[?(\d+)[\]\.\)]\s*Skor[:\s]*\(?(\d+)\)?\s*[|;,]?\s*(?:Kata kunci(?: penting)?\s*:)?\s*([^\n]*)',
+            output or "",
+            flags=re.MULTILINE | re.IGNORECASE
+        ):
+            slot, score = int(match.group(1)), int(match.group(2))
+            if 1 <= slot <= len(student_answers) and slot not in parsed and score in allowed_scores:
+                parsed[slot] = (score, match.group(3).strip() or "-")
+        
+        results: List[Optional[Dict[str, Any]]] = []
+        for slot in range(1, len(student_answers) + 1):
+            if slot not in parsed:
+                results.append(None)
+                continue
+            score, keywords = parsed[slot]
+            results.append({
+                "score": score,
+                "evaluation": f"1. Skor: {score}\n2. Kata kunci penting: {keywords}",
+                "references": reference_texts,
+                "max_score": scoring_config["max_score"],
+                "allowed_scores": allowed_scores,
+                "question_type": scoring_config["type"],
+                "scoring_path": "llm_multi",
+                "generation_config": generation_config
+            })
+        record_stage_timing("parse_ms", (time.perf_counter() - parse_start) * 1000.0)
+        if len(parsed) < len(student_answers):
+            record_stage_timing("retries", len(student_answers) - len(parsed))
+        logger.info(f"Multi-jawaban: {len(parsed)}/{len(student_answers)} slot terparse")
+        return results
+    
+    def _fast_path_result(self, question: str, student_answer: str,
+                          scoring_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Hasil evaluasi tanpa retrieval dan LLM (jawaban panjang kosong atau cocok dengan kunci jawaban)
+        
+        Returns:
+            Hasil evaluasi, atau None jika jawaban harus dinilai LLM
+        """
         allowed_scores = scoring_config["allowed_scores"]
         max_score = scoring_config["max_score"]
         
@@ -1397,26 +5601,111 @@ Beri skor jawaban siswa mengikuti rubrik di atas.
                 "references": [],
                 "max_score": max_score,
                 "allowed_scores": allowed_scores,
-                "question_type": scoring_config["type"]
+                "question_type": scoring_config["type"],
+                "scoring_path": "blank_answer"
             }
         
-        # Gabungkan pertanyaan (dengan bobot lebih) dan jawaban untuk retrieval
-        # Biarkan LLM yang mengidentifikasi kata kunci penting
-        query = f"{question} {question} {student_answer}"
+        # Jalur cepat: jawaban singkat yang cocok dengan kunci jawaban tidak perlu retrieval/LLM
+        if self.key_index is not None and scoring_config["type"] == "singkat":
+            key_match = self.key_index.lookup(question, student_answer)
+            if key_match:
+                logger.info(
+                    f"Jawaban cocok dengan kunci '{key_match['key_answer']}' "
+                    f"({key_match['match']}, {key_match['similarity']:.2f}); LLM dilewati"
+                )
+                return {
+                    "score": max_score,
+                    "evaluation": f"1. Skor: {max_score}\n2. Kata kunci penting: {key_match['key_answer']}",
+                    "references": [],
+                    "max_score": max_score,
+                    "allowed_scores": allowed_scores,
+                    "question_type": scoring_config["type"],
+                    "scoring_path": "key_answer",
+                    "key_match": key_match
+                }
+        return None
+    
+    def _answer_steps(self, question: str, student_answer: str, top_k: int, question_type: Optional[str]):
+        """Inti evaluasi sebagai generator langkah: retrieval, prompt, pemanggilan LLM, dan parsing skor"""
+        # Versi async menjalankan retrieval dan penyusunan prompt di executor
+        plan = yield step_call(self, "_prepare_evaluation", question, student_answer, top_k, question_type)
+        if "result" in plan:
+            return plan["result"]
+        # _local yang diisi di executor tidak terbawa kembali ke task async
+        self._local.retrieval_tier = plan["retrieval_tier"]
+        
+        # Dengan grammar, output dijamin berformat valid sehingga cukup satu kali parse
+        if plan["grammar"]:
+            constrained_output = yield from self._generation_steps(
+                plan["prompt"], grammar_max_tokens(self.max_keywords), 0.3, plan["prompt_prefix"],
+                plan["grammar"], plan["scoring_config"], None
+            )
+            result = self._constrained_result(plan, constrained_output)
+            if result is not None:
+                return result
+        
+        # Dapatkan hasil evaluasi dari model
+        evaluation_result = self._normalize_evaluation_output((yield from self._generation_steps(
+            plan["prompt"], 512, 0.3, plan["prompt_prefix"], None, plan["scoring_config"], None
+        )))
+        
+        # Jika evaluasi kosong, coba lagi dengan parameter berbeda
+        if not evaluation_result:
+            logger.warning("Evaluasi kosong, mencoba lagi dengan parameter berbeda")
+            record_stage_timing("retries", 1)
+            # Coba lagi dengan temperature lebih tinggi untuk mendorong kreativitas
+            evaluation_result = self._normalize_evaluation_output((yield from self._generation_steps(
+                plan["prompt"], 1024, 0.7, plan["prompt_prefix"], None, None, None
+            )))
         
-        # Ambil referensi yang relevan dengan skor minimum
-        retrieved_docs = self.retriever.retrieve(query, top_k=top_k, min_score=1.0)
+        return self._score_evaluation_output(plan, evaluation_result, student_answer)
+    
+    async def aevaluate_answer(
+        self,
+        question: str,
+        student_answer: str,
+        top_k: int = 5,
+        question_type: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Versi asyncio dari evaluate_answer dengan hasil yang sama. Retrieval dan penyusunan prompt
+        dijalankan di executor, sedangkan generasi ditunggu lewat backend async (agenerate) sehingga
+        banyak evaluasi dapat berjalan bersamaan di satu event loop tanpa satu thread per request.
         
-        # Jika tidak cukup referensi yang ditemukan, coba lagi dengan skor minimum yang lebih rendah
-        if len(retrieved_docs) < max(3, top_k):
-            logger.warning(f"Hanya menemukan {len(retrieved_docs)} referensi dengan skor minimum 1.0, mencoba lagi dengan skor minimum 0.5")
-            retrieved_docs = self.retriever.retrieve(query, top_k=top_k, min_score=0.5)
+        Args:
+            question: Pertanyaan yang diberikan
+            student_answer: Jawaban siswa
+            top_k: Jumlah dokumen referensi yang akan diambil
+            question_type: Jenis soal untuk menentukan rubrik penilaian
             
-        reference_texts = [doc["chunk"] for doc in retrieved_docs]
+        Returns:
+            Hasil evaluasi (lihat evaluate_answer)
+        """
+        return await arun_steps(self._evaluation_steps(question, student_answer, top_k, question_type))
+    
+    def _prepare_evaluation(
+        self,
+        question: str,
+        student_answer: str,
+        top_k: int = 5,
+        question_type: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Tahap sebelum pemanggilan LLM: jalur cepat, retrieval, dan penyusunan prompt
         
-        if not reference_texts:
-            logger.warning("Tidak ada referensi yang ditemukan untuk evaluasi")
-            reference_texts = ["Tidak ada referensi yang ditemukan."]
+        Returns:
+            {"result": ...} jika jawaban sudah dinilai tanpa LLM, atau rencana evaluasi berisi
+            scoring_config, reference_texts, retrieval_tier, prompt, prompt_prefix, dan grammar
+        """
+        scoring_config = self._get_scoring_config(question_type)
+        allowed_scores = scoring_config["allowed_scores"]
+        max_score = scoring_config["max_score"]
+        
+        fast_result = self._fast_path_result(question, student_answer, scoring_config)
+        if fast_result is not None:
+            return {"result": fast_result}
+        
+        reference_texts = self._references_for(question, student_answer, top_k)
 
         # Validasi kesesuaian jawaban dengan referensi
         similarity_score = self._calculate_answer_similarity(student_answer, reference_texts)
@@ -1431,45 +5720,95 @@ Beri skor jawaban siswa mengikuti rubrik di atas.
                 f"berikan nilai {max_score}."
             )
         
-        # Buat prompt evaluasi
-        prompt = self.create_evaluation_prompt(
-            question,
-            student_answer,
+        # Buat prompt evaluasi; referensi peringkat terendah dipangkas jika prompt + output melebihi konteks
+        prompt_build_start = time.perf_counter()
+        prompt, reference_texts, prompt_tokens = self.budgeter.fit_references(
+            lambda references: self.create_evaluation_prompt(
+                question,
+                student_answer,
+                references,
+                scoring_config=scoring_config,
+                reference_hint=reference_hint
+            ),
             reference_texts,
-            scoring_config=scoring_config,
-            reference_hint=reference_hint
+            max_tokens=512
+        )
+        logger.info(
+            f"Prompt evaluasi {prompt_tokens} token "
+            f"(konteks minimum {self.budgeter.select_context_size(prompt_tokens, 512)})"
         )
         
-        # Dapatkan hasil evaluasi dari model
-        evaluation_result = self.llm.generate(prompt, max_tokens=512, temperature=0.3)
+        # Bagian awal prompt sama untuk semua jawaban bertipe sama; backend bisa memakai ulang KV-cache-nya
+        prompt_prefix = self.create_evaluation_prompt_prefix(scoring_config)
+        record_stage_timing("prompt_build_ms", (time.perf_counter() - prompt_build_start) * 1000.0)
+        record_stage_timing("prompt_tokens", prompt_tokens)
         
-        # Parse hasil evaluasi
+        grammar = None
+        if self.use_grammar and getattr(self.llm, "supports_grammar", False):
+            grammar = build_evaluation_grammar(allowed_scores, max_keywords=self.max_keywords)
+        return {
+            "scoring_config": scoring_config,
+            "reference_texts": reference_texts,
+            "retrieval_tier": getattr(self._local, "retrieval_tier", None),
+            "prompt": prompt,
+            "prompt_prefix": prompt_prefix,
+            "grammar": grammar
+        }
+    
+    def _constrained_result(self, plan: Dict[str, Any], constrained_output: str) -> Optional[Dict[str, Any]]:
+        """Hasil evaluasi dari output ber-grammar, atau None jika harus kembali ke parsing biasa"""
+        scoring_config = plan["scoring_config"]
+        parse_start = time.perf_counter()
+        parsed = self._parse_constrained_output(constrained_output, scoring_config)
+        record_stage_timing("parse_ms", (time.perf_counter() - parse_start) * 1000.0)
+        if parsed is None:
+            logger.warning("Output ber-grammar tidak dapat diparse, kembali ke parsing biasa")
+            record_stage_timing("retries", 1)
+            return None
+        score, formatted_evaluation = parsed
+        logger.info(f"Skor terdeteksi (grammar): {score}")
+        return {
+            "score": score,
+            "evaluation": formatted_evaluation,
+            "references": plan["reference_texts"],
+            "max_score": scoring_config["max_score"],
+            "allowed_scores": scoring_config["allowed_scores"],
+            "question_type": scoring_config["type"]
+        }
+    
+    def _normalize_evaluation_output(self, evaluation_result: str) -> str:
+        """Bersihkan output evaluasi dan paksa ke format dua baris"""
+        parse_start = time.perf_counter()
         try:
-            # Bersihkan output evaluasi terlebih dahulu
             evaluation_result = self._clean_evaluation_output(evaluation_result)
-            evaluation_result = self._force_format(evaluation_result)
-            
-            # Jika evaluasi kosong, coba lagi dengan parameter berbeda
-            if not evaluation_result:
-                logger.warning("Evaluasi kosong, mencoba lagi dengan parameter berbeda")
-                # Coba lagi dengan temperature lebih tinggi untuk mendorong kreativitas
-                evaluation_result = self.llm.generate(prompt, max_tokens=1024, temperature=0.7)
-                evaluation_result = self._clean_evaluation_output(evaluation_result)
-                evaluation_result = self._force_format(evaluation_result)
-                
-                # Jika masih kosong, log error tapi jangan gunakan default
-                if not evaluation_result:
-                    logger.error("LLM tidak menghasilkan evaluasi yang valid setelah mencoba ulang")
-                    # Kembalikan evaluasi kosong dengan skor 0, biarkan sistem menangani kasus ini
-                    return {
-                        "score": 0,
-                        "evaluation": "LLM tidak menghasilkan evaluasi yang valid.",
-                        "references": reference_texts
-                    }
-            
+            return self._force_format(evaluation_result)
+        except Exception as e:
+            logger.error(f"Error saat membersihkan hasil evaluasi: {e}")
+            return (evaluation_result or "").strip()
+        finally:
+            record_stage_timing("parse_ms", (time.perf_counter() - parse_start) * 1000.0)
+    
+    def _score_evaluation_output(self, plan: Dict[str, Any], evaluation_result: str,
+                                 student_answer: str) -> Dict[str, Any]:
+        """Ekstrak skor dari output evaluasi yang sudah dinormalisasi"""
+        scoring_config = plan["scoring_config"]
+        reference_texts = plan["reference_texts"]
+        allowed_scores = scoring_config["allowed_scores"]
+        max_score = scoring_config["max_score"]
+        
+        # Jika masih kosong setelah percobaan ulang, log error tapi jangan gunakan default
+        if not evaluation_result:
+            logger.error("LLM tidak menghasilkan evaluasi yang valid setelah mencoba ulang")
+            # Kembalikan evaluasi kosong dengan skor 0, biarkan sistem menangani kasus ini
+            return {
+                "score": 0,
+                "evaluation": "LLM tidak menghasilkan evaluasi yang valid.",
+                "references": reference_texts
+            }
+        
+        parse_start = time.perf_counter()
+        try:
             # Coba ekstrak skor dari hasil dengan berbagai pola yang mungkin
-            import re
-            
             # Pola yang mungkin untuk ekstraksi skor
             score_pattern = "|".join(map(str, sorted(set(allowed_scores))))
             patterns = [
@@ -1559,7 +5898,6 @@ Beri skor jawaban siswa mengikuti rubrik di atas.
                 "question_type": scoring_config["type"]
             }
         except Exception as e:
-            logger.error(f"Error saat parsing hasil evaluasi: {e}")
             logger.error(f"Error saat parsing hasil evaluasi: {e}")
             # Jangan gunakan evaluasi default, kembalikan evaluasi asli dengan skor 0
             return {
@@ -1571,6 +5909,8 @@ Beri skor jawaban siswa mengikuti rubrik di atas.
                 "question_type": scoring_config["type"],
                 "error": str(e)
             }
+        finally:
+            record_stage_timing("parse_ms", (time.perf_counter() - parse_start) * 1000.0)
 
 # Fungsi utama
 def load_template_qa(file_path: str) -> Dict[str, Any]:
@@ -1661,112 +6001,297 @@ def load_any_template(file_path: str) -> Dict[str, Any]:
         logger.error(f"Error saat memuat template/dataset: {e}")
         sys.exit(1)
 
-def evaluate_batch(evaluator: AnswerEvaluator, template_data: Dict[str, Any], parallel: bool = False, debug: bool = True) -> Dict[str, Any]:
-    """Evaluasi batch jawaban siswa"""
-    results = []
+def answer_dedup_key(question: str, question_type: Optional[str], answer: str) -> Tuple[str, str, str]:
+    """
+    Kunci deduplikasi jawaban: triple (pertanyaan, tipe soal, jawaban) yang dinormalisasi
+    
+    Normalisasi hanya menyamakan bentuk penulisan (Unicode, huruf besar/kecil, spasi) sehingga
+    jawaban yang dianggap sama pasti menghasilkan prompt evaluasi yang setara.
+    
+    Args:
+        question: Teks pertanyaan
+        question_type: Tipe soal (boleh None)
+        answer: Jawaban siswa
+        
+    Returns:
+        Tuple kunci yang bisa dipakai sebagai key dict
+    """
+    def _normalize(text: Optional[str]) -> str:
+        text = unicodedata.normalize("NFKC", str(text or ""))
+        return " ".join(text.casefold().split())
+    
+    return (_normalize(question), _normalize(question_type), _normalize(answer))
+
+def dedup_summary(total: int, unique: int) -> Dict[str, Any]:
+    """
+    Ringkasan deduplikasi untuk laporan run
+    
+    Args:
+        total: Jumlah baris jawaban
+        unique: Jumlah triple unik yang benar-benar dievaluasi
+        
+    Returns:
+        Dict berisi total, unique, duplicates, dan dedup_ratio (porsi baris yang tidak perlu dievaluasi)
+    """
+    duplicates = max(0, total - unique)
+    return {
+        "total": total,
+        "unique": unique,
+        "duplicates": duplicates,
+        "dedup_ratio": (duplicates / total) if total else 0.0
+    }
+
+def group_answer_tasks(unique_tasks: Dict[Tuple[str, str, str], Any], multi_answer: int = 1) -> List[List[Tuple[str, str, str]]]:
+    """
+    Kelompokkan kunci tugas evaluasi unik per (pertanyaan, tipe soal) untuk mode multi-jawaban
+    
+    Args:
+        unique_tasks: Dict dengan kunci dari answer_dedup_key
+        multi_answer: Jumlah maksimum jawaban per kelompok (1 = satu jawaban per prompt)
+        
+    Returns:
+        List kelompok kunci; setiap kelompok dievaluasi dengan satu prompt
+    """
+    if multi_answer <= 1:
+        return [[key] for key in unique_tasks]
+    by_question: Dict[Tuple[str, str], List[Tuple[str, str, str]]] = {}
+    for key in unique_tasks:
+        by_question.setdefault(key[:2], []).append(key)
+    return [
+        keys[start:start + multi_answer]
+        for keys in by_question.values()
+        for start in range(0, len(keys), multi_answer)
+    ]
+
+def iter_bounded(func: Callable, items, max_in_flight: int = BATCH_MAX_IN_FLIGHT, parallel: bool = True):
+    """
+    Jalankan func untuk setiap item dengan paling banyak max_in_flight item berjalan bersamaan.
+    Item berikutnya baru diambil dari iterator begitu ada yang selesai (backpressure), sehingga
+    jumlah future dan hasil yang tertahan di memori tidak bergantung pada ukuran data.
+    
+    Args:
+        func: Fungsi yang dipanggil dengan satu item
+        items: Iterable item (boleh generator)
+        max_in_flight: Jumlah maksimum item yang sedang diproses
+        parallel: Jika False, item diproses berurutan di thread pemanggil
+        
+    Yields:
+        Tuple (item, hasil, exception) sesuai urutan selesai; hasil None jika exception terjadi
+    """
+    items = iter(items)
+    if not parallel or max_in_flight <= 1:
+        for item in items:
+            yield item, func(item), None
+        return
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        in_flight = {executor.submit(func, item): item for item in itertools.islice(items, max_in_flight)}
+        while in_flight:
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                for next_item in itertools.islice(items, 1):
+                    in_flight[executor.submit(func, next_item)] = next_item
+                error = future.exception()
+                yield item, None if error is not None else future.result(), error
+
+class JsonlResultWriter:
+    """
+    Tulis hasil evaluasi ke file JSONL begitu tersedia (satu objek per baris, di-flush per baris).
+    Dengan ordered=True baris ditulis sesuai urutan indeks: hasil yang selesai lebih dulu ditahan
+    di buffer sampai semua indeks sebelumnya tertulis. Dengan ordered=False baris ditulis sesuai
+    urutan selesai; field row_index tetap menunjukkan posisi aslinya.
+    """
+    
+    def __init__(self, path: str, ordered: bool = True):
+        """
+        Args:
+            path: Path file JSONL output (ditimpa jika sudah ada)
+            ordered: Tulis sesuai urutan indeks (True) atau urutan selesai (False)
+        """
+        self.path = path
+        self.ordered = ordered
+        self.written = 0
+        self._buffer: Dict[int, Optional[Dict[str, Any]]] = {}
+        self._next_index = 0
+        output_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(output_dir, exist_ok=True)
+        self._file = open(path, "w", encoding="utf-8")
+    
+    def write(self, index: int, record: Optional[Dict[str, Any]]):
+        """Catat hasil untuk indeks tertentu; record None berarti baris dilewati (evaluasi gagal)"""
+        if not self.ordered:
+            if record is not None:
+                self._write_line(index, record)
+            return
+        self._buffer[index] = record
+        while self._next_index in self._buffer:
+            buffered = self._buffer.pop(self._next_index)
+            if buffered is not None:
+                self._write_line(self._next_index, buffered)
+            self._next_index += 1
+    
+    def _write_line(self, index: int, record: Dict[str, Any]):
+        self._file.write(json.dumps(dict(row_index=index, **record), ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.written += 1
+    
+    def close(self):
+        """Tulis sisa buffer (jika ada indeks yang tidak pernah dicatat) lalu tutup file"""
+        if self._file is None:
+            return
+        for index in sorted(self._buffer):
+            if self._buffer[index] is not None:
+                self._write_line(index, self._buffer[index])
+        self._buffer.clear()
+        self._file.close()
+        self._file = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def evaluate_batch(evaluator: AnswerEvaluator, template_data: Dict[str, Any], parallel: bool = False, debug: bool = True,
+                   multi_answer: int = 1, max_in_flight: int = BATCH_MAX_IN_FLIGHT, output_jsonl: Optional[str] = None,
+                   ordered: bool = True, keep_results: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Evaluasi batch jawaban siswa; jawaban identik untuk pertanyaan yang sama hanya dievaluasi sekali.
+    Dengan multi_answer > 1, hingga multi_answer jawaban untuk pertanyaan yang sama dinilai dalam satu prompt.
+    
+    Args:
+        evaluator: Evaluator jawaban
+        template_data: Data template (questions dan student_answers)
+        parallel: Evaluasi beberapa kelompok jawaban bersamaan
+        debug: Cetak detail setiap hasil
+        multi_answer: Jumlah maksimum jawaban per prompt
+        max_in_flight: Jumlah maksimum kelompok jawaban yang sedang dievaluasi saat parallel=True
+        output_jsonl: Jika diisi, setiap hasil langsung ditulis ke file JSONL ini begitu selesai
+        ordered: Urutan baris JSONL mengikuti urutan jawaban di template (False = urutan selesai)
+        keep_results: Simpan semua hasil di memori untuk dikembalikan; default True kecuali
+            output_jsonl diisi, sehingga memori tetap datar untuk dataset kelas yang besar
+        
+    Returns:
+        Dict berisi results (kosong jika keep_results False), dedup, dan output_jsonl
+    """
+    if keep_results is None:
+        keep_results = output_jsonl is None
     
     # Buat mapping pertanyaan untuk akses cepat
     questions_map = {q["id"]: q for q in template_data["questions"]}
     
-    # Hitung total jawaban yang akan dievaluasi
-    total_answers = sum(len(student["answers"]) for student in template_data["student_answers"])
+    # Kumpulkan semua baris jawaban dan kelompokkan berdasarkan triple ternormalisasi
+    rows = []
+    unique_tasks: Dict[Tuple[str, str, str], Tuple[str, str, Optional[str]]] = {}
+    rows_by_key: Dict[Tuple[str, str, str], List[int]] = {}
+    for student in template_data["student_answers"]:
+        for answer in student["answers"]:
+            question_id = answer["question_id"]
+            question_text = questions_map[question_id]["question"]
+            student_answer = answer["answer"]
+            question_type = answer.get("question_type")
+            key = answer_dedup_key(question_text, question_type, student_answer)
+            unique_tasks.setdefault(key, (question_text, student_answer, question_type))
+            rows_by_key.setdefault(key, []).append(len(rows))
+            rows.append((student, question_id, question_type))
+    
+    total_answers = len(rows)
+    dedup = dedup_summary(total_answers, len(unique_tasks))
+    
+    print(f"\nAkan mengevaluasi {total_answers} jawaban dari {len(template_data['student_answers'])} siswa "
+          f"({dedup['unique']} jawaban unik, {dedup['duplicates']} duplikat)...")
+    
+    def run_group(keys: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+        question_text, _, question_type = unique_tasks[keys[0]]
+        if len(keys) == 1:
+            return [evaluator.evaluate_answer(question_text, unique_tasks[keys[0]][1], top_k=3,
+                                              question_type=question_type)]
+        return evaluator.evaluate_answers(
+            question_text,
+            [unique_tasks[key][1] for key in keys],
+            top_k=3,
+            question_type=question_type,
+            max_slots=multi_answer
+        )
+    
+    # Hasil per baris hanya disimpan jika diminta; selain itu langsung ditulis lalu dilepas
+    collected: List[Optional[Dict[str, Any]]] = [None] * total_answers if keep_results else []
+    writer = JsonlResultWriter(output_jsonl, ordered=ordered) if output_jsonl else None
     answers_evaluated = 0
+    rows_done = 0
     
-    print(f"\nAkan mengevaluasi {total_answers} jawaban dari {len(template_data['student_answers'])} siswa...")
-    
-    if parallel:
-        # Evaluasi paralel dengan ThreadPoolExecutor
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            # Buat list tugas evaluasi
-            futures = []
-            for student in template_data["student_answers"]:
-                for answer in student["answers"]:
-                    question_id = answer["question_id"]
-                    question_text = questions_map[question_id]["question"]
-                    student_answer = answer["answer"]
-                    question_type = answer.get("question_type")
-                    
-                    future = executor.submit(
-                        evaluator.evaluate_answer,
-                        question_text,
-                        student_answer,
-                        3,  # top_k
-                        question_type=question_type
-                    )
-                    futures.append((student["student_id"], student["name"], question_id, question_type, future))
+    def emit(row_index: int, evaluation: Optional[Dict[str, Any]]):
+        record = None
+        if evaluation is not None:
+            student, question_id, question_type = rows[row_index]
+            max_score = evaluation.get("max_score", 4)
             
-            # Proses hasil evaluasi
-            for student_id, student_name, question_id, question_type, future in futures:
-                try:
-                    evaluation = future.result()
-                    
-                    # Debug info
-                    max_score = evaluation.get("max_score", 4)
-                    if debug:
-                        print(f"\nEvaluasi untuk {student_name}, pertanyaan {question_id}:")
-                        print(f"Skor: {evaluation['score']}/{max_score}")
-                        print(f"Evaluasi: {evaluation['evaluation'][:150]}..." if len(evaluation['evaluation']) > 150 else evaluation['evaluation'])
-                    
-                    results.append({
-                        "student_id": student_id,
-                        "student_name": student_name,
-                        "question_id": question_id,
-                        "score": evaluation["score"],
-                        "max_score": max_score,
-                        "question_type": evaluation.get("question_type"),
-                        "question_type_source": question_type,
-                        "evaluation": evaluation["evaluation"],
-                        "references": evaluation["references"]
-                    })
-                    answers_evaluated += 1
-                    print(f"Progress: {answers_evaluated}/{total_answers} [{answers_evaluated/total_answers*100:.1f}%]")
-                except Exception as e:
-                    logger.error(f"Error saat evaluasi paralel: {e}")
-    else:
-        # Evaluasi sekuensial
-        for student_idx, student in enumerate(template_data["student_answers"], 1):
-            print(f"\nMengevaluasi jawaban siswa {student_idx}/{len(template_data['student_answers'])}: {student['name']}")
-            
-            for answer_idx, answer in enumerate(student["answers"], 1):
-                question_id = answer["question_id"]
-                question_text = questions_map[question_id]["question"]
-                student_answer = answer["answer"]
-                question_type = answer.get("question_type")
-                
-                print(f"  Mengevaluasi pertanyaan {answer_idx}/{len(student['answers'])}...")
-                start_time = time.time()
-                
-                evaluation = evaluator.evaluate_answer(
-                    question_text,
-                    student_answer,
-                    top_k=3,
-                    question_type=question_type
-                )
-                max_score = evaluation.get("max_score", 4)
-                
-                elapsed_time = time.time() - start_time
-                print(f"  Selesai! Skor: {evaluation['score']}/{max_score} (waktu: {elapsed_time:.2f}s)")
-                
-                # Debug info
-                if debug:
-                    print(f"  Evaluasi: {evaluation['evaluation'][:150]}..." if len(evaluation['evaluation']) > 150 else evaluation['evaluation'])
-                
-                results.append({
-                    "student_id": student["student_id"],
-                    "student_name": student["name"],
-                    "question_id": question_id,
-                    "score": evaluation["score"],
-                    "max_score": max_score,
-                    "question_type": evaluation.get("question_type"),
-                    "question_type_source": question_type,
-                    "evaluation": evaluation["evaluation"],
-                    "references": evaluation["references"]
-                })
-                
-                answers_evaluated += 1
+            # Debug info
+            if debug:
+                print(f"\nEvaluasi untuk {student['name']}, pertanyaan {question_id}:")
+                print(f"Skor: {evaluation['score']}/{max_score}")
+                print(f"Evaluasi: {evaluation['evaluation'][:150]}..." if len(evaluation['evaluation']) > 150 else evaluation['evaluation'])
+            
+            record = {
+                "student_id": student["student_id"],
+                "student_name": student["name"],
+                "question_id": question_id,
+                "score": evaluation["score"],
+                "max_score": max_score,
+                "question_type": evaluation.get("question_type"),
+                "question_type_source": question_type,
+                "evaluation": evaluation["evaluation"],
+                "references": evaluation["references"],
+                "timings": evaluation.get("timings")
+            }
+            if keep_results:
+                collected[row_index] = record
+        if writer is not None:
+            writer.write(row_index, record)
     
-    print(f"\nEvaluasi selesai! Total: {answers_evaluated} jawaban dievaluasi.")
-    return {"results": results}
+    def prefetched(task_groups: List[List[Tuple[str, str, str]]]):
+        # Referensi setiap potongan kelompok diambil sekaligus sebelum LLM potongan tersebut dimulai
+        for start in range(0, len(task_groups), REFERENCE_PREFETCH_CHUNK):
+            chunk = task_groups[start:start + REFERENCE_PREFETCH_CHUNK]
+            evaluator.prefetch_references(
+                [(unique_tasks[keys[0]][0], [unique_tasks[key][1] for key in keys], unique_tasks[keys[0]][2])
+                 for keys in chunk],
+                top_k=3,
+                max_slots=multi_answer
+            )
+            yield from chunk
+    
+    try:
+        task_groups = group_answer_tasks(unique_tasks, multi_answer)
+        for keys, group_evaluations, error in iter_bounded(run_group, prefetched(task_groups), max_in_flight,
+                                                           parallel=parallel):
+            if error is not None:
+                logger.error(f"Error saat evaluasi paralel: {error}")
+                group_evaluations = [None] * len(keys)
+            
+            # Sebarkan hasil ke setiap baris yang berbagi triple yang sama; hasil tidak ditahan setelahnya
+            for key, evaluation in zip(keys, group_evaluations):
+                for row_index in rows_by_key.pop(key):
+                    emit(row_index, evaluation)
+                    if evaluation is not None:
+                        rows_done += 1
+            
+            answers_evaluated += len(keys)
+            if error is None:
+                scores = ", ".join(f"{evaluation['score']}/{evaluation.get('max_score', 4)}" for evaluation in group_evaluations)
+                print(f"Progress: {answers_evaluated}/{len(unique_tasks)} [{answers_evaluated/len(unique_tasks)*100:.1f}%] "
+                      f"skor: {scores}")
+    finally:
+        if writer is not None:
+            writer.close()
+    
+    results = [record for record in collected if record is not None]
+    print(f"\nEvaluasi selesai! Total: {rows_done} jawaban dinilai dari {answers_evaluated} evaluasi "
+          f"(rasio dedup {dedup['dedup_ratio'] * 100:.1f}%).")
+    if writer is not None:
+        print(f"Hasil ditulis ke {output_jsonl} ({writer.written} baris)")
+    return {"results": results, "dedup": dedup, "output_jsonl": output_jsonl}
 
 def display_batch_results(results: Dict[str, Any], template_data: Dict[str, Any]):
     """Tampilkan hasil evaluasi batch"""
@@ -1829,12 +6354,66 @@ def main():
     parser.add_argument("--model", type=str, default="models/gemma-3-12b-it-q4_0.gguf", 
                         help="Path ke model LLM")
     parser.add_argument("--llama-path", type=str, help="Path ke binary llama-run.exe")
+    parser.add_argument("--llm-backend", type=str, default="llama-run",
+                        choices=["llama-run", "llama-server", "llama-cpp-python"],
+                        help="Backend LLM: llama-run (satu proses per jawaban), llama-server (persisten), "
+                             "atau llama-cpp-python (in-process)")
+    parser.add_argument("--server-path", type=str, help="Path ke binary llama-server")
+    parser.add_argument("--server-port", type=int, default=8089,
+                        help="Port lokal untuk llama-server (default: 8089)")
+    parser.add_argument("--pool-size", type=int, default=1,
+                        help="Jumlah proses llama-server dalam pool, masing-masing dipatok ke partisi core sendiri; "
+                             "worker ke-i memakai port --server-port + i (default: 1)")
+    parser.add_argument("--cores-per-worker", type=int, default=None,
+                        help="Jumlah core CPU per proses llama-server dalam pool (default: dibagi rata)")
+    parser.add_argument("--n-threads", type=int, default=None,
+                        help="Jumlah thread CPU untuk backend llama-cpp-python (default: otomatis)")
+    parser.add_argument("--n-batch", type=int, default=512,
+                        help="Ukuran batch prefill untuk backend llama-cpp-python (default: 512)")
+    parser.add_argument("--llm-batch-size", type=int, default=1,
+                        help="Jumlah prompt maksimum per batch decoding; >1 mengaktifkan batching scheduler (default: 1)")
+    parser.add_argument("--llm-batch-wait-ms", type=float, default=20.0,
+                        help="Waktu tunggu maksimum (ms) untuk mengumpulkan prompt ke satu batch (default: 20)")
+    parser.add_argument("--response-cache", type=str, default=os.path.join(current_dir, "cache", "llm_responses.sqlite"),
+                        help="Path database SQLite untuk cache respons LLM")
+    parser.add_argument("--response-cache-size", type=int, default=50000,
+                        help="Jumlah entri maksimum cache respons LLM (default: 50000)")
+    parser.add_argument("--no-response-cache", action="store_true",
+                        help="Nonaktifkan cache respons LLM")
+    parser.add_argument("--small-model", type=str, default=None,
+                        help="Path model GGUF kecil untuk cascade: soal singkat dinilai model kecil dulu, "
+                             "model besar hanya untuk soal panjang atau hasil yang ragu "
+                             "(butuh --llm-backend llama-server atau llama-cpp-python)")
+    parser.add_argument("--small-model-port", type=int, default=8189,
+                        help="Port llama-server untuk model kecil (default: 8189)")
+    parser.add_argument("--cascade-min-confidence", type=float, default=0.8,
+                        help="Probabilitas minimum token skor model kecil agar tidak dieskalasi (default: 0.8)")
+    parser.add_argument("--multi-answer", type=int, default=1,
+                        help="Nilai hingga N jawaban untuk pertanyaan yang sama dalam satu prompt (mode --template); "
+                             "jumlah sebenarnya dibatasi jendela konteks (default: 1 = satu jawaban per prompt)")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Mode penilaian deterministik: decoding greedy (temperature 0) dan seed tetap")
+    parser.add_argument("--seed", type=int, default=DETERMINISTIC_SEED,
+                        help=f"Seed untuk mode deterministik (default: {DETERMINISTIC_SEED})")
+    parser.add_argument("--grammar", action="store_true",
+                        help="Batasi output LLM dengan grammar GBNF (tidak didukung backend llama-run)")
+    parser.add_argument("--reference-mode", type=str, default="answer", choices=list(REFERENCE_MODES),
+                        help="answer: retrieval per jawaban; question: referensi diambil sekali per pertanyaan "
+                             "lalu diurutkan ulang per jawaban (default: answer)")
     parser.add_argument("--question", type=str, help="Pertanyaan untuk dievaluasi")
     parser.add_argument("--answer", type=str, help="Jawaban siswa untuk dievaluasi")
     parser.add_argument("--interactive", action="store_true", help="Mode interaktif")
     parser.add_argument("--template", type=str, help="Path ke file template soal dan jawaban")
     parser.add_argument("--output", type=str, help="Path untuk menyimpan hasil evaluasi")
     parser.add_argument("--parallel", action="store_true", help="Evaluasi jawaban secara paralel")
+    parser.add_argument("--max-in-flight", type=int, default=BATCH_MAX_IN_FLIGHT,
+                        help=f"Jumlah maksimum kelompok jawaban yang dievaluasi bersamaan dengan --parallel "
+                             f"(default: {BATCH_MAX_IN_FLIGHT})")
+    parser.add_argument("--output-jsonl", type=str,
+                        help="Tulis setiap hasil ke file JSONL begitu selesai (mode --template); hasil tidak "
+                             "ditahan di memori kecuali --output juga diisi")
+    parser.add_argument("--unordered", action="store_true",
+                        help="Tulis baris JSONL sesuai urutan selesai, bukan urutan jawaban di template")
     parser.add_argument("--n-gpu-layers", type=int, default=999, 
                         help="Jumlah layer yang akan dijalankan di GPU (default: 999)")
     parser.add_argument("--ctx-size", type=int, default=16384, 
@@ -1861,14 +6440,104 @@ def main():
     retriever = BM25Retriever(chunks)
     
     logger.info(f"Memuat model LLM: {model_path}")
-    llm = LlamaModelCpp(
-        model_path=model_path,
-        llama_path=args.llama_path,
-        n_gpu_layers=args.n_gpu_layers,
-        ctx_size=args.ctx_size
-    )
+    seed = args.seed if args.deterministic else None
+    if args.llm_backend == "llama-server" and args.pool_size > 1:
+        llm = create_llm_backend(
+            "llama-server-pool",
+            model_path=model_path,
+            n_workers=args.pool_size,
+            cores_per_worker=args.cores_per_worker,
+            base_port=args.server_port,
+            server_path=args.server_path,
+            n_gpu_layers=args.n_gpu_layers,
+            ctx_size=args.ctx_size,
+            n_parallel=max(1, args.llm_batch_size),
+            slot_save_path=os.path.join(current_dir, "cache", "prompt_prefix"),
+            seed=seed
+        )
+    elif args.llm_backend == "llama-server":
+        llm = create_llm_backend(
+            "llama-server",
+            model_path=model_path,
+            server_path=args.server_path,
+            n_gpu_layers=args.n_gpu_layers,
+            ctx_size=args.ctx_size,
+            port=args.server_port,
+            n_parallel=max(1, args.llm_batch_size),
+            slot_save_path=os.path.join(current_dir, "cache", "prompt_prefix"),
+            seed=seed
+        )
+    elif args.llm_backend == "llama-cpp-python":
+        llm = create_llm_backend(
+            "llama-cpp-python",
+            model_path=model_path,
+            n_gpu_layers=args.n_gpu_layers,
+            ctx_size=args.ctx_size,
+            n_threads=args.n_threads,
+            n_batch=args.n_batch,
+            prefix_cache_dir=os.path.join(current_dir, "cache", "prompt_prefix"),
+            seed=seed
+        )
+    else:
+        llm = create_llm_backend(
+            "llama-run",
+            model_path=model_path,
+            llama_path=args.llama_path,
+            n_gpu_layers=args.n_gpu_layers,
+            ctx_size=args.ctx_size,
+            seed=seed
+        )
+    
+    if args.llm_batch_size > 1 and not llm.supports_concurrent_batch:
+        logger.warning(f"Backend {args.llm_backend} tidak menjalankan batch paralel; --llm-batch-size diabaikan")
+    elif args.llm_batch_size > 1:
+        # Satu batch boleh menjangkau semua slot di semua worker pool
+        batch_size = args.llm_batch_size * getattr(llm, "n_workers", 1)
+        llm = BatchingScheduler(llm, max_batch_size=batch_size, max_wait_ms=args.llm_batch_wait_ms)
+    
+    if not args.no_response_cache:
+        llm = CachedLLMBackend(llm, args.response_cache, max_entries=args.response_cache_size)
+    
+    small_llm = None
+    if args.small_model:
+        small_model_path = os.path.abspath(args.small_model)
+        logger.info(f"Memuat model kecil untuk cascade: {small_model_path}")
+        if args.llm_backend == "llama-server":
+            small_llm = create_llm_backend(
+                "llama-server",
+                model_path=small_model_path,
+                server_path=args.server_path,
+                n_gpu_layers=args.n_gpu_layers,
+                ctx_size=args.ctx_size,
+                port=args.small_model_port,
+                seed=seed
+            )
+        elif args.llm_backend == "llama-cpp-python":
+            small_llm = create_llm_backend(
+                "llama-cpp-python",
+                model_path=small_model_path,
+                n_gpu_layers=args.n_gpu_layers,
+                ctx_size=args.ctx_size,
+                n_threads=args.n_threads,
+                n_batch=args.n_batch,
+                seed=seed,
+                logits_all=True
+            )
+        else:
+            # llama-run tidak menyediakan probabilitas token sehingga keyakinan skor tidak bisa diukur
+            logger.warning("Cascade membutuhkan backend llama-server atau llama-cpp-python, --small-model diabaikan")
+        if small_llm is not None and not args.no_response_cache:
+            small_llm = CachedLLMBackend(small_llm, args.response_cache, max_entries=args.response_cache_size)
     
-    evaluator = AnswerEvaluator(llm, retriever)
+    evaluator = AnswerEvaluator(
+        llm,
+        retriever,
+        use_grammar=args.grammar,
+        deterministic=args.deterministic,
+        small_llm=small_llm,
+        cascade_min_confidence=args.cascade_min_confidence,
+        reference_mode=args.reference_mode
+    )
     
     # Mode template evaluation
     if args.template:
@@ -1877,10 +6546,37 @@ def main():
         template_data = load_any_template(template_path)
         
         print(f"\nMengevaluasi jawaban dari template {template_path}...")
-        results = evaluate_batch(evaluator, template_data, parallel=args.parallel, debug=True)
+        results = evaluate_batch(
+            evaluator,
+            template_data,
+            parallel=args.parallel,
+            debug=True,
+            multi_answer=args.multi_answer,
+            max_in_flight=args.max_in_flight,
+            output_jsonl=os.path.abspath(args.output_jsonl) if args.output_jsonl else None,
+            ordered=not args.unordered,
+            keep_results=not args.output_jsonl or bool(args.output)
+        )
         
-        # Tampilkan hasil
-        display_batch_results(results, template_data)
+        # Tampilkan hasil (jika hanya di-stream ke JSONL, hasil tidak ada di memori)
+        if results["results"]:
+            display_batch_results(results, template_data)
+        
+        dedup = results["dedup"]
+        print(
+            f"\nDedup: {dedup['unique']} jawaban unik dari {dedup['total']} baris "
+            f"(rasio dedup {dedup['dedup_ratio'] * 100:.1f}%)"
+        )
+        
+        if small_llm is not None:
+            routing = evaluator.get_routing_stats()
+            print(
+                f"\nCascade: {routing['small_accepted']}/{routing['routed']} dinilai model kecil "
+                f"({routing['small_share'] * 100:.1f}%), eskalasi: panjang={routing['escalated_long']}, "
+                f"parse={routing['escalated_parse']}, keyakinan={routing['escalated_confidence']}, "
+                f"gagal={routing['escalated_error']}; "
+                f"porsi waktu model besar {routing['large_time_share'] * 100:.1f}%"
+            )
         
         # Simpan hasil jika diminta
         if args.output:
@@ -8,6 +8,7 @@ API untuk Automated Essay Scoring System
 import os
 import sys
 import json
+import re
 import time
 from pathlib import Path
 from typing import List, Dict, Any, Optional
@@ -33,7 +34,7 @@ current_dir = Path(__file__).parent.absolute()
 if str(current_dir) not in sys.path:
     sys.path.append(str(current_dir))
 
-from aes_system import DocumentProcessor, BM25Retriever, LlamaModelCpp, AnswerEvaluator, DenseRetriever, HybridRetriever
+from aes_system import DocumentProcessor, BM25Retriever, LlamaModelCpp, AnswerEvaluator, DenseRetriever, HybridRetriever, BatchingScheduler, CachedLLMBackend, KeyAnswerIndex, create_llm_backend, DETERMINISTIC_SEED, answer_dedup_key, bypass_response_cache
 
 # Inisialisasi Flask app
 app = Flask(__name__)
@@ -200,6 +201,27 @@ def get_scoring_defaults(question_type: Optional[str]) -> Dict[str, Any]:
         "max_score": 4
     }
 
+def parse_key_answers(value: Any) -> List[str]:
+    """Normalisasi input key_answers (list atau string dipisah koma/baris baru) menjadi list string."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = re.split(r"[,\n]", value)
+    return [str(item).strip() for item in value if str(item).strip()]
+
+def build_key_answer_index() -> KeyAnswerIndex:
+    """Bangun indeks kunci jawaban dari semua soal singkat yang memiliki key_answers."""
+    index = KeyAnswerIndex()
+    try:
+        for question in questions_collection.find({"key_answers": {"$exists": True, "$ne": []}}):
+            if normalize_question_type(question.get("question_type")) != "singkat":
+                continue
+            index.set_key_answers(question.get("question_text", ""), question.get("key_answers", []))
+    except Exception as e:
+        logger.error(f"Gagal memuat kunci jawaban dari database: {e}")
+    logger.info(f"Indeks kunci jawaban berisi {len(index)} kunci")
+    return index
+
 def load_question_document(question_id: str) -> Optional[Dict[str, Any]]:
     """Ambil dokumen pertanyaan dari database berdasarkan ID string atau ObjectId."""
     try:
@@ -225,7 +247,8 @@ def serialize_question_response(question: Dict[str, Any], include_answers: bool
         "created_at": question.get("created_at", get_timestamp()),
         "question_type": question_type,
         "max_score": max_score,
-        "allowed_scores": allowed_scores
+        "allowed_scores": allowed_scores,
+        "key_answers": question.get("key_answers", [])
     }
 
     if include_answers:
@@ -257,6 +280,7 @@ def update_question_and_answers(question: Dict[str, Any], data: Dict[str, Any])
     update_fields: Dict[str, Any] = {}
     normalized_type_override = None
     question_text_new = question.get("question_text", "")
+    question_text_old = question_text_new
 
     if "question_text" in data:
         question_text_candidate = str(data["question_text"]).strip()
@@ -265,6 +289,9 @@ def update_question_and_answers(question: Dict[str, Any], data: Dict[str, Any])
         update_fields["question_text"] = question_text_candidate
         question_text_new = question_text_candidate
 
+    if "key_answers" in data:
+        update_fields["key_answers"] = parse_key_answers(data["key_answers"])
+
     if "question_type" in data:
         normalized_type_override = normalize_question_type(data["question_type"])
         scoring_defaults_override = get_scoring_defaults(normalized_type_override)
@@ -284,8 +311,16 @@ def update_question_and_answers(question: Dict[str, Any], data: Dict[str, Any])
     scoring_defaults = get_scoring_defaults(question_type)
     question_text_new = question.get("question_text", question_text_new)
 
+    if aes_evaluator and aes_evaluator.key_index is not None:
+        # Kunci lama dilepas dari teks soal lama, lalu didaftarkan ulang untuk teks terbaru
+        aes_evaluator.key_index.set_key_answers(question_text_old, [])
+        if question_type == "singkat":
+            aes_evaluator.key_index.set_key_answers(question_text_new, question.get("key_answers", []))
+
     answers_cursor = answers_collection.find({"question_id": str(question["_id"])})
     affected_answers = list(answers_cursor)
+    # Jawaban identik untuk soal ini cukup dievaluasi sekali
+    evaluated_by_key: Dict[Any, Dict[str, Any]] = {}
 
     for answer in affected_answers:
         base_update = {
@@ -294,14 +329,28 @@ def update_question_and_answers(question: Dict[str, Any], data: Dict[str, Any])
             "allowed_scores": scoring_defaults["allowed_scores"]
         }
 
+        fingerprint = aes_evaluator.evaluation_fingerprint(
+            question_text_new,
+            answer.get("answer_text", ""),
+            top_k=3,
+            question_type=question_type
+        ) if aes_evaluator else None
+        if fingerprint and answer.get("evaluation_fingerprint") == fingerprint:
+            # Mode deterministik: input evaluasi tidak berubah, hasil lama tetap berlaku
+            continue
+
         if aes_evaluator:
             try:
-                eval_result = aes_evaluator.evaluate_answer(
-                    question_text_new,
-                    answer.get("answer_text", ""),
-                    top_k=3,
-                    question_type=question_type
-                )
+                dedup_key = answer_dedup_key(question_text_new, question_type, answer.get("answer_text", ""))
+                eval_result = evaluated_by_key.get(dedup_key)
+                if eval_result is None:
+                    eval_result = aes_evaluator.evaluate_answer(
+                        question_text_new,
+                        answer.get("answer_text", ""),
+                        top_k=3,
+                        question_type=question_type
+                    )
+                    evaluated_by_key[dedup_key] = eval_result
                 base_update.update({
                     "score": eval_result["score"],
                     "evaluation": eval_result["evaluation"],
@@ -309,7 +358,12 @@ def update_question_and_answers(question: Dict[str, Any], data: Dict[str, Any])
                     "evaluated_at": get_timestamp(),
                     "max_score": eval_result.get("max_score", scoring_defaults["max_score"]),
                     "allowed_scores": eval_result.get("allowed_scores", scoring_defaults["allowed_scores"]),
-                    "question_type": eval_result.get("question_type", question_type)
+                    "question_type": eval_result.get("question_type", question_type),
+                    "generation_config": eval_result.get("generation_config"),
+                    "evaluation_fingerprint": eval_result.get("evaluation_fingerprint"),
+                    "scoring_path": eval_result.get("scoring_path"),
+                    "retrieval_tier": eval_result.get("retrieval_tier"),
+                    "timings": eval_result.get("timings")
                 })
             except Exception as eval_err:
                 logger.error(f"Gagal mengevaluasi ulang jawaban {answer['_id']}: {eval_err}")
@@ -318,6 +372,7 @@ def update_question_and_answers(question: Dict[str, Any], data: Dict[str, Any])
 
     response = serialize_question_response(question, include_answers=False)
     response["answers_updated"] = len(affected_answers)
+    response["answers_evaluated"] = len(evaluated_by_key)
     return response
 
 # Fungsi untuk menginisialisasi data template
@@ -389,17 +444,49 @@ def initialize_template_data():
         logger.error(f"Error saat menginisialisasi data template: {e}")
         return False
 
+# Konfigurasi backend LLM: "llama-run" (satu proses per jawaban),
+# "llama-server" atau "llama-cpp-python" (model dimuat sekali)
+LLM_BACKEND = os.environ.get("AES_LLM_BACKEND", "llama-run")
+LLAMA_SERVER_PORT = int(os.environ.get("AES_LLAMA_SERVER_PORT", "8089"))
+# >1 menjalankan beberapa proses llama-server (port AES_LLAMA_SERVER_PORT + i),
+# masing-masing dipatok ke partisi core sendiri
+LLM_POOL_SIZE = int(os.environ.get("AES_LLM_POOL_SIZE", "1"))
+LLM_CORES_PER_WORKER = int(os.environ["AES_LLM_CORES_PER_WORKER"]) if os.environ.get("AES_LLM_CORES_PER_WORKER") else None
+LLM_N_THREADS = int(os.environ["AES_LLM_N_THREADS"]) if os.environ.get("AES_LLM_N_THREADS") else None
+LLM_N_BATCH = int(os.environ.get("AES_LLM_N_BATCH", "512"))
+# >1 mengumpulkan request evaluasi dari thread Flask ke satu batch decoding
+LLM_MAX_BATCH_SIZE = int(os.environ.get("AES_LLM_MAX_BATCH_SIZE", "1"))
+LLM_MAX_BATCH_WAIT_MS = float(os.environ.get("AES_LLM_MAX_BATCH_WAIT_MS", "20"))
+# Batasi output LLM dengan grammar GBNF (hanya llama-server / llama-cpp-python)
+LLM_USE_GRAMMAR = os.environ.get("AES_LLM_GRAMMAR", "0").lower() in {"1", "true", "yes"}
+# Cache respons LLM di SQLite: evaluasi ulang jawaban yang sama tidak diinferensi ulang
+# Mode penilaian deterministik (greedy + seed tetap): evaluasi ulang dengan input yang sama
+# memakai hasil yang sudah tersimpan
+LLM_DETERMINISTIC = os.environ.get("AES_DETERMINISTIC", "0").lower() in {"1", "true", "yes"}
+LLM_SEED = int(os.environ.get("AES_LLM_SEED", str(DETERMINISTIC_SEED)))
+LLM_RESPONSE_CACHE = os.environ.get("AES_LLM_RESPONSE_CACHE", "1").lower() in {"1", "true", "yes"}
+LLM_RESPONSE_CACHE_SIZE = int(os.environ.get("AES_LLM_RESPONSE_CACHE_SIZE", "50000"))
+# Cascade model: soal singkat dinilai model kecil dulu, model besar hanya untuk soal panjang
+# atau hasil yang ragu (path relatif terhadap direktori models)
+SMALL_MODEL_NAME = os.environ.get("AES_SMALL_MODEL", "")
+SMALL_MODEL_PORT = int(os.environ.get("AES_SMALL_MODEL_PORT", "8189"))
+CASCADE_MIN_CONFIDENCE = float(os.environ.get("AES_CASCADE_MIN_CONFIDENCE", "0.8"))
+# "question": referensi diambil sekali per pertanyaan dan dipakai ulang untuk semua jawaban
+# (diurutkan ulang per jawaban); "answer": retrieval per jawaban
+REFERENCE_MODE = os.environ.get("AES_REFERENCE_MODE", "answer")
+
 # Variabel global untuk menyimpan instance AES
 aes_processor = None
 aes_retriever = None
 aes_sparse_retriever = None  # BM25 retriever untuk compare
 aes_dpr_retriever = None
 aes_model = None
+aes_small_model = None
 aes_evaluator = None
 
 def initialize_aes():
     """Inisialisasi komponen AES"""
-    global aes_processor, aes_retriever, aes_sparse_retriever, aes_dpr_retriever, aes_model, aes_evaluator
+    global aes_processor, aes_retriever, aes_sparse_retriever, aes_dpr_retriever, aes_model, aes_small_model, aes_evaluator
     
     try:
         # Path ke file PDF dan model
@@ -498,18 +585,119 @@ def initialize_aes():
             aes_retriever = aes_sparse_retriever
         
         logger.info(f"Memuat model LLM: {model_path}")
+        llm_seed = LLM_SEED if LLM_DETERMINISTIC else None
         try:
-            aes_model = LlamaModelCpp(
-                model_path=model_path,
-                n_gpu_layers=999,
-                ctx_size=16384
-            )
+            if LLM_BACKEND == "llama-server" and LLM_POOL_SIZE > 1:
+                aes_model = create_llm_backend(
+                    "llama-server-pool",
+                    model_path=model_path,
+                    n_workers=LLM_POOL_SIZE,
+                    cores_per_worker=LLM_CORES_PER_WORKER,
+                    base_port=LLAMA_SERVER_PORT,
+                    n_gpu_layers=999,
+                    ctx_size=16384,
+                    n_parallel=max(1, LLM_MAX_BATCH_SIZE),
+                    slot_save_path=os.path.join(cache_dir, "prompt_prefix"),
+                    seed=llm_seed
+                )
+            elif LLM_BACKEND == "llama-server":
+                aes_model = create_llm_backend(
+                    "llama-server",
+                    model_path=model_path,
+                    n_gpu_layers=999,
+                    ctx_size=16384,
+                    port=LLAMA_SERVER_PORT,
+                    n_parallel=max(1, LLM_MAX_BATCH_SIZE),
+                    slot_save_path=os.path.join(cache_dir, "prompt_prefix"),
+                    seed=llm_seed
+                )
+            elif LLM_BACKEND == "llama-cpp-python":
+                aes_model = create_llm_backend(
+                    "llama-cpp-python",
+                    model_path=model_path,
+                    n_gpu_layers=999,
+                    ctx_size=16384,
+                    n_threads=LLM_N_THREADS,
+                    n_batch=LLM_N_BATCH,
+                    prefix_cache_dir=os.path.join(cache_dir, "prompt_prefix"),
+                    seed=llm_seed
+                )
+            else:
+                aes_model = LlamaModelCpp(
+                    model_path=model_path,
+                    n_gpu_layers=999,
+                    ctx_size=16384,
+                    seed=llm_seed
+                )
+            if LLM_MAX_BATCH_SIZE > 1 and not aes_model.supports_concurrent_batch:
+                logger.warning(f"Backend {LLM_BACKEND} tidak menjalankan batch paralel; AES_LLM_MAX_BATCH_SIZE diabaikan")
+            elif LLM_MAX_BATCH_SIZE > 1:
+                aes_model = BatchingScheduler(
+                    aes_model,
+                    max_batch_size=LLM_MAX_BATCH_SIZE * getattr(aes_model, "n_workers", 1),
+                    max_wait_ms=LLM_MAX_BATCH_WAIT_MS
+                )
+            if LLM_RESPONSE_CACHE:
+                aes_model = CachedLLMBackend(
+                    aes_model,
+                    os.path.join(cache_dir, "llm_responses.sqlite"),
+                    max_entries=LLM_RESPONSE_CACHE_SIZE
+                )
             logger.info("Model LLM berhasil dimuat")
         except Exception as model_err:
             logger.error(f"Error saat memuat model LLM: {model_err}")
             return False
         
-        aes_evaluator = AnswerEvaluator(aes_model, aes_retriever)
+        aes_small_model = None
+        if SMALL_MODEL_NAME:
+            small_model_path = os.path.join(current_dir, "models", SMALL_MODEL_NAME)
+            try:
+                logger.info(f"Memuat model kecil untuk cascade: {small_model_path}")
+                if LLM_BACKEND == "llama-server":
+                    aes_small_model = create_llm_backend(
+                        "llama-server",
+                        model_path=small_model_path,
+                        n_gpu_layers=999,
+                        ctx_size=16384,
+                        port=SMALL_MODEL_PORT,
+                        seed=llm_seed
+                    )
+                elif LLM_BACKEND == "llama-cpp-python":
+                    aes_small_model = create_llm_backend(
+                        "llama-cpp-python",
+                        model_path=small_model_path,
+                        n_gpu_layers=999,
+                        ctx_size=16384,
+                        n_threads=LLM_N_THREADS,
+                        n_batch=LLM_N_BATCH,
+                        seed=llm_seed,
+                        logits_all=True
+                    )
+                else:
+                    # llama-run tidak menyediakan probabilitas token sehingga keyakinan skor tidak bisa diukur
+                    logger.warning("Cascade membutuhkan AES_LLM_BACKEND llama-server atau llama-cpp-python, "
+                                   "AES_SMALL_MODEL diabaikan")
+                if aes_small_model is not None and LLM_RESPONSE_CACHE:
+                    aes_small_model = CachedLLMBackend(
+                        aes_small_model,
+                        os.path.join(cache_dir, "llm_responses.sqlite"),
+                        max_entries=LLM_RESPONSE_CACHE_SIZE
+                    )
+            except Exception as small_err:
+                # Cascade bersifat opsional; tanpa model kecil semua request ke model besar
+                logger.error(f"Gagal memuat model kecil, cascade dinonaktifkan: {small_err}")
+                aes_small_model = None
+        
+        aes_evaluator = AnswerEvaluator(
+            aes_model,
+            aes_retriever,
+            use_grammar=LLM_USE_GRAMMAR,
+            deterministic=LLM_DETERMINISTIC,
+            small_llm=aes_small_model,
+            cascade_min_confidence=CASCADE_MIN_CONFIDENCE,
+            key_index=build_key_answer_index(),
+            reference_mode=REFERENCE_MODE
+        )
         logger.info("AES system berhasil diinisialisasi")
         return True
         
@@ -1157,7 +1345,12 @@ def create_answer():
                         "evaluated_at": get_timestamp(),
                         "question_type": updated_question_type,
                         "max_score": evaluation_result.get("max_score", updated_scoring["max_score"]),
-                        "allowed_scores": evaluation_result.get("allowed_scores", updated_scoring["allowed_scores"])
+                        "allowed_scores": evaluation_result.get("allowed_scores", updated_scoring["allowed_scores"]),
+                        "generation_config": evaluation_result.get("generation_config"),
+                        "evaluation_fingerprint": evaluation_result.get("evaluation_fingerprint"),
+                        "scoring_path": evaluation_result.get("scoring_path"),
+                        "retrieval_tier": evaluation_result.get("retrieval_tier"),
+                        "timings": evaluation_result.get("timings")
                     }}
                 )
                 
@@ -1542,7 +1735,8 @@ def create_question(exam_id):
             "created_at": get_timestamp(),
             "question_type": question_type,
             "max_score": scoring_defaults["max_score"],
-            "allowed_scores": scoring_defaults["allowed_scores"]
+            "allowed_scores": scoring_defaults["allowed_scores"],
+            "key_answers": parse_key_answers(data.get('key_answers'))
         }
         
         # Tambahkan informasi database dan koleksi
@@ -1553,6 +1747,9 @@ def create_question(exam_id):
         result = questions_collection.insert_one(question)
         logger.info(f"Pertanyaan berhasil disimpan dengan ID: {result.inserted_id}")
         
+        if aes_evaluator and aes_evaluator.key_index is not None and question_type == "singkat":
+            aes_evaluator.key_index.set_key_answers(question_text, question["key_answers"])
+        
         # Verifikasi bahwa data berhasil disimpan
         try:
             saved_question = questions_collection.find_one({"_id": result.inserted_id})
@@ -1570,7 +1767,8 @@ def create_question(exam_id):
             "created_at": question["created_at"],
             "question_type": question["question_type"],
             "max_score": question["max_score"],
-            "allowed_scores": question["allowed_scores"]
+            "allowed_scores": question["allowed_scores"],
+            "key_answers": question["key_answers"]
         }), 201
     except Exception as e:
         logger.error(f"Error saat membuat pertanyaan: {e}")
@@ -1667,7 +1865,12 @@ def submit_answer(question_id):
                         "evaluated_at": get_timestamp(),
                         "question_type": updated_question_type,
                         "max_score": evaluation_result.get("max_score", updated_scoring["max_score"]),
-                        "allowed_scores": evaluation_result.get("allowed_scores", updated_scoring["allowed_scores"])
+                        "allowed_scores": evaluation_result.get("allowed_scores", updated_scoring["allowed_scores"]),
+                        "generation_config": evaluation_result.get("generation_config"),
+                        "evaluation_fingerprint": evaluation_result.get("evaluation_fingerprint"),
+                        "scoring_path": evaluation_result.get("scoring_path"),
+                        "retrieval_tier": evaluation_result.get("retrieval_tier"),
+                        "timings": evaluation_result.get("timings")
                     }}
                 )
                 
@@ -1802,12 +2005,45 @@ def evaluate_answer(answer_id):
         )
         scoring_defaults = get_scoring_defaults(question_type_source)
 
-        evaluation_result = aes_evaluator.evaluate_answer(
-            question["question_text"], 
-            answer["answer_text"], 
+        # Mode deterministik: jika input evaluasi sama dengan evaluasi terakhir, kembalikan hasil tersimpan
+        force = request.args.get("force", "false").lower() in {"1", "true", "yes"}
+        fingerprint = aes_evaluator.evaluation_fingerprint(
+            question["question_text"],
+            answer["answer_text"],
             top_k=3,
             question_type=question_type_source
         )
+        if (
+            not force
+            and fingerprint
+            and answer.get("evaluation_fingerprint") == fingerprint
+            and answer.get("score") is not None
+        ):
+            logger.info(f"Jawaban {answer_id} sudah dievaluasi dengan input yang sama, memakai hasil tersimpan")
+            return jsonify({
+                "id": str(answer["_id"]),
+                "question_id": answer["question_id"],
+                "student_name": answer["student_name"],
+                "answer_text": answer["answer_text"],
+                "score": answer.get("score"),
+                "evaluation": answer.get("evaluation"),
+                "references": answer.get("references"),
+                "created_at": answer.get("created_at"),
+                "evaluated_at": answer.get("evaluated_at"),
+                "question_type": answer.get("question_type", question_type_source),
+                "max_score": answer.get("max_score", scoring_defaults["max_score"]),
+                "allowed_scores": answer.get("allowed_scores", scoring_defaults["allowed_scores"]),
+                "cached": True
+            })
+
+        # force=true: jangan pakai respons LLM dari cache, hasil baru menimpa entri cache lama
+        with bypass_response_cache(force):
+            evaluation_result = aes_evaluator.evaluate_answer(
+                question["question_text"], 
+                answer["answer_text"], 
+                top_k=3,
+                question_type=question_type_source
+            )
         
         updated_question_type = evaluation_result.get("question_type", question_type_source)
         updated_scoring = get_scoring_defaults(updated_question_type)
@@ -1822,7 +2058,12 @@ def evaluate_answer(answer_id):
                 "evaluated_at": get_timestamp(),
                 "question_type": updated_question_type,
                 "max_score": evaluation_result.get("max_score", updated_scoring["max_score"]),
-                "allowed_scores": evaluation_result.get("allowed_scores", updated_scoring["allowed_scores"])
+                "allowed_scores": evaluation_result.get("allowed_scores", updated_scoring["allowed_scores"]),
+                "generation_config": evaluation_result.get("generation_config"),
+                "evaluation_fingerprint": evaluation_result.get("evaluation_fingerprint"),
+                "scoring_path": evaluation_result.get("scoring_path"),
+                "retrieval_tier": evaluation_result.get("retrieval_tier"),
+                "timings": evaluation_result.get("timings")
             }}
         )
         
@@ -1879,10 +2120,11 @@ def compare_retrievers(query: str, sparse_retriever, dense_retriever, top_k: int
     overlap = len(bm25_indices & dpr_indices)
     overlap_percentage = (overlap / top_k * 100) if top_k > 0 else 0.0
     
+    # Hasil BM25 berupa RetrievalResults (teks chunk dibaca saat diakses); ubah ke dict biasa untuk JSON
     return {
         "query": query,
-        "bm25_results": bm25_results,
-        "dpr_results": dpr_results,
+        "bm25_results": [dict(result) for result in bm25_results],
+        "dpr_results": [dict(result) for result in dpr_results],
         "bm25_time": bm25_time,
         "dpr_time": dpr_time,
         "overlap": overlap,
@@ -1944,7 +2186,7 @@ def compare_rag_api():
                 logger.info("Mencoba fallback ke BM25 saja...")
                 # Fallback ke BM25 jika perbandingan gagal
                 try:
-                    bm25_results = aes_retriever.retrieve(question, top_k=5, min_score=0.5)
+                    bm25_results = [dict(result) for result in aes_retriever.retrieve(question, top_k=5, min_score=0.5)]
                     logger.info(f"BM25 retrieval berhasil: {len(bm25_results)} hasil")
                     
                     # Dummy hasil untuk DPR dengan pesan error
@@ -1973,7 +2215,7 @@ def compare_rag_api():
             logger.info("DPR retriever tidak tersedia, menggunakan hanya BM25")
             # Jika DPR tidak tersedia, gunakan hanya BM25
             try:
-                bm25_results = aes_retriever.retrieve(question, top_k=5, min_score=0.5)
+                bm25_results = [dict(result) for result in aes_retriever.retrieve(question, top_k=5, min_score=0.5)]
                 logger.info(f"BM25 retrieval berhasil: {len(bm25_results)} hasil")
                 
                 # Dummy hasil untuk DPR
@@ -2008,11 +2250,20 @@ def init_aes():
         logger.info("Mencoba menginisialisasi sistem AES dari API endpoint...")
         
         # Reset variabel global
-        global aes_processor, aes_retriever, aes_dpr_retriever, aes_model, aes_evaluator
+        global aes_processor, aes_retriever, aes_dpr_retriever, aes_model, aes_small_model, aes_evaluator
+        # Hentikan backend lama (misalnya proses llama-server) agar port tidak bentrok
+        for old_model in (aes_model, aes_small_model):
+            if old_model is None:
+                continue
+            try:
+                old_model.close()
+            except Exception as close_err:
+                logger.warning(f"Gagal menutup backend LLM lama: {close_err}")
         aes_processor = None
         aes_retriever = None
         aes_dpr_retriever = None
         aes_model = None
+        aes_small_model = None
         aes_evaluator = None
         
         # Inisialisasi ulang
@@ -2028,6 +2279,7 @@ def init_aes():
                     "retriever": aes_retriever is not None,
                     "dpr_retriever": aes_dpr_retriever is not None,
                     "model": aes_model is not None,
+                    "small_model": aes_small_model is not None,
                     "evaluator": aes_evaluator is not None
                 }
             })
@@ -2042,6 +2294,20 @@ def init_aes():
         logger.error(f"Error saat menginisialisasi AES dari API endpoint: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/aes/routing-stats', methods=['GET'])
+def aes_routing_stats():
+    """Statistik routing cascade model kecil/besar dan cache respons LLM"""
+    if not aes_evaluator:
+        return jsonify({"error": "Sistem AES belum diinisialisasi"}), 500
+    
+    stats = {
+        "cascade_enabled": aes_small_model is not None,
+        "routing": aes_evaluator.get_routing_stats()
+    }
+    if isinstance(aes_model, CachedLLMBackend):
+        stats["response_cache"] = aes_model.get_cache_stats()
+    return jsonify(stats)
+
 # Endpoint untuk mendapatkan daftar siswa sudah didefinisikan di atas
 # Kode di bawah ini dinonaktifkan untuk menghindari duplikasi
 # @app.route('/api/students', methods=['GET'])
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark skor BM25: rank_bm25.BM25Okapi (loop Python per term x dokumen) dibandingkan
+dengan BM25Index (matriks sparse) pada korpus PDF referensi dan korpus sintetis.
+Query dibentuk seperti di AnswerEvaluator: pertanyaan dua kali ditambah jawaban siswa.
+Pemilihan kandidat top-k juga dibandingkan: np.argsort penuh vs np.argpartition.
+"""
+
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import logging
+
+import numpy as np
+
+from aes_system import DocumentProcessor, BM25Index, BM25Retriever
+
+logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("BM25_Benchmark")
+
+PDF_PATH = "BUKU_IPA.pdf"
+DATASET_PATH = "aes_dateset2.csv"
+
+
+def tokenize(text):
+    """Tokenisasi yang sama dengan BM25Retriever._tokenize"""
+    return text.lower().split()
+
+
+def load_dataset_queries(csv_path, limit):
+    """Query evaluasi nyata dari dataset: '<pertanyaan> <pertanyaan> <jawaban>'"""
+    if not os.path.exists(csv_path):
+        return []
+    queries = []
+    with open(csv_path, encoding="latin1", newline="") as f:
+        for row in csv.DictReader(f, delimiter=";"):
+            question = (row.get("pertanyaan") or "").strip()
+            answer = (row.get("jawaban") or "").strip()
+            if question:
+                queries.append(tokenize(f"{question} {question} {answer}"))
+            if len(queries) >= limit:
+                break
+    return queries
+
+
+def synthetic_corpus(n_docs, vocab_size, doc_tokens, seed):
+    """Korpus sintetis dengan distribusi kata Zipf (mirip teks alami), panjang chunk bervariasi"""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f"kata{i}" for i in range(vocab_size)])
+    corpus = []
+    for _ in range(n_docs):
+        length = int(rng.integers(doc_tokens // 2, doc_tokens * 3 // 2))
+        ranks = np.minimum(rng.zipf(1.1, size=length), vocab_size) - 1
+        corpus.append(vocabulary[ranks].tolist())
+    return corpus
+
+
+def synthetic_queries(corpus, n_queries, seed):
+    """Query sintetis: 'pertanyaan' dua kali (kata dari satu chunk) ditambah 'jawaban' (kata dari chunk lain)"""
+    rng = random.Random(seed)
+    queries = []
+    while len(queries) < n_queries:
+        question_doc = corpus[rng.randrange(len(corpus))]
+        answer_doc = corpus[rng.randrange(len(corpus))]
+        if not question_doc or not answer_doc:
+            continue
+        question = [rng.choice(question_doc) for _ in range(12)]
+        answer = [rng.choice(answer_doc) for _ in range(rng.randint(1, 30))]
+        queries.append(question + question + answer)
+    return queries
+
+
+def time_queries(score_fn, queries):
+    """Waktu per query (ms) dan daftar skor"""
+    timings = []
+    all_scores = []
+    for query in queries:
+        start_time = time.perf_counter()
+        all_scores.append(score_fn(query))
+        timings.append((time.perf_counter() - start_time) * 1000.0)
+    return np.array(timings), all_scores
+
+
+def run_benchmark(name, corpus, queries, top_k, reference_queries):
+    """Bangun kedua indeks, ukur waktu skor, dan periksa kesamaan skor serta urutan top-k"""
+    from rank_bm25 import BM25Okapi
+
+    print(f"\n===== {name}: {len(corpus)} chunk, {len(queries)} query "
+          f"(rata-rata {np.mean([len(q) for q in queries]):.1f} token) =====")
+
+    start_time = time.perf_counter()
+    reference = BM25Okapi(corpus)
+    reference_build = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    index = BM25Index(corpus)
+    index_build = time.perf_counter() - start_time
+
+    # rank_bm25 sangat lambat pada korpus besar, jadi hanya sebagian query yang dijalankan di sana
+    compared = queries[:reference_queries]
+    reference_ms, reference_scores = time_queries(reference.get_scores, compared)
+    index_ms, index_scores = time_queries(index.get_scores, queries)
+
+    # Pemilihan kandidat (top_k * 2) dari skor yang sama, seperti BM25Retriever.retrieve
+    argsort_ms, argsort_top = time_queries(lambda scores: np.argsort(scores)[::-1][:top_k * 2], index_scores)
+    partition_ms, partition_top = time_queries(lambda scores: BM25Retriever._ranked_candidates(scores, top_k),
+                                               index_scores)
+    same_selection = sum(
+        np.allclose(scores[expected], scores[actual])
+        for scores, expected, actual in zip(index_scores, argsort_top, partition_top)
+    )
+
+    max_diff = 0.0
+    same_top_k = 0
+    for expected, actual in zip(reference_scores, index_scores):
+        max_diff = max(max_diff, float(np.max(np.abs(expected - actual))) if len(expected) else 0.0)
+        same_top_k += list(np.argsort(expected)[::-1][:top_k]) == list(np.argsort(actual)[::-1][:top_k])
+
+    print(f"Build      : rank_bm25 {reference_build:8.2f} s | BM25Index {index_build:8.2f} s "
+          f"({len(index.vocabulary)} term, {index.term_doc.nnz} entri)")
+    print(f"Query p50  : rank_bm25 {np.percentile(reference_ms, 50):8.2f} ms | "
+          f"BM25Index {np.percentile(index_ms, 50):8.3f} ms")
+    print(f"Query p95  : rank_bm25 {np.percentile(reference_ms, 95):8.2f} ms | "
+          f"BM25Index {np.percentile(index_ms, 95):8.3f} ms")
+    print(f"Speedup    : {np.mean(reference_ms) / max(np.mean(index_ms[:len(compared)]), 1e-9):.1f}x (rata-rata)")
+    print(f"Top-k p50  : argsort   {np.percentile(argsort_ms, 50):8.3f} ms | "
+          f"argpartition {np.percentile(partition_ms, 50):8.3f} ms "
+          f"(skor kandidat sama pada {same_selection}/{len(queries)} query)")
+    print(f"Kesamaan   : selisih skor maksimum {max_diff:.2e}, urutan top-{top_k} sama pada "
+          f"{same_top_k}/{len(compared)} query")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BM25Index vs rank_bm25")
+    parser.add_argument("--pdf", default=PDF_PATH, help="PDF referensi untuk korpus nyata")
+    parser.add_argument("--dataset", default=DATASET_PATH, help="Dataset CSV sumber query nyata")
+    parser.add_argument("--queries", type=int, default=200, help="Jumlah query per korpus")
+    parser.add_argument("--synthetic-docs", type=int, default=100000, help="Jumlah chunk korpus sintetis")
+    parser.add_argument("--synthetic-vocab", type=int, default=50000, help="Ukuran kosakata korpus sintetis")
+    parser.add_argument("--synthetic-doc-tokens", type=int, default=80, help="Rata-rata token per chunk sintetis")
+    parser.add_argument("--reference-queries", type=int, default=20,
+                        help="Jumlah query yang juga dijalankan di rank_bm25 pada korpus sintetis")
+    parser.add_argument("--top-k", type=int, default=10, help="Top-k untuk pemeriksaan urutan")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    try:
+        import rank_bm25  # noqa: F401
+    except ImportError:
+        logger.error("rank_bm25 tidak ditemukan. Menginstal dengan 'pip install rank-bm25'")
+        sys.exit(1)
+
+    if os.path.exists(args.pdf):
+        chunks = DocumentProcessor(args.pdf).chunk_text(chunk_size=500, overlap=50)
+        pdf_corpus = [tokenize(chunk) for chunk in chunks]
+        queries = load_dataset_queries(args.dataset, args.queries) or synthetic_queries(pdf_corpus, args.queries, args.seed)
+        run_benchmark("Korpus PDF", pdf_corpus, queries, args.top_k, reference_queries=len(queries))
+    else:
+        logger.warning(f"PDF {args.pdf} tidak ditemukan, benchmark korpus PDF dilewati")
+
+    corpus = synthetic_corpus(args.synthetic_docs, args.synthetic_vocab, args.synthetic_doc_tokens, args.seed)
+    queries = synthetic_queries(corpus, args.queries, args.seed)
+    run_benchmark("Korpus sintetis", corpus, queries, args.top_k, reference_queries=args.reference_queries)
+
+
+if __name__ == "__main__":
+    main()
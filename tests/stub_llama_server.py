@@ -0,0 +1,75 @@
+"""
+Server tiruan llama-server untuk pengujian LlamaServerModel.
+Hanya melayani /health dan /completion (tanpa model), menghitung koneksi TCP yang dibuka,
+dan bisa dibuat tidak sehat lewat POST /stub/unhealthy.
+
+Bisa dijalankan sebagai proses pengganti binary llama-server:
+    python stub_llama_server.py -m model.gguf --port 8089 ...
+"""
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_OUTPUT = "1. Skor: 2\n2. Kata kunci penting: lambung"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 agar koneksi keep-alive dari klien bisa dipakai ulang
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send(404, {})
+        elif self.server.unhealthy:
+            self._send(503, {"status": "error"})
+        else:
+            self._send(200, {"status": "ok"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        with self.server.lock:
+            self.server.requests.append((self.path, payload))
+        if self.path == "/completion":
+            self._send(200, {"content": " " + STUB_OUTPUT + "\n", "tokens_predicted": 12})
+        elif self.path == "/stub/unhealthy":
+            self.server.unhealthy = True
+            self._send(200, {})
+        else:
+            self._send(404, {})
+
+
+def start_stub_server(host="127.0.0.1", port=0):
+    """Jalankan server tiruan di thread daemon; port 0 = pilih port kosong"""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.requests = []
+    server.unhealthy = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    host = args[args.index("--host") + 1] if "--host" in args else "127.0.0.1"
+    server = start_stub_server(host, int(args[args.index("--port") + 1]))
+    threading.Event().wait()
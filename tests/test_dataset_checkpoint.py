@@ -0,0 +1,140 @@
+"""
+Pengujian checkpoint evaluasi dataset: run yang terputus bisa dilanjutkan, baris terakhir yang
+terpotong dilewati, baris yang isinya berubah dinilai ulang, dan isi file kunci jawaban ikut
+menentukan hash konfigurasi.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+try:
+    import aes_dataset
+except ImportError:
+    aes_dataset = None
+
+MODE = "hybrid"
+FILTER = "all"
+CONFIG = "cfg0"
+
+
+def _result(question, answer, score):
+    return {"pertanyaan": question, "jawaban": answer, "skor": score}
+
+
+@unittest.skipIf(aes_dataset is None, "dependensi aes_dataset (pandas, psutil, ...) tidak terpasang")
+class EvaluationCheckpointTest(unittest.TestCase):
+    """EvaluationCheckpoint dibuka ulang dari file JSONL di direktori sementara"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "checkpoint.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write_rows(self, rows):
+        checkpoint = aes_dataset.EvaluationCheckpoint(self.path)
+        for row_id, result in rows:
+            checkpoint.record(MODE, FILTER, row_id, CONFIG, result)
+        checkpoint.close()
+
+    def test_resume_returns_recorded_rows(self):
+        self._write_rows([(0, _result("q0", "a0", 3)), (1, _result("q1", "a1", 5))])
+
+        checkpoint = aes_dataset.EvaluationCheckpoint(self.path)
+        try:
+            self.assertEqual(checkpoint.get(MODE, FILTER, 0, CONFIG), _result("q0", "a0", 3))
+            self.assertEqual(checkpoint.get(MODE, FILTER, "1", CONFIG), _result("q1", "a1", 5))
+            self.assertIsNone(checkpoint.get(MODE, FILTER, 2, CONFIG))
+            self.assertIsNone(checkpoint.get(MODE, FILTER, 0, "cfg-lain"))
+            self.assertIsNone(checkpoint.get(MODE, "essay", 0, CONFIG))
+        finally:
+            checkpoint.close()
+
+    def test_truncated_last_line_is_skipped(self):
+        self._write_rows([(0, _result("q0", "a0", 3)), (1, _result("q1", "a1", 5))])
+        # Proses mati di tengah penulisan baris ketiga
+        partial = json.dumps({"mode": MODE, "question_type_filter": FILTER, "row_id": "2",
+                              "config_hash": CONFIG, "result": _result("q2", "a2", 4)})
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(partial[:len(partial) // 2])
+
+        checkpoint = aes_dataset.EvaluationCheckpoint(self.path)
+        try:
+            self.assertEqual(len(checkpoint.entries), 2)
+            self.assertIsNone(checkpoint.get(MODE, FILTER, 2, CONFIG))
+            checkpoint.record(MODE, FILTER, 2, CONFIG, _result("q2", "a2", 4))
+        finally:
+            checkpoint.close()
+
+        # Entri baru tidak boleh menyambung ke baris yang terpotong
+        checkpoint = aes_dataset.EvaluationCheckpoint(self.path)
+        try:
+            self.assertEqual(len(checkpoint.entries), 3)
+            self.assertEqual(checkpoint.get(MODE, FILTER, 2, CONFIG), _result("q2", "a2", 4))
+        finally:
+            checkpoint.close()
+
+    def test_changed_row_content_is_rescored(self):
+        self._write_rows([(0, _result("q0", "a0", 3))])
+
+        checkpoint = aes_dataset.EvaluationCheckpoint(self.path)
+        try:
+            self.assertEqual(
+                checkpoint.get_unchanged(MODE, FILTER, 0, CONFIG, "q0", "a0"), _result("q0", "a0", 3)
+            )
+            self.assertIsNone(checkpoint.get_unchanged(MODE, FILTER, 0, CONFIG, "q0", "a0 diedit"))
+            self.assertIsNone(checkpoint.get_unchanged(MODE, FILTER, 0, CONFIG, "q0 diedit", "a0"))
+            self.assertIsNone(checkpoint.get_unchanged(MODE, FILTER, 1, CONFIG, "q1", "a1"))
+        finally:
+            checkpoint.close()
+
+
+@unittest.skipIf(aes_dataset is None, "dependensi aes_dataset (pandas, psutil, ...) tidak terpasang")
+class CheckpointConfigHashTest(unittest.TestCase):
+    """Hash konfigurasi checkpoint mengikuti isi file --key-answers, bukan hanya path-nya"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.key_answers = os.path.join(self.tmp.name, "kunci.csv")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _args(self, key_answers):
+        return argparse.Namespace(
+            llm_backend="llama-server", small_model=None, cascade_min_confidence=0.9,
+            key_answers=key_answers, multi_answer=1, reference_mode="answer",
+            deterministic=True, seed=42, grammar=False
+        )
+
+    def _write_key_answers(self, content):
+        with open(self.key_answers, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def test_same_content_same_hash(self):
+        self._write_key_answers("pertanyaan,kunci_jawaban\nq0,a0\n")
+        first = aes_dataset.checkpoint_config_hash(self._args(self.key_answers))
+        self.assertEqual(first, aes_dataset.checkpoint_config_hash(self._args(self.key_answers)))
+
+    def test_edited_key_answers_change_hash(self):
+        self._write_key_answers("pertanyaan,kunci_jawaban\nq0,a0\n")
+        before = aes_dataset.checkpoint_config_hash(self._args(self.key_answers))
+        self._write_key_answers("pertanyaan,kunci_jawaban\nq0,a0 diedit\n")
+        after = aes_dataset.checkpoint_config_hash(self._args(self.key_answers))
+        self.assertNotEqual(before, after)
+
+    def test_without_key_answers(self):
+        self.assertIsNone(aes_dataset.file_content_hash(None))
+        self.assertIsNone(aes_dataset.file_content_hash(os.path.join(self.tmp.name, "tidak_ada.csv")))
+        aes_dataset.checkpoint_config_hash(self._args(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+Pengujian LlamaServerModel terhadap server tiruan (tests/stub_llama_server.py):
+signature dan output generate(), pemakaian ulang koneksi keep-alive, serta restart
+otomatis saat proses server mati atau health check gagal.
+"""
+import inspect
+import os
+import shutil
+import socket
+import stat
+import sys
+import tempfile
+import unittest
+import http.client
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+sys.path.insert(0, TESTS_DIR)
+
+from aes_system import LlamaModelCpp, LlamaServerModel
+from stub_llama_server import STUB_OUTPUT, start_stub_server
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LlamaServerModelStubTest(unittest.TestCase):
+    """LlamaServerModel yang terhubung ke server tiruan yang sudah berjalan"""
+
+    def setUp(self):
+        self.server = start_stub_server()
+        self.model = LlamaServerModel(
+            model_path="stub.gguf",
+            port=self.server.server_address[1],
+            start_server=False,
+            startup_timeout=5.0
+        )
+
+    def tearDown(self):
+        self.model.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_generate_signature_and_output(self):
+        # Pengganti langsung backend llama-run: signature generate() harus sama
+        self.assertEqual(inspect.signature(LlamaServerModel.generate), inspect.signature(LlamaModelCpp.generate))
+
+        output = self.model.generate("PERTANYAAN: ...", max_tokens=16, temperature=0.0)
+        self.assertEqual(output, STUB_OUTPUT)
+        path, payload = self.server.requests[-1]
+        self.assertEqual(path, "/completion")
+        self.assertEqual(payload["prompt"], "PERTANYAAN: ...")
+        self.assertEqual(payload["n_predict"], 16)
+        self.assertTrue(payload["cache_prompt"])
+
+    def test_keep_alive_connection_is_reused(self):
+        connections_before = self.server.connections
+        for _ in range(5):
+            self.assertEqual(self.model.generate("prompt", max_tokens=8), STUB_OUTPUT)
+        self.assertEqual(self.server.connections - connections_before, 0)
+        self.assertEqual(len([path for path, _ in self.server.requests if path == "/completion"]), 5)
+
+
+@unittest.skipIf(os.name == "nt", "server tiruan dijalankan lewat skrip shebang")
+class LlamaServerModelRestartTest(unittest.TestCase):
+    """LlamaServerModel yang menjalankan server tiruan sebagai proses llama-server"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix="aes-stub-server-")
+        self.server_path = os.path.join(self.temp_dir, "llama-server")
+        with open(self.server_path, "w", encoding="utf-8") as f:
+            f.write(f"#!{sys.executable}\n")
+            f.write(f"import runpy, sys\nsys.path.insert(0, {TESTS_DIR!r})\n")
+            f.write(f"runpy.run_path({os.path.join(TESTS_DIR, 'stub_llama_server.py')!r}, run_name='__main__')\n")
+        os.chmod(self.server_path, os.stat(self.server_path).st_mode | stat.S_IEXEC)
+        self.model = LlamaServerModel(
+            model_path="stub.gguf",
+            server_path=self.server_path,
+            port=_free_port(),
+            startup_timeout=30.0,
+            health_check_interval=0.0
+        )
+
+    def tearDown(self):
+        self.model.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_dead_process_is_restarted(self):
+        first_pid = self.model.process.pid
+        self.model.process.kill()
+        self.model.process.wait()
+
+        self.assertEqual(self.model.generate("prompt", max_tokens=8), STUB_OUTPUT)
+        self.assertNotEqual(self.model.process.pid, first_pid)
+        self.assertIsNone(self.model.process.poll())
+
+    def test_failing_health_check_triggers_restart(self):
+        first_pid = self.model.process.pid
+        connection = http.client.HTTPConnection(self.model.host, self.model.port, timeout=5)
+        connection.request("POST", "/stub/unhealthy", body=b"{}", headers={"Content-Type": "application/json"})
+        self.assertEqual(connection.getresponse().status, 200)
+        connection.close()
+        self.assertFalse(self.model.is_healthy())
+
+        self.assertEqual(self.model.generate("prompt", max_tokens=8), STUB_OUTPUT)
+        self.assertNotEqual(self.model.process.pid, first_pid)
+        self.assertTrue(self.model.is_healthy())
+
+
+if __name__ == "__main__":
+    unittest.main()
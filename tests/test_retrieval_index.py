@@ -0,0 +1,120 @@
+"""
+Pengujian indeks retrieval: skor BM25Index harus sama dengan rank_bm25.BM25Okapi, dan
+NearDuplicateIndex harus menemukan pasangan yang sama dengan perhitungan Jaccard brute force.
+"""
+import os
+import random
+import sys
+import unittest
+
+import numpy as np
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+from rank_bm25 import BM25Okapi
+
+from aes_system import BM25Index, NearDuplicateIndex
+
+VOCABULARY = [f"kata{i}" for i in range(40)]
+
+
+def _random_corpus(rng, n_docs, max_len=30):
+    """Korpus acak dengan term umum (muncul di banyak dokumen) dan dokumen kosong"""
+    corpus = []
+    for _ in range(n_docs):
+        length = rng.randint(0, max_len)
+        # Distribusi miring: beberapa term muncul di lebih dari separuh dokumen (idf negatif)
+        corpus.append([VOCABULARY[min(int(rng.expovariate(0.15)), len(VOCABULARY) - 1)] for _ in range(length)])
+    corpus[0] = []
+    return corpus
+
+
+class BM25IndexTest(unittest.TestCase):
+    """BM25Index dibandingkan dengan BM25Okapi pada korpus dan query acak"""
+
+    def setUp(self):
+        self.rng = random.Random(7)
+        self.corpus = _random_corpus(self.rng, 120)
+        self.index = BM25Index(self.corpus)
+        self.reference = BM25Okapi(self.corpus)
+        self.queries = [
+            [self.rng.choice(VOCABULARY) for _ in range(self.rng.randint(1, 8))]
+            for _ in range(30)
+        ]
+        # Term berulang, term di luar kosakata, dan query kosong
+        self.queries += [["kata0", "kata0", "kata1"], ["tidak_ada", "kata3"], ["tidak_ada"], []]
+
+    def test_get_scores_matches_bm25okapi(self):
+        for query in self.queries:
+            np.testing.assert_allclose(
+                self.index.get_scores(query), self.reference.get_scores(query), rtol=1e-9, atol=1e-12,
+                err_msg=f"query {query}"
+            )
+
+    def test_get_scores_many_matches_get_scores(self):
+        scores = self.index.get_scores_many(self.queries)
+        self.assertEqual(scores.shape, (len(self.queries), len(self.corpus)))
+        for row, query in zip(scores, self.queries):
+            np.testing.assert_allclose(row, self.reference.get_scores(query), rtol=1e-9, atol=1e-12)
+
+    def test_idf_floor_for_common_terms(self):
+        self.assertTrue((self.index.idf > 0).all())
+        for term, term_id in self.index.vocabulary.items():
+            self.assertAlmostEqual(self.index.idf[term_id], self.reference.idf[term], places=12)
+
+
+class NearDuplicateIndexTest(unittest.TestCase):
+    """NearDuplicateIndex dibandingkan dengan Jaccard brute force atas semua pasangan chunk"""
+
+    def _chunks(self, rng):
+        chunks = []
+        for _ in range(60):
+            base = rng.sample(VOCABULARY, rng.randint(1, 15))
+            chunks.append(base)
+            # Variasi kecil dari chunk sebelumnya agar ada pasangan di sekitar ambang
+            if rng.random() < 0.5:
+                variant = list(base)
+                for _ in range(rng.randint(0, 3)):
+                    if variant and rng.random() < 0.5:
+                        variant.pop(rng.randrange(len(variant)))
+                    else:
+                        variant.append(rng.choice(VOCABULARY))
+                chunks.append(variant)
+        chunks.append([])
+        chunks.append(list(chunks[0]) * 2)
+        return chunks
+
+    @staticmethod
+    def _brute_force(chunks, threshold):
+        sets = [set(chunk) for chunk in chunks]
+        expected = []
+        for i, own in enumerate(sets):
+            expected.append(frozenset(
+                j for j, other in enumerate(sets)
+                if j != i and own and other and len(own & other) / len(own | other) > threshold
+            ))
+        return expected
+
+    def test_duplicates_match_brute_force(self):
+        rng = random.Random(11)
+        chunks = self._chunks(rng)
+        chunk_terms = BM25Index(chunks).term_doc.T
+        for threshold in (0.5, 0.7, 0.9):
+            index = NearDuplicateIndex(chunk_terms, threshold=threshold)
+            expected = self._brute_force(chunks, threshold)
+            found = [index.duplicates_of(chunk_id) for chunk_id in range(len(chunks))]
+            self.assertEqual(found, expected, f"threshold {threshold}")
+            self.assertTrue(any(expected), f"tidak ada pasangan duplikat pada threshold {threshold}")
+
+    def test_exact_threshold_is_not_duplicate(self):
+        # Jaccard tepat 0.7 (7/10) tidak melebihi ambang
+        chunks = [VOCABULARY[:7] + ["a", "b", "c"], VOCABULARY[:7]]
+        index = NearDuplicateIndex(BM25Index(chunks).term_doc.T, threshold=0.7)
+        self.assertEqual(index.duplicates_of(0), frozenset())
+        index = NearDuplicateIndex(BM25Index(chunks).term_doc.T, threshold=0.69)
+        self.assertEqual(index.duplicates_of(0), frozenset({1}))
+
+
+if __name__ == "__main__":
+    unittest.main()